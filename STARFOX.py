@@ -5,691 +5,768 @@ from OpenGL.GLU import *
 import numpy as np
 import time
 import sys
-import pywavefront
-import random
+import os
+import gc
+import io
+
+from assets import load_model
+from audio import VoiceManager, start_logging
+from batch import draw_cubes, draw_lines, release_stream_buffers
+import culling
+from coop import COOP_PORT, CoopClient, NetworkConditions, parse_address, start_server
+from culling import Frustum, perspective_matrix, translation_matrix
+from governor import QUALITY_LEVELS, QualityGovernor
+from loader import Asset, AssetLoader, draw_loading_screen
+from profiler import count_draw, draw_overlay, gc_monitor, profiler
+from replay import InputRecorder, InputReplay, TickInput
+from meshes import draw_mesh, get_mesh, register_mesh, release_meshes
+import shader_renderer
+from shader_renderer import model_matrix
+from shared_world import SimulationProcess
+from simulation import Game, autopilot
+from text import TextRenderer
+
+launch_time = time.perf_counter()  # Start of the time-to-first-frame measurement
 
-# Initialize Pygame and OpenGL
-pygame.init()
 display = (800, 600)
-pygame.display.set_mode(display, DOUBLEBUF | OPENGL)
-gluPerspective(45, (display[0] / display[1]), 0.1, 50.0)
-glTranslatef(0.0, 0.0, -10)
-
-# Initialize Pygame mixer for sound effects and music
-try:
-    pygame.mixer.init()
-    print("Pygame mixer initialized successfully.")
-    pygame.mixer.set_num_channels(16)  # Increase the number of channels to 16
-except pygame.error as e:
-    print(f"Failed to initialize Pygame mixer: {e}")
-
-# Load sound effects
-try:
-    shoot_sound = pygame.mixer.Sound('shoot.wav')  # Load shooting sound
-    explosion_sound = pygame.mixer.Sound('explosion.wav')  # Load explosion sound
-    # Set volume (0.0 to 1.0)
-    shoot_sound.set_volume(0.5)
-    explosion_sound.set_volume(0.5)
-    print("Sound effects loaded successfully.")
-except FileNotFoundError:
-    print("Sound files not found! Please add 'shoot.wav' and 'explosion.wav' to the directory.")
-    shoot_sound = None
-    explosion_sound = None
-except pygame.error as e:
-    print(f"Failed to load sound files: {e}")
-    shoot_sound = None
-    explosion_sound = None
-
-# Load background music
-try:
-    pygame.mixer.music.load('background_music.wav')  # Load background music
-    pygame.mixer.music.set_volume(0.3)  # Set music volume
-    pygame.mixer.music.play(-1)  # Play music on loop (-1 for infinite loop)
-    print("Background music loaded and playing.")
-except FileNotFoundError:
-    print("Background music file not found! Please add 'background_music.wav' to the directory.")
-except pygame.error as e:
-    print(f"Failed to load background music: {e}")
-
-# Load enemy model (if you have one, otherwise we'll use a custom design)
-try:
-    enemy_model = pywavefront.Wavefront('mech.obj', collect_faces=True)
-except FileNotFoundError:
-    enemy_model = None
-
-# Player and enemy positions
-player_pos = [0, 0, 0]  # x, y, z (player stays at z=0)
-player_rotation = [0, 0, 0]  # pitch, yaw, roll
-player_velocity = [0, 0, 0]  # For smooth movement
-player_health = 3  # Player starts with 3 health points
-enemies = []  # List of enemy positions [x, y, z]
-enemy_speed = 0.01
-bullets = []  # List to store player bullets
-enemy_bullets = []  # List to store enemy bullets
-explosions = []  # List to store explosion particles
-power_ups = []  # List to store power-ups
-score = 0  # Player score
-
-# Game state
-game_over = False
-game_active = True
-
-# Terrain segments
-terrain_segments = [
-    {'base_z': 0, 'current_z': 0},
-    {'base_z': -20, 'current_z': -20},
-    {'base_z': -40, 'current_z': -40}
-]
-terrain_speed = 0.1
-terrain_features = {segment['base_z']: [] for segment in terrain_segments}
+
+# The custom enemy model stays None until loaded (the sound effects join the voice
+# manager the same way); in headless mode nothing is loaded
+enemy_model = None
+music_loaded = False
+
+# Rendering backend, chosen at startup: 'fixed' (fixed-function GL) or 'shader'
+# (GLSL, VAOs and instancing). core_profile asks for a 3.3 core context, which
+# only the shader backend can draw with.
+renderer_name = 'fixed'
+core_profile = False
+
+# Initialize Pygame and OpenGL
+def init_display(flags=0):
+    pygame.init()
+    if core_profile:
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 3)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, pygame.GL_CONTEXT_PROFILE_CORE)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_FLAGS, pygame.GL_CONTEXT_FORWARD_COMPATIBLE_FLAG)
+    pygame.display.set_mode(display, DOUBLEBUF | OPENGL | flags)
+    init_projection()
+
+# Camera: a fixed perspective looking down -z from camera_distance behind the player
+fov = 45
+near_plane = 0.1
+far_plane = 50.0
+camera_distance = 10
+camera_matrix = (perspective_matrix(fov, display[0] / display[1], near_plane, far_plane) @
+                 translation_matrix(0, 0, -camera_distance))
+view_frustum = Frustum(camera_matrix, eye=(0, 0, camera_distance))
+
+# Cull everything further than distance from the camera (capped at the far plane).
+# Only the culling frustum changes; the projection keeps its far plane.
+def set_draw_distance(distance):
+    global view_frustum
+    view_frustum = Frustum(perspective_matrix(fov, display[0] / display[1], near_plane, min(distance, far_plane)) @
+                           translation_matrix(0, 0, -camera_distance), eye=(0, 0, camera_distance))
+
+# Beyond these distances from the camera, TIE fighters and terrain trees switch to impostor meshes
+enemy_lod_distance = 25
+terrain_lod_distance = 30
+enemy_radius = 1.6  # Bounding sphere of a TIE fighter at scale 1 (wing tips included)
+
+# Set up the camera (and the shader backend, if chosen) on the current GL context
+def init_projection():
+    if renderer_name == 'shader':
+        shader_renderer.enable(camera_matrix, sky_top, sky_bottom)
+        return
+    gluPerspective(fov, (display[0] / display[1]), near_plane, far_plane)
+    glTranslatef(0.0, 0.0, -camera_distance)
+
+# Sound effects play from the voice manager's thread (see audio.py); the game
+# loop and the simulation only post events to it
+voices = VoiceManager()
+
+# Initialize Pygame mixer for sound effects and music (the files load with the other assets)
+def init_audio():
+    try:
+        pygame.mixer.init()
+        print("Pygame mixer initialized successfully.")
+        pygame.mixer.set_num_channels(16)  # Increase the number of channels to 16
+        voices.start()
+    except pygame.error as e:
+        print(f"Failed to initialize Pygame mixer: {e}")
+
+# Asset loaders run on the loader's worker threads; the apply_* functions install
+# the results on the main thread (with None if the file was missing or unreadable)
+def load_sound(path):
+    return pygame.mixer.Sound(path)  # Played at each effect's volume
+
+# Music is streamed by the mixer, so the worker just reads the file into memory
+def read_file(path):
+    with open(path, 'rb') as f:
+        return io.BytesIO(f.read())
+
+# Explosions outrank shots when the channels run out
+def apply_shoot_sound(sound):
+    if sound:
+        voices.add('shoot', sound, voices=4, interval=0.04, priority=1)
+
+def apply_explosion_sound(sound):
+    if sound:
+        voices.add('explosion', sound, voices=6, interval=0.03, priority=2)
+
+def apply_music(data):
+    global music_loaded
+    if data is None:
+        return
+    try:
+        pygame.mixer.music.load(data, 'wav')
+        pygame.mixer.music.set_volume(0.3)  # Set music volume
+        pygame.mixer.music.play(-1)  # Play music on loop (-1 for infinite loop)
+        music_loaded = True
+        print("Background music loaded and playing.")
+    except pygame.error as e:
+        print(f"Failed to load background music: {e}")
+
+# Load enemy model (if you have one, otherwise we'll use a custom design).
+# The OBJ is converted once into the binary asset cache and memory-mapped from then on.
+# Registered with the other meshes, so it is freed with them.
+def apply_enemy_model(model):
+    global enemy_model
+    if model:
+        register_mesh('enemy_model', lambda: model)
+        enemy_model = get_mesh('enemy_model')
+
+# Everything the game loads from disk. Gameplay starts once the sound effects
+# are in; the music and the custom enemy model are swapped in when they arrive.
+def asset_manifest():
+    return [
+        Asset('shoot', 'shoot.wav', load_sound, apply_shoot_sound),
+        Asset('explosion', 'explosion.wav', load_sound, apply_explosion_sound),
+        Asset('music', 'background_music.wav', read_file, apply_music, required=False),
+        Asset('enemy_model', 'mech.obj', load_model, apply_enemy_model, required=False),
+    ]
+
+# Simulation timing: gameplay advances in fixed ticks of 1 / sim_rate seconds whatever the
+# render rate. Speeds and timers are in units of the original 60 FPS frame and scaled by tick length.
+sim_rate = 60  # Simulation ticks per second
+max_catch_up_ticks = 5  # Most ticks run in one rendered frame before falling behind is accepted
+max_fps = 240  # Render frame cap (0 = uncapped)
+
+# The simulation: every gameplay variable lives on this one Game (see simulation.py).
+# With --sim-process the Game runs in another process and this becomes a WorldView
+# of the snapshots it publishes (see shared_world.py), which render() reads the same way.
+game = Game()
+pending_shots = 0  # Fire presses waiting for the next simulation tick
+pending_restart = False  # Restart requested (any key on the game-over screen) for the next tick
+
+# Render quality. The governor moves between the levels in governor.py to hold the
+# frame time; quality names a level to lock to instead ('auto' adapts). Only what
+# is drawn changes, never the simulation, so recordings replay the same at any level.
+quality = 'auto'
+governor = None
+particles_drawn = Game.particles_per_explosion  # Explosion particles drawn out of each explosion's
+
+def apply_quality(level):
+    global particles_drawn
+    particles_drawn = level['particles_drawn']
+    game.terrain.feature_density = level['terrain_density']
+    set_draw_distance(level['draw_distance'])
 
 # Draw a simplified Arwing
 def draw_arwing(pos, rotation, scale=0.5):
+    if shader_renderer.active:
+        shader_renderer.active.draw_mesh(get_mesh('arwing'), model_matrix(pos, rotation, scale))
+        return
     glPushMatrix()
     glTranslatef(pos[0], pos[1], pos[2])
     glRotatef(rotation[0], 1, 0, 0)
     glRotatef(rotation[1], 0, 1, 0)
     glRotatef(rotation[2], 0, 0, 1)
     glScalef(scale, scale, scale)
-
-    glBegin(GL_TRIANGLES)
-    glColor3f(1, 1, 1)
-    glVertex3f(0, 0, 2)
-    glVertex3f(-0.5, 0, 0)
-    glVertex3f(0.5, 0, 0)
-
-    glVertex3f(0, 0.3, 0)
-    glVertex3f(-0.5, 0, 0)
-    glVertex3f(0.5, 0, 0)
-
-    glVertex3f(0, -0.3, 0)
-    glVertex3f(-0.5, 0, 0)
-    glVertex3f(0.5, 0, 0)
-
-    glVertex3f(0, 0.3, 0)
-    glVertex3f(0, -0.3, 0)
-    glVertex3f(-0.5, 0, -1)
-    glVertex3f(0, 0.3, 0)
-    glVertex3f(0, -0.3, 0)
-    glVertex3f(0.5, 0, -1)
-    glEnd()
-
-    glBegin(GL_TRIANGLES)
-    glColor3f(1, 1, 1)
-    glVertex3f(-0.5, 0, 0)
-    glVertex3f(-3, -0.5, 0)
-    glVertex3f(-0.5, 0, -1)
-
-    glVertex3f(0.5, 0, 0)
-    glVertex3f(3, -0.5, 0)
-    glVertex3f(0.5, 0, -1)
-
-    glColor3f(0, 0, 1)
-    glVertex3f(-3, -0.5, 0)
-    glVertex3f(-2, -0.5, 0)
-    glVertex3f(-2, -0.5, -0.5)
-
-    glVertex3f(3, -0.5, 0)
-    glVertex3f(2, -0.5, 0)
-    glVertex3f(2, -0.5, -0.5)
-    glEnd()
-
-    glBegin(GL_QUADS)
-    glColor3f(0, 0, 1)
-    vertices = [
-        (-0.6, 0, -1), (-0.6, 0.1, -1), (-0.4, 0.1, -1), (-0.4, 0, -1),
-        (-0.6, 0, -1.2), (-0.6, 0.1, -1.2), (-0.4, 0.1, -1.2), (-0.4, 0, -1.2),
-        (-0.6, 0, -1), (-0.6, 0.1, -1), (-0.6, 0.1, -1.2), (-0.6, 0, -1.2),
-        (-0.4, 0, -1), (-0.4, 0.1, -1), (-0.4, 0.1, -1.2), (-0.4, 0, -1.2),
-        (-0.6, 0.1, -1), (-0.6, 0.1, -1.2), (-0.4, 0.1, -1.2), (-0.4, 0.1, -1),
-        (-0.6, 0, -1), (-0.6, 0, -1.2), (-0.4, 0, -1.2), (-0.4, 0, -1)
-    ]
-    for i in range(0, len(vertices), 4):
-        for vertex in vertices[i:i+4]:
-            glVertex3fv(vertex)
-
-    vertices = [
-        (0.4, 0, -1), (0.4, 0.1, -1), (0.6, 0.1, -1), (0.6, 0, -1),
-        (0.4, 0, -1.2), (0.4, 0.1, -1.2), (0.6, 0.1, -1.2), (0.6, 0, -1.2),
-        (0.4, 0, -1), (0.4, 0.1, -1), (0.4, 0.1, -1.2), (0.4, 0, -1.2),
-        (0.6, 0, -1), (0.6, 0.1, -1), (0.6, 0.1, -1.2), (0.6, 0, -1.2),
-        (0.4, 0.1, -1), (0.4, 0.1, -1.2), (0.6, 0.1, -1.2), (0.6, 0.1, -1),
-        (0.4, 0, -1), (0.4, 0, -1.2), (0.6, 0, -1.2), (0.6, 0, -1)
-    ]
-    for i in range(0, len(vertices), 4):
-        for vertex in vertices[i:i+4]:
-            glVertex3fv(vertex)
-    glEnd()
-
+    draw_mesh('arwing')
     glPopMatrix()
 
 # Draw a simple cube (used for terrain objects, bullets, enemies, and explosion particles)
 def draw_cube(pos, size=0.5, color=(1, 1, 1)):
+    if shader_renderer.active:
+        shader_renderer.active.draw_mesh(get_mesh('cube'), model_matrix(pos, scale=size), color)
+        return
     glPushMatrix()
     glTranslatef(pos[0], pos[1], pos[2])
-    glBegin(GL_QUADS)
+    glScalef(size, size, size)
     glColor3f(*color)
-    vertices = [
-        (size, -size, -size), (size, size, -size), (-size, size, -size), (-size, -size, -size),
-        (size, -size, size), (size, size, size), (-size, size, size), (-size, -size, size),
-        (-size, -size, -size), (-size, size, -size), (-size, size, size), (-size, -size, size),
-        (size, -size, -size), (size, size, -size), (size, size, size), (size, -size, size),
-        (-size, size, -size), (size, size, -size), (size, size, size), (-size, size, size),
-        (-size, -size, -size), (size, -size, -size), (size, -size, size), (-size, -size, size)
-    ]
-    for i in range(0, len(vertices), 4):
-        for vertex in vertices[i:i+4]:
-            glVertex3fv(vertex)
-    glEnd()
+    draw_mesh('cube')
     glPopMatrix()
 
 # Draw a simplified TIE Fighter (Star Wars enemy ship)
-def draw_tie_fighter(pos, scale=1.0):
+def draw_tie_fighter(pos, scale=1.0, lod=False):
+    if shader_renderer.active:
+        shader_renderer.active.draw_mesh(get_mesh('tie_fighter_lod' if lod else 'tie_fighter'), model_matrix(pos, scale=scale))
+        return
     glPushMatrix()
     glTranslatef(pos[0], pos[1], pos[2])
     glScalef(scale, scale, scale)
-
-    # Cockpit (central sphere approximated as a cube)
-    draw_cube([0, 0, 0], size=0.5, color=(0.3, 0.3, 0.3))  # Dark gray for the cockpit
-
-    # Cockpit window (small green square on the front)
-    glBegin(GL_QUADS)
-    glColor3f(0, 1, 0)  # Green for the cockpit window
-    window_size = 0.2
-    glVertex3f(-window_size, -window_size, -0.5 - 0.01)  # Slightly in front of the cockpit
-    glVertex3f(window_size, -window_size, -0.5 - 0.01)
-    glVertex3f(window_size, window_size, -0.5 - 0.01)
-    glVertex3f(-window_size, window_size, -0.5 - 0.01)
-    glEnd()
-
-    # Left wing (hexagonal panel)
-    glBegin(GL_QUADS)
-    glColor3f(0.3, 0.3, 0.3)  # Dark gray for the wings
-    wing_width = 0.2
-    wing_height = 1.5
-    wing_offset = 0.5 + wing_width / 2  # Offset from the cockpit
-    vertices = [
-        (-wing_offset - wing_width, -wing_height, 0), (-wing_offset + wing_width, -wing_height, 0), (-wing_offset + wing_width, wing_height, 0), (-wing_offset - wing_width, wing_height, 0),
-        (-wing_offset - wing_width, -wing_height, 0.1), (-wing_offset + wing_width, -wing_height, 0.1), (-wing_offset + wing_width, wing_height, 0.1), (-wing_offset - wing_width, wing_height, 0.1),
-        (-wing_offset - wing_width, -wing_height, 0), (-wing_offset - wing_width, wing_height, 0), (-wing_offset - wing_width, wing_height, 0.1), (-wing_offset - wing_width, -wing_height, 0.1),
-        (-wing_offset + wing_width, -wing_height, 0), (-wing_offset + wing_width, wing_height, 0), (-wing_offset + wing_width, wing_height, 0.1), (-wing_offset + wing_width, -wing_height, 0.1),
-        (-wing_offset - wing_width, wing_height, 0), (-wing_offset + wing_width, wing_height, 0), (-wing_offset + wing_width, wing_height, 0.1), (-wing_offset - wing_width, wing_height, 0.1),
-        (-wing_offset - wing_width, -wing_height, 0), (-wing_offset + wing_width, -wing_height, 0), (-wing_offset + wing_width, -wing_height, 0.1), (-wing_offset - wing_width, -wing_height, 0.1)
-    ]
-    for i in range(0, len(vertices), 4):
-        for vertex in vertices[i:i+4]:
-            glVertex3fv(vertex)
-    glEnd()
-
-    # Right wing (hexagonal panel)
-    glBegin(GL_QUADS)
-    glColor3f(0.3, 0.3, 0.3)  # Dark gray for the wings
-    vertices = [
-        (wing_offset - wing_width, -wing_height, 0), (wing_offset + wing_width, -wing_height, 0), (wing_offset + wing_width, wing_height, 0), (wing_offset - wing_width, wing_height, 0),
-        (wing_offset - wing_width, -wing_height, 0.1), (wing_offset + wing_width, -wing_height, 0.1), (wing_offset + wing_width, wing_height, 0.1), (wing_offset - wing_width, wing_height, 0.1),
-        (wing_offset - wing_width, -wing_height, 0), (wing_offset - wing_width, wing_height, 0), (wing_offset - wing_width, wing_height, 0.1), (wing_offset - wing_width, -wing_height, 0.1),
-        (wing_offset + wing_width, -wing_height, 0), (wing_offset + wing_width, wing_height, 0), (wing_offset + wing_width, wing_height, 0.1), (wing_offset + wing_width, -wing_height, 0.1),
-        (wing_offset - wing_width, wing_height, 0), (wing_offset + wing_width, wing_height, 0), (wing_offset + wing_width, wing_height, 0.1), (wing_offset - wing_width, wing_height, 0.1),
-        (wing_offset - wing_width, -wing_height, 0), (wing_offset + wing_width, -wing_height, 0), (wing_offset + wing_width, -wing_height, 0.1), (wing_offset - wing_width, -wing_height, 0.1)
-    ]
-    for i in range(0, len(vertices), 4):
-        for vertex in vertices[i:i+4]:
-            glVertex3fv(vertex)
-    glEnd()
-
+    draw_mesh('tie_fighter_lod' if lod else 'tie_fighter')
     glPopMatrix()
 
-# Draw a bullet (player bullets as red cubes)
-def draw_bullet(pos):
-    draw_cube(pos, size=0.1, color=(1, 0, 0))
-
-# Draw an enemy bullet (green laser line)
-def draw_enemy_bullet(pos, prev_pos):
-    glPushMatrix()
-    glBegin(GL_LINES)
-    glColor3f(0, 1, 0)  # Green for enemy laser
-    glVertex3f(prev_pos[0], prev_pos[1], prev_pos[2])  # Start of the laser
-    glVertex3f(pos[0], pos[1], pos[2])  # End of the laser
-    glEnd()
-    glPopMatrix()
-
-# Draw a power-up (yellow cube for health)
-def draw_power_up(pos):
-    draw_cube(pos, size=0.3, color=(1, 1, 0))  # Yellow cube for health power-up
-
-# Draw an explosion (simple particle effect)
-def draw_explosion(explosion):
-    for particle in explosion['particles']:
-        draw_cube(particle['pos'], size=particle['size'], color=(1, 0.5, 0))  # Orange particles
-
-# Draw a small hill (pyramid shape)
-def draw_hill(pos, size=1.0):
+# Draw the enemies inside the view frustum, far TIE fighters as impostors
+def draw_enemies(positions):
+    visible = view_frustum.spheres_visible(positions, enemy_radius)
+    positions = positions[visible]
+    gpu = shader_renderer.active
+    if enemy_model:
+        culling.record('enemies', len(visible), len(positions))
+        if gpu:
+            gpu.draw_instances(enemy_model, positions, 1.0, (1, 0, 0), lit=True)
+            return
+        for enemy in positions:
+            draw_model(enemy_model, enemy, scale=1.0, color=(1, 0, 0))
+        return
+    far = view_frustum.distance_squared(positions) > enemy_lod_distance ** 2
+    culling.record('enemies', len(visible), len(positions), int(np.count_nonzero(far)))
+    if gpu:
+        # One instanced call per level of detail
+        gpu.draw_instances(get_mesh('tie_fighter'), positions[~far])
+        gpu.draw_instances(get_mesh('tie_fighter_lod'), positions[far])
+        return
+    for enemy, lod in zip(positions, far):
+        draw_tie_fighter(enemy, scale=1.0, lod=lod)  # Use TIE Fighter design
+
+# Draw a cached Wavefront model, lit from the camera so its shape reads
+def draw_model(model, pos, scale=1.0, color=(1, 1, 1)):
+    if shader_renderer.active:
+        shader_renderer.active.draw_mesh(model, model_matrix(pos, scale=scale), color, lit=True)
+        return
     glPushMatrix()
+    glPushAttrib(GL_ENABLE_BIT | GL_LIGHTING_BIT)
+    glEnable(GL_LIGHTING)
+    glEnable(GL_LIGHT0)
+    glEnable(GL_COLOR_MATERIAL)
+    glEnable(GL_NORMALIZE)  # Normals are scaled along with the model
     glTranslatef(pos[0], pos[1], pos[2])
-    glBegin(GL_TRIANGLES)
-    glColor3f(0, 0.4, 0)  # Slightly darker green for hills
-    # Base
-    glVertex3f(-size, 0, -size)
-    glVertex3f(size, 0, -size)
-    glVertex3f(size, 0, size)
-
-    glVertex3f(-size, 0, -size)
-    glVertex3f(size, 0, size)
-    glVertex3f(-size, 0, size)
-
-    # Sides
-    glVertex3f(-size, 0, -size)
-    glVertex3f(size, 0, -size)
-    glVertex3f(0, size, 0)  # Peak
-
-    glVertex3f(size, 0, -size)
-    glVertex3f(size, 0, size)
-    glVertex3f(0, size, 0)
-
-    glVertex3f(size, 0, size)
-    glVertex3f(-size, 0, size)
-    glVertex3f(0, size, 0)
-
-    glVertex3f(-size, 0, size)
-    glVertex3f(-size, 0, -size)
-    glVertex3f(0, size, 0)
-    glEnd()
-    glPopMatrix()
-
-# Draw a tree (cone for foliage, cube for trunk)
-def draw_tree(pos):
-    glPushMatrix()
-    glTranslatef(pos[0], pos[1], pos[2])
-
-    # Trunk (brown cube)
-    glBegin(GL_QUADS)
-    glColor3f(0.5, 0.3, 0)  # Brown
-    trunk_size = 0.2
-    trunk_height = 0.5
-    vertices = [
-        (-trunk_size, 0, -trunk_size), (-trunk_size, trunk_height, -trunk_size), (trunk_size, trunk_height, -trunk_size), (trunk_size, 0, -trunk_size),
-        (-trunk_size, 0, trunk_size), (-trunk_size, trunk_height, trunk_size), (trunk_size, trunk_height, trunk_size), (trunk_size, 0, trunk_size),
-        (-trunk_size, 0, -trunk_size), (-trunk_size, trunk_height, -trunk_size), (-trunk_size, trunk_height, trunk_size), (-trunk_size, 0, trunk_size),
-        (trunk_size, 0, -trunk_size), (trunk_size, trunk_height, -trunk_size), (trunk_size, trunk_height, trunk_size), (trunk_size, 0, trunk_size),
-        (-trunk_size, trunk_height, -trunk_size), (-trunk_size, trunk_height, trunk_size), (trunk_size, trunk_height, trunk_size), (trunk_size, trunk_height, -trunk_size),
-        (-trunk_size, 0, -trunk_size), (-trunk_size, 0, trunk_size), (trunk_size, 0, trunk_size), (trunk_size, 0, -trunk_size)
-    ]
-    for i in range(0, len(vertices), 4):
-        for vertex in vertices[i:i+4]:
-            glVertex3fv(vertex)
-    glEnd()
-
-    # Foliage (green cone)
-    glBegin(GL_TRIANGLES)
-    glColor3f(0, 0.6, 0)  # Green
-    foliage_base = 0.5
-    foliage_height = 1.0
-    glVertex3f(-foliage_base, trunk_height, -foliage_base)
-    glVertex3f(foliage_base, trunk_height, -foliage_base)
-    glVertex3f(0, trunk_height + foliage_height, 0)
-
-    glVertex3f(foliage_base, trunk_height, -foliage_base)
-    glVertex3f(foliage_base, trunk_height, foliage_base)
-    glVertex3f(0, trunk_height + foliage_height, 0)
-
-    glVertex3f(foliage_base, trunk_height, foliage_base)
-    glVertex3f(-foliage_base, trunk_height, foliage_base)
-    glVertex3f(0, trunk_height + foliage_height, 0)
-
-    glVertex3f(-foliage_base, trunk_height, foliage_base)
-    glVertex3f(-foliage_base, trunk_height, -foliage_base)
-    glVertex3f(0, trunk_height + foliage_height, 0)
-    glEnd()
-
+    glScalef(scale, scale, scale)
+    glColor3f(*color)
+    model.draw()
+    glPopAttrib()
     glPopMatrix()
 
-# Draw a terrain segment
-def draw_terrain_segment(z_offset, base_z):
+# Draw all player bullets (red cubes) in one batch
+def draw_bullets(positions):
+    visible = view_frustum.spheres_visible(positions, 0.2)
+    culling.record('bullets', len(visible), int(np.count_nonzero(visible)))
+    draw_cubes('bullets', positions[visible], 0.1, (1, 0, 0))
+
+# Draw all enemy bullets (green laser lines from the previous to the current position) in one batch
+def draw_enemy_bullets(positions, prev_positions):
+    visible = view_frustum.boxes_visible(np.minimum(positions, prev_positions), np.maximum(positions, prev_positions))
+    culling.record('enemy_bullets', len(visible), int(np.count_nonzero(visible)))
+    draw_lines('enemy_bullets', prev_positions[visible], positions[visible], (0, 1, 0))
+
+# Draw all power-ups (yellow cubes for health) in one batch
+def draw_power_ups(positions):
+    visible = view_frustum.spheres_visible(positions, 0.3 * np.sqrt(3))
+    culling.record('power_ups', len(visible), int(np.count_nonzero(visible)))
+    draw_cubes('power_ups', positions[visible], 0.3, (1, 1, 0))
+
+# Draw every explosion particle (orange cubes) in one batch
+def draw_explosions(positions, sizes):
+    visible = view_frustum.spheres_visible(positions, sizes * np.sqrt(3))
+    culling.record('explosions', len(visible), int(np.count_nonzero(visible)))
+    draw_cubes('explosions', positions[visible], sizes[visible], (1, 0.5, 0))
+
+# Draw a streamed terrain chunk (ground, hills and trees are baked into one mesh),
+# skipping it when it is out of view and using the impostor trees when it is far away
+def draw_terrain_chunk(chunk, z_offset):
+    offset = np.array([0, 0, z_offset])
+    lo, hi = chunk.bounds[0] + offset, chunk.bounds[1] + offset
+    if not view_frustum.boxes_visible(lo, hi)[0]:
+        culling.record('terrain', 1, 0)
+        return
+    nearest = np.clip(view_frustum.eye, lo, hi)
+    far = view_frustum.distance_squared(nearest)[0] > terrain_lod_distance ** 2
+    culling.record('terrain', 1, 1, int(far))
+    meshes = [mesh for mesh in (chunk.ground, chunk.lod_mesh if far else chunk.mesh) if mesh is not None]
+    if shader_renderer.active:
+        model = translation_matrix(0, 0, z_offset)
+        for mesh in meshes:
+            shader_renderer.active.draw_mesh(mesh, model)
+        return
     glPushMatrix()
     glTranslatef(0, 0, z_offset)
-    glBegin(GL_QUADS)
-    glColor3f(0, 0.5, 0)
-    glVertex3f(-10, -2, -10)
-    glVertex3f(10, -2, -10)
-    glVertex3f(10, -2, 10)
-    glVertex3f(-10, -2, 10)
-    glEnd()
-
-    for feature in terrain_features[base_z]:
-        if feature['type'] == 'hill':
-            draw_hill([feature['x'], -2, feature['z']], size=feature['size'])
-        elif feature['type'] == 'tree':
-            draw_tree([feature['x'], -2, feature['z']])
-
+    for mesh in meshes:
+        mesh.draw()
     glPopMatrix()
 
-# Generate random terrain features
-def generate_terrain_features(z_offset):
-    features = []
-    for _ in range(random.randint(3, 5)):
-        x = random.uniform(-8, 8)
-        z = random.uniform(-8, 8)
-        size = random.uniform(0.5, 1.5)
-        features.append({'type': 'hill', 'x': x, 'z': z, 'size': size})
-
-    for _ in range(random.randint(5, 10)):
-        x = random.uniform(-8, 8)
-        z = random.uniform(-8, 8)
-        features.append({'type': 'tree', 'x': x, 'z': z})
-
-    return features
+# Skybox faces (gradient from light blue at the top to darker blue at the bottom):
+# back, front, left, right and top, each as four corners with their colors
+sky_top = (0.2, 0.4, 0.8)  # Light blue at the top
+sky_bottom = (0.1, 0.2, 0.4)  # Darker blue at the bottom
+skybox_faces = [
+    ([(-50, 50, -50), (50, 50, -50), (50, -50, -50), (-50, -50, -50)], [sky_top, sky_top, sky_bottom, sky_bottom]),
+    ([(-50, 50, 50), (50, 50, 50), (50, -50, 50), (-50, -50, 50)], [sky_top, sky_top, sky_bottom, sky_bottom]),
+    ([(-50, 50, -50), (-50, 50, 50), (-50, -50, 50), (-50, -50, -50)], [sky_top, sky_top, sky_bottom, sky_bottom]),
+    ([(50, 50, -50), (50, 50, 50), (50, -50, 50), (50, -50, -50)], [sky_top, sky_top, sky_bottom, sky_bottom]),
+    ([(-50, 50, -50), (50, 50, -50), (50, 50, 50), (-50, 50, 50)], [sky_top] * 4),
+]
+skybox_bounds = (np.array([np.min(face, axis=0) for face, _ in skybox_faces]),
+                 np.array([np.max(face, axis=0) for face, _ in skybox_faces]))
 
-# Draw a simple skybox (gradient sky)
+# Draw a simple skybox (gradient sky); faces behind the camera or past the far plane are skipped
 def draw_skybox():
+    if shader_renderer.active:
+        shader_renderer.active.draw_sky()
+        return
+    visible = view_frustum.boxes_visible(*skybox_bounds)
+    culling.record('skybox', len(visible), int(np.count_nonzero(visible)))
     glPushMatrix()
     glDisable(GL_DEPTH_TEST)  # Disable depth test for skybox
     glBegin(GL_QUADS)
-    # Skybox (gradient from light blue at the top to darker blue at the bottom)
-    glColor3f(0.2, 0.4, 0.8)  # Light blue at the top
-    glVertex3f(-50, 50, -50)
-    glVertex3f(50, 50, -50)
-    glColor3f(0.1, 0.2, 0.4)  # Darker blue at the bottom
-    glVertex3f(50, -50, -50)
-    glVertex3f(-50, -50, -50)
-
-    glColor3f(0.2, 0.4, 0.8)
-    glVertex3f(-50, 50, 50)
-    glVertex3f(50, 50, 50)
-    glColor3f(0.1, 0.2, 0.4)
-    glVertex3f(50, -50, 50)
-    glVertex3f(-50, -50, 50)
-
-    glColor3f(0.2, 0.4, 0.8)
-    glVertex3f(-50, 50, -50)
-    glVertex3f(-50, 50, 50)
-    glColor3f(0.1, 0.2, 0.4)
-    glVertex3f(-50, -50, 50)
-    glVertex3f(-50, -50, -50)
-
-    glColor3f(0.2, 0.4, 0.8)
-    glVertex3f(50, 50, -50)
-    glVertex3f(50, 50, 50)
-    glColor3f(0.1, 0.2, 0.4)
-    glVertex3f(50, -50, 50)
-    glVertex3f(50, -50, -50)
-
-    glColor3f(0.2, 0.4, 0.8)
-    glVertex3f(-50, 50, -50)
-    glVertex3f(50, 50, -50)
-    glVertex3f(50, 50, 50)
-    glVertex3f(-50, 50, 50)
+    for (corners, colors), show in zip(skybox_faces, visible):
+        if show:
+            for corner, color in zip(corners, colors):
+                glColor3f(*color)
+                glVertex3f(*corner)
     glEnd()
+    count_draw(4 * int(np.count_nonzero(visible)))
     glEnable(GL_DEPTH_TEST)  # Re-enable depth test
     glPopMatrix()
 
-# Draw text (simplified version using a pre-rendered texture)
-def draw_text(text, x, y, color=(255, 0, 0)):
-    glMatrixMode(GL_PROJECTION)
-    glPushMatrix()
-    glLoadIdentity()
-    glOrtho(0, display[0], 0, display[1], -1, 1)
-    glMatrixMode(GL_MODELVIEW)
-    glPushMatrix()
-    glLoadIdentity()
-
-    # Pre-render the text as a texture
-    pygame.font.init()
-    font = pygame.font.Font(None, 74)
-    text_surface = font.render(text, True, color)
-    text_data = pygame.image.tostring(text_surface, "RGBA", True)
-    text_width, text_height = text_surface.get_size()
+# Draw text from a cached glyph atlas (the font is loaded and each string laid out only once)
+hud_text = TextRenderer(size=74)
 
-    # Draw the texture
-    glRasterPos2f(x, y)
-    glDrawPixels(text_width, text_height, GL_RGBA, GL_UNSIGNED_BYTE, text_data)
-
-    glPopMatrix()
-    glMatrixMode(GL_PROJECTION)
-    glPopMatrix()
-    glMatrixMode(GL_MODELVIEW)
+def draw_text(text, x, y, color=(255, 0, 0)):
+    hud_text.draw(text, x, y, color, display)
+
+# Frame profiler overlay (F3) and Chrome trace dump (F12)
+profiler_text = TextRenderer(size=16)
+show_profiler = False
+always_profile = False  # --profile or --trace: collect for the whole session, shown or not
+trace_path = None
+
+# Collect only while the overlay is shown, unless the whole session is profiled
+def toggle_profiler():
+    global show_profiler
+    show_profiler = not show_profiler
+    if profiler.enabled != (show_profiler or always_profile):
+        profiler.set_enabled(show_profiler or always_profile)
+
+def dump_trace(path=None):
+    path = path or time.strftime('starfox_trace_%Y%m%d_%H%M%S.json')
+    frames = profiler.write_chrome_trace(path)
+    print(f"Wrote {frames} profiled frames to {path}")
+
+# Blend between the previous and current simulation state for rendering
+def lerp(prev, current, alpha):
+    return np.asarray(prev) + (np.asarray(current) - np.asarray(prev)) * alpha
 
 # Reset the game state
 def reset_game():
-    global player_pos, player_rotation, player_velocity, player_health, enemies, bullets, enemy_bullets, explosions, power_ups, game_over, game_active, score
-    player_pos = [0, 0, 0]
-    player_rotation = [0, 0, 0]
-    player_velocity = [0, 0, 0]
-    player_health = 3  # Reset health
-    enemies = []
-    bullets = []
-    enemy_bullets = []
-    explosions = []
-    power_ups = []
-    score = 0  # Reset score
-    game_over = False
-    game_active = True
-    # Restart background music
-    if pygame.mixer.music.get_busy():
-        pygame.mixer.music.stop()
-    pygame.mixer.music.play(-1)
-
-# Main game loop
-def main():
-    global player_pos, player_rotation, player_velocity, player_health, enemies, bullets, enemy_bullets, explosions, power_ups, game_over, game_active, terrain_segments, terrain_features, score
-    
-    for segment in terrain_segments:
-        terrain_features[segment['base_z']] = generate_terrain_features(segment['base_z'])
-
-    clock = pygame.time.Clock()
-    enemy_spawn_timer = 0
-    enemy_shoot_timer = 0
-    power_up_spawn_timer = 0
-
-    while True:
+    game.reset()
+    restart_music()
+
+def restart_music():
+    if pygame.mixer.get_init() and music_loaded:
+        if pygame.mixer.music.get_busy():
+            pygame.mixer.music.stop()
+        pygame.mixer.music.play(-1)
+
+# Stop the game and free its GL buffers before the window (and its context) goes away
+def close_window():
+    game.shutdown()
+    release_meshes()
+    release_stream_buffers()
+    pygame.quit()
+
+def quit_game():
+    close_window()
+    sys.exit()
+
+# Handle window and keyboard events; fire presses and restarts are queued for the next simulation tick
+def handle_events():
+    global pending_shots, pending_restart
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            quit_game()
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE and game.game_active:
+                pending_shots += 1
+            if event.key == pygame.K_F3:
+                toggle_profiler()
+                continue
+            if event.key == pygame.K_F12:
+                if profiler.enabled:
+                    dump_trace()
+                continue
+            if game.game_over:  # Restart on any key press when game is over
+                pending_restart = True
+
+# Advance the simulation by one fixed tick of dt seconds, driven by that tick's TickInput.
+# A restart also restarts the music.
+def update(dt, controls):
+    if controls.restart and game.game_over:
+        reset_game()
+    game.update(dt, controls)
+
+# Play the sounds for the shots and kills in the snapshot just taken from the
+# simulation process or the co-op server (an in-process Game posts them itself)
+def play_sound_cues(world):
+    voices.post('shoot', world.new_shots)
+    voices.post('explosion', world.new_kills)
+    if world.restarted:
+        restart_music()
+
+# Draw the world alpha of the way from the previous simulation tick to the current one
+def render(alpha):
+    if not game.game_active:
+        if game.game_over:
+            draw_text("Game Over", display[0] // 2 - 100, display[1] // 2)
+        return
+
+    frames = 60 / sim_rate
+    culling.begin_frame()
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    glEnable(GL_DEPTH_TEST)
+
+    # Draw skybox
+    draw_skybox()
+    profiler.lap('draw_sky')
+
+    # Draw terrain
+    game.terrain.draw(draw_terrain_chunk, offset=(alpha - 1) * game.terrain_speed * frames)
+    profiler.lap('draw_terrain')
+
+    # Draw game elements
+    draw_arwing(lerp(game.prev_player_pos, game.player_pos, alpha), lerp(game.prev_player_rotation, game.player_rotation, alpha), scale=0.5)
+    for ship in game.ships[1:]:  # Co-op wingmen
+        draw_arwing(lerp(ship.prev_pos, ship.pos, alpha), lerp(ship.prev_rotation, ship.rotation, alpha), scale=0.5)
+    draw_enemies(lerp(game.enemies['prev_pos'], game.enemies['pos'], alpha))
+    draw_bullets(lerp(game.bullets['prev_pos'], game.bullets['pos'], alpha))
+    enemy_bullets = game.enemy_bullets
+    laser_heads = lerp(enemy_bullets['prev_pos'], enemy_bullets['pos'], alpha)
+    draw_enemy_bullets(laser_heads, laser_heads - (enemy_bullets['pos'] - enemy_bullets['prev_pos']))
+    draw_power_ups(lerp(game.power_ups['prev_pos'], game.power_ups['pos'], alpha))
+    explosions = game.explosions
+    positions, sizes = explosions['pos'], explosions['size']
+    velocities = explosions['vel']
+    if particles_drawn < game.particles_per_explosion:
+        # Draw the same particles of every explosion
+        shown = explosions['index'] < particles_drawn
+        positions, sizes, velocities = positions[shown], sizes[shown], velocities[shown]
+    draw_explosions(positions + velocities * ((alpha - 1) * frames), sizes)
+    profiler.lap('draw_entities')
+
+    # Draw HUD (health and score)
+    draw_text(f"Health: {game.player_health}", 10, display[1] - 40, color=(0, 255, 0))  # Green text for health
+    draw_text(f"Score: {game.score} pts", 10, display[1] - 80, color=(255, 255, 0))  # Yellow text for score with "pts"
+    profiler.lap('draw_hud')
+
+# Show the loading screen until the required assets and the first terrain chunks
+# are ready. Returns when its first frame was shown.
+loading_text = TextRenderer(size=32)
+
+def show_loading_screen(loader, clock):
+    first_frame = None
+    while first_frame is None or not (loader.required_ready() and game.terrain.ready()):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE and game_active:
-                    bullets.append([player_pos[0], player_pos[1], player_pos[2]])
-                    # Play shooting sound
-                    if shoot_sound:
-                        print("Playing shoot sound")
-                        shoot_sound.play()
-                if game_over:  # Restart on any key press when game is over
-                    reset_game()
-
-        if not game_active:
-            if game_over:
-                draw_text("Game Over", display[0] // 2 - 100, display[1] // 2)
-            pygame.display.flip()
-            clock.tick(60)
-            continue
-
-        # Player movement
-        keys = pygame.key.get_pressed()
-        target_velocity = [0, 0, 0]
-        rotation_speed = 2.0
-
-        if keys[pygame.K_LEFT]:
-            target_velocity[0] = -0.1
-            player_rotation[2] = min(player_rotation[2] + rotation_speed, 30)
-        elif keys[pygame.K_RIGHT]:
-            target_velocity[0] = 0.1
-            player_rotation[2] = max(player_rotation[2] - rotation_speed, -30)
-        else:
-            player_rotation[2] *= 0.9
-
-        if keys[pygame.K_UP]:
-            target_velocity[1] = 0.1
-            player_rotation[0] = max(player_rotation[0] - rotation_speed, -30)
-        elif keys[pygame.K_DOWN]:
-            target_velocity[1] = -0.1
-            player_rotation[0] = min(player_rotation[0] + rotation_speed, 30)
-        else:
-            player_rotation[0] *= 0.9
-
-        if keys[pygame.K_q]:
-            player_rotation[1] += rotation_speed
-        if keys[pygame.K_e]:
-            player_rotation[1] -= rotation_speed
-
-        for i in range(3):
-            player_velocity[i] = player_velocity[i] * 0.9 + target_velocity[i] * 0.1
-            player_pos[i] += player_velocity[i]
-
-        # Spawn enemies from the front (negative z-direction)
-        enemy_spawn_timer += 1
-        if enemy_spawn_timer > 60:  # Spawn every 60 frames (1 second at 60 FPS)
-            x = random.uniform(-5, 5)
-            y = random.uniform(-2, 2)
-            enemies.append([x, y, -30])  # Spawn at z=-30 (in front of player)
-            enemy_spawn_timer = 0
-
-        # Spawn power-ups occasionally
-        power_up_spawn_timer += 1
-        if power_up_spawn_timer > 300:  # Spawn every 300 frames (5 seconds at 60 FPS)
-            x = random.uniform(-5, 5)
-            y = random.uniform(-2, 2)
-            power_ups.append({'pos': [x, y, -30], 'prev_pos': [x, y, -30]})  # Spawn at z=-30
-            power_up_spawn_timer = 0
-
-        # Update enemies (move toward player)
-        for enemy in enemies[:]:
-            enemy[2] += terrain_speed  # Move toward player (increase z toward z=0)
-            # Also apply some AI movement toward the player in x and y
-            enemy[0] += (player_pos[0] - enemy[0]) * enemy_speed
-            enemy[1] += (player_pos[1] - enemy[1]) * enemy_speed
-            if enemy[2] > 10:  # Remove if too far behind
-                enemies.remove(enemy)
-            # Check collision with player
-            if (abs(enemy[0] - player_pos[0]) < 1.0 and
-                abs(enemy[1] - player_pos[1]) < 1.0 and
-                abs(enemy[2] - player_pos[2]) < 1.0):
-                player_health -= 1
-                enemies.remove(enemy)
-                if player_health <= 0:
-                    game_over = True
-                    game_active = False
-
-        # Enemies shoot at the player
-        enemy_shoot_timer += 1
-        if enemy_shoot_timer > 120:  # Shoot every 2 seconds
-            for enemy in enemies:
-                enemy_bullets.append({'pos': [enemy[0], enemy[1], enemy[2]], 'prev_pos': [enemy[0], enemy[1], enemy[2]]})
-            enemy_shoot_timer = 0
-
-        # Update enemy bullets
-        for bullet in enemy_bullets[:]:
-            bullet['prev_pos'] = bullet['pos'].copy()  # Store previous position for drawing
-            bullet['pos'][2] += 0.2  # Move toward player (increase z toward z=0)
-            if bullet['pos'][2] > 20:
-                enemy_bullets.remove(bullet)
-            # Check collision with player
-            if (abs(bullet['pos'][0] - player_pos[0]) < 0.5 and
-                abs(bullet['pos'][1] - player_pos[1]) < 0.5 and
-                abs(bullet['pos'][2] - player_pos[2]) < 0.5):
-                player_health -= 1
-                enemy_bullets.remove(bullet)
-                if player_health <= 0:
-                    game_over = True
-                    game_active = False
-
-        # Update power-ups
-        for power_up in power_ups[:]:
-            power_up['prev_pos'] = power_up['pos'].copy()  # Store previous position
-            power_up['pos'][2] += terrain_speed  # Move toward player (increase z toward z=0)
-            if power_up['pos'][2] > 10:  # Remove if too far behind
-                power_ups.remove(power_up)
-            # Check collision with player
-            if (abs(power_up['pos'][0] - player_pos[0]) < 0.5 and
-                abs(power_up['pos'][1] - player_pos[1]) < 0.5 and
-                abs(power_up['pos'][2] - player_pos[2]) < 0.5):
-                player_health = min(player_health + 1, 5)  # Increase health, max 5
-                power_ups.remove(power_up)
-
-        # Update terrain
-        for segment in terrain_segments:
-            segment['current_z'] += terrain_speed
-            if segment['current_z'] > 20:
-                segment['current_z'] -= 60
-                segment['base_z'] -= 60
-                terrain_features[segment['base_z']] = generate_terrain_features(segment['base_z'])
-
-        # Update bullets (collect bullets to remove to avoid double-removal)
-        bullets_to_remove = []
-        for bullet in bullets:
-            bullet[2] -= 0.2  # Move forward (decrease z)
-            if bullet[2] < -20:
-                bullets_to_remove.append(bullet)
-                continue  # Skip further checks for this bullet
-            # Check collision with enemies
-            for enemy in enemies[:]:
-                if (abs(bullet[0] - enemy[0]) < 1.0 and
-                    abs(bullet[1] - enemy[1]) < 1.0 and
-                    abs(bullet[2] - enemy[2]) < 1.0):
-                    # Create explosion
-                    particles = []
-                    for _ in range(10):
-                        particles.append({
-                            'pos': [enemy[0], enemy[1], enemy[2]],
-                            'vel': [random.uniform(-0.1, 0.1), random.uniform(-0.1, 0.1), random.uniform(-0.1, 0.1)],
-                            'size': 0.2,
-                            'lifetime': 30
-                        })
-                    explosions.append({'particles': particles})
-                    # Play explosion sound
-                    if explosion_sound:
-                        print("Playing explosion sound")
-                        explosion_sound.play()
-                    enemies.remove(enemy)
-                    bullets_to_remove.append(bullet)
-                    score += 100  # Increase score by 100 points for destroying an enemy
-                    break
-
-        # Remove bullets after the loop
-        for bullet in bullets_to_remove:
-            if bullet in bullets:  # Ensure bullet is still in the list
-                bullets.remove(bullet)
-
-        # Update explosions
-        for explosion in explosions[:]:
-            for particle in explosion['particles']:
-                particle['pos'][0] += particle['vel'][0]
-                particle['pos'][1] += particle['vel'][1]
-                particle['pos'][2] += particle['vel'][2]
-                particle['lifetime'] -= 1
-                particle['size'] *= 0.95
-            explosion['particles'] = [p for p in explosion['particles'] if p['lifetime'] > 0]
-            if not explosion['particles']:
-                explosions.remove(explosion)
-
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glEnable(GL_DEPTH_TEST)
-
-        # Draw skybox
-        draw_skybox()
-
-        # Draw terrain
-        for segment in terrain_segments:
-            draw_terrain_segment(segment['current_z'], segment['base_z'])
-
-        # Draw game elements
-        draw_arwing(player_pos, player_rotation, scale=0.5)
-        for enemy in enemies:
-            if enemy_model:
-                draw_model(enemy_model, enemy, scale=1.0, color=(1, 0, 0))
-            else:
-                draw_tie_fighter(enemy, scale=1.0)  # Use TIE Fighter design
-        for bullet in bullets:
-            draw_bullet(bullet)
-        for bullet in enemy_bullets:
-            draw_enemy_bullet(bullet['pos'], bullet['prev_pos'])
-        for power_up in power_ups:
-            draw_power_up(power_up['pos'])
-
-        # Draw HUD (health and score)
-        draw_text(f"Health: {player_health}", 10, display[1] - 40, color=(0, 255, 0))  # Green text for health
-        draw_text(f"Score: {score} pts", 10, display[1] - 80, color=(255, 255, 0))  # Yellow text for score with "pts"
-
+                quit_game()
+        loader.poll()
+        done, total = loader.progress()
+        draw_loading_screen(loading_text, display, done / total, f"Loading... {done}/{total}")
         pygame.display.flip()
+        if first_frame is None:
+            first_frame = time.perf_counter()
         clock.tick(60)
+    return first_frame
+
+# A fresh seed for runs that weren't given one
+def new_seed():
+    return int.from_bytes(os.urandom(4), 'little')
+
+# Check a finished replay against the digest its recording ended with
+def report_replay(replay):
+    if replay.digest is None:
+        print("Replay finished (the log has no final digest to compare)")
+    elif game.digest() == replay.digest:
+        print("Replay finished: final state matches the recording")
+    else:
+        print("Replay finished: final state DIFFERS from the recording")
+
+# Main game loop: fixed-rate simulation ticks, rendering as fast as max_fps allows.
+# With record_path every tick's input is logged; with replay_path the logged
+# input drives the game instead of the keyboard. profile starts the frame
+# profiler straight away (it can also be toggled with F3). sim_process runs the
+# simulation in a process of its own, with this one only handling input and drawing.
+# connect joins a co-op server at that address (host, port) instead of running a
+# Game here; host_port first starts one on this machine. conditions
+# (NetworkConditions) applies simulated latency and loss to co-op traffic.
+def main(seed=None, record_path=None, replay_path=None, profile=False, sim_process=False,
+         connect=None, host_port=None, conditions=None):
+    global game, sim_rate, pending_shots, pending_restart, governor, always_profile
+    replay = InputReplay(replay_path) if replay_path else None
+    if replay:
+        seed = replay.seed
+        sim_rate = replay.sim_rate
+    if seed is None:
+        seed = new_seed()
+    simulation = None
+    client = None
+    server = None
+    if host_port is not None:
+        network = (conditions.latency_ms, conditions.jitter_ms, conditions.loss) if conditions else ()
+        server = start_server(host_port, seed, sim_rate, 1, *network)
+        connect = ('127.0.0.1', host_port)
+    if connect:
+        # The server runs the Game; this process predicts our ship and draws its snapshots
+        client = CoopClient(connect, conditions)
+        game = client.view
+        seed = client.seed
+        sim_rate = client.sim_rate
+        recorder = None
+        replay_inputs = None
+        print(f"Joined the co-op game at {connect[0]}:{connect[1]} as pilot {client.index + 1}")
+    elif sim_process:
+        # Recording and replaying happen next to the Game, in the simulation process
+        simulation = SimulationProcess(seed, sim_rate, record_path, replay_path)
+        game = simulation.view
+        recorder = None
+        replay_inputs = None
+    else:
+        game.seed(seed)
+        game.audio = voices
+        recorder = InputRecorder(record_path, seed, sim_rate) if record_path else None
+        replay_inputs = iter(replay) if replay else None
+    print(f"Seed: {seed}")
+    governor = QualityGovernor(apply_quality)
+    if quality != 'auto':
+        governor.lock(quality)
+
+    gc_monitor.install()
+    init_display()
+    init_audio()
+    loader = AssetLoader(asset_manifest())
+    loader.start()
+    game.start()
+
+    clock = pygame.time.Clock()
+    first_frame = show_loading_screen(loader, clock)
+    print(f"First frame {(first_frame - launch_time) * 1000:.0f} ms after launch, "
+          f"gameplay from {(time.perf_counter() - launch_time) * 1000:.0f} ms")
+    # Everything loaded so far lives for the whole session: move it out of the
+    # collector's generations so later collections don't have to traverse it
+    gc.collect()
+    gc.freeze()
+    assets_reported = False
+    if simulation:
+        simulation.start()
+
+    always_profile = profile
+    if profile:
+        profiler.set_enabled(True)
+
+    dt = 1 / sim_rate
+    accumulator = 0.0
+    previous_time = time.perf_counter()
+
+    try:
+        while True:
+            now = time.perf_counter()
+            accumulator += now - previous_time
+            previous_time = now
+            profiler.begin_frame()
+
+            handle_events()
+            if not assets_reported:
+                loader.poll()  # Optional assets are swapped in as they finish
+                if loader.done():
+                    print(f"Assets loaded {(time.perf_counter() - launch_time) * 1000:.0f} ms after launch:")
+                    print(loader.report())
+                    assets_reported = True
+            profiler.lap('events')
+
+            keys = pygame.key.get_pressed()
+            if simulation:
+                # The simulation ticks on its own clock: hand it this frame's input
+                # and draw the newest snapshot it has published
+                simulation.send_input(TickInput.from_pressed(keys, pending_shots, pending_restart))
+                pending_shots = 0
+                pending_restart = False
+                if simulation.finished():
+                    close_window()
+                    return
+                game.acquire()
+                play_sound_cues(game)
+                alpha = game.alpha(sim_rate)
+            elif client:
+                # Ticks run here too, but they only fly our own ship ahead of the
+                # server; everything else comes from the snapshots it sends
+                client.poll()
+                ticks = 0
+                while accumulator >= dt and ticks < max_catch_up_ticks:
+                    client.tick(TickInput.from_pressed(keys, pending_shots, pending_restart))
+                    pending_shots = 0
+                    pending_restart = False
+                    accumulator -= dt
+                    ticks += 1
+                if ticks == max_catch_up_ticks:
+                    accumulator = min(accumulator, dt)
+                play_sound_cues(game)
+                alpha = accumulator / dt
+            else:
+                ticks = 0
+                while accumulator >= dt and ticks < max_catch_up_ticks:
+                    if replay_inputs is not None:
+                        controls = next(replay_inputs, None)
+                        if controls is None:
+                            report_replay(replay)
+                            close_window()
+                            return
+                    else:
+                        controls = TickInput.from_pressed(keys, pending_shots, pending_restart)
+                        if recorder:
+                            recorder.record(controls)
+                    pending_shots = 0
+                    pending_restart = False
+                    update(dt, controls)
+                    accumulator -= dt
+                    ticks += 1
+                if ticks == max_catch_up_ticks:
+                    # Too far behind to catch up: drop the backlog rather than spiral
+                    accumulator = min(accumulator, dt)
+                alpha = accumulator / dt
+
+            render(alpha)
+            if show_profiler:
+                draw_overlay(profiler_text, display, extra_lines=culling.summary() + [governor.summary()] +
+                             ([client.summary()] if client else []))
+                profiler.lap('draw_profiler')
+
+            pygame.display.flip()
+            profiler.lap('swap')
+            clock.tick(max_fps)
+            governor.observe(clock.get_rawtime())  # Time the frame took, not counting the cap's wait
+            profiler.lap('wait')
+            profiler.end_frame()
+    finally:
+        voices.stop()
+        if simulation:
+            simulation.stop()
+        if client:
+            client.close()
+        if server:
+            server.terminate()
+        if recorder:
+            recorder.close(game.digest())
+        if trace_path and profiler.enabled:
+            dump_trace(trace_path)
+
+# Run the full gameplay simulation with no window, GL or audio, as fast as it will go.
+# The run gets a Game of its own; pilot(game, tick) supplies each tick's input and a
+# recorder, if given, logs it. Returns a summary of the run.
+def run_headless(ticks, pilot=autopilot, seed=0, recorder=None):
+    game = Game(seed)
+    game.start(render=False)
+    gc_monitor.install()
+    gc_monitor.reset()
+    dt = 1 / sim_rate
+    games = 1
+    best_score = 0
+    start = time.perf_counter()
+    for tick in range(ticks):
+        controls = pilot(game, tick)
+        if recorder:
+            recorder.record(controls)
+        if controls.restart and game.game_over:
+            games += 1
+        game.update(dt, controls)
+        best_score = max(best_score, game.score)
+    elapsed = time.perf_counter() - start
+    game.shutdown()
+    if recorder:
+        recorder.close(game.digest())
+    return {
+        'ticks': ticks,
+        'seconds': elapsed,
+        'ticks_per_second': ticks / elapsed if elapsed else float('inf'),
+        'games': games,
+        'best_score': best_score,
+        'score': game.score,
+        'health': game.player_health,
+        'seed': seed,
+        'digest': game.digest().hex(),
+        'gc': gc_monitor.stats(),
+    }
+
+# Re-run a recorded session headless, as fast as possible
+def replay_headless(path):
+    global sim_rate
+    replay = InputReplay(path)
+    sim_rate = replay.sim_rate
+    inputs = iter(replay)
+    result = run_headless(len(replay), pilot=lambda game, tick: next(inputs), seed=replay.seed)
+    result['matches_recording'] = None if replay.digest is None else result['digest'] == replay.digest.hex()
+    return result
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="StarFox-inspired 3D space shooter")
+    parser.add_argument('--headless', action='store_true', help="simulate without a window or audio")
+    parser.add_argument('--ticks', type=int, default=10000, help="simulation ticks to run in headless mode")
+    parser.add_argument('--seed', type=int, help="seed for every random choice in the game (default: random)")
+    parser.add_argument('--record', metavar='PATH', help="log every tick's input to PATH")
+    parser.add_argument('--replay', metavar='PATH', help="play back an input log recorded with --record")
+    parser.add_argument('--profile', action='store_true', help="start with the frame profiler overlay shown")
+    parser.add_argument('--trace', metavar='PATH', help="profile the session and write a Chrome trace to PATH on exit")
+    parser.add_argument('--renderer', choices=['fixed', 'shader'], default='fixed',
+                        help="fixed-function GL or the GLSL backend (shaders, VAOs, instancing)")
+    parser.add_argument('--core-profile', action='store_true',
+                        help="run on an OpenGL 3.3 core-profile context (implies --renderer shader)")
+    parser.add_argument('--sim-process', action='store_true',
+                        help="run the simulation in a separate process from rendering")
+    parser.add_argument('--coop-host', nargs='?', type=int, const=COOP_PORT, metavar='PORT',
+                        help=f"host a two-player co-op game on PORT (default {COOP_PORT}) and join it")
+    parser.add_argument('--connect', metavar='HOST[:PORT]', help="join a co-op game hosted with --coop-host")
+    parser.add_argument('--net-latency', type=float, default=0.0, metavar='MS',
+                        help="simulated one-way latency for co-op traffic")
+    parser.add_argument('--net-jitter', type=float, default=0.0, metavar='MS', help="simulated latency jitter")
+    parser.add_argument('--net-loss', type=float, default=0.0, metavar='P', help="simulated packet loss (0-1)")
+    parser.add_argument('--quality', choices=['auto'] + [level['name'] for level in QUALITY_LEVELS], default='auto',
+                        help="render quality level, or auto to adapt it to hold 60 FPS")
+    parser.add_argument('--log-level', choices=['debug', 'info', 'warning'], default='warning',
+                        help="diagnostics to log to stderr (debug includes every sound played)")
+    args = parser.parse_args()
+    coop = args.coop_host is not None or args.connect
+    if coop and (args.headless or args.record or args.replay or args.sim_process):
+        parser.error("co-op can't be combined with --headless, --record, --replay or --sim-process")
+    if args.headless:
+        if args.replay:
+            result = replay_headless(args.replay)
+        else:
+            seed = new_seed() if args.seed is None else args.seed
+            recorder = InputRecorder(args.record, seed, sim_rate) if args.record else None
+            result = run_headless(args.ticks, seed=seed, recorder=recorder)
+        print(f"{result['ticks']} ticks in {result['seconds']:.2f}s ({result['ticks_per_second']:.0f} ticks/s), "
+              f"{result['games']} game(s), best score {result['best_score']}, seed {result['seed']}")
+        print(f"GC: {result['gc']['collections']} collections by generation, "
+              f"{result['gc']['pause_ms']:.1f} ms paused (longest {result['gc']['max_pause_ms']:.2f} ms)")
+        if args.replay:
+            print({True: "Final state matches the recording", False: "Final state DIFFERS from the recording",
+                   None: "The log has no final digest to compare"}[result['matches_recording']])
+    else:
+        renderer_name = 'shader' if args.core_profile else args.renderer
+        core_profile = args.core_profile
+        quality = args.quality
+        if args.profile:
+            show_profiler = True
+        trace_path = args.trace
+        conditions = None
+        if args.net_latency or args.net_jitter or args.net_loss:
+            conditions = NetworkConditions(args.net_latency, args.net_jitter, args.net_loss)
+        log_listener = start_logging(args.log_level.upper())
+        try:
+            main(seed=args.seed, record_path=args.record, replay_path=args.replay,
+                 profile=args.profile or bool(args.trace), sim_process=args.sim_process,
+                 connect=parse_address(args.connect) if args.connect else None,
+                 host_port=args.coop_host, conditions=conditions)
+        finally:
+            log_listener.stop()
@@ -0,0 +1,160 @@
+import ctypes
+import json
+import os
+import sys
+
+import numpy as np
+from OpenGL.GL import *
+
+from profiler import count_draw
+
+# pywavefront is only needed to convert an OBJ; a model with a fresh cache loads without it
+try:
+    import pywavefront
+except ImportError:
+    pywavefront = None
+
+# Converted models are kept next to the game as <name>.npy (interleaved float32
+# N3F_V3F rows, one per triangle corner) plus <name>.json recording which source
+# file they were built from. Bump CACHE_VERSION whenever the layout changes.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.asset_cache')
+CACHE_VERSION = 1
+NORMAL_VERTEX_STRIDE = 24  # Bytes per vertex: normal (3 floats) then position (3 floats)
+
+
+def cache_paths(source, cache_dir=CACHE_DIR):
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(cache_dir, name + '.npy'), os.path.join(cache_dir, name + '.json')
+
+
+# What a cache entry must match to be reused: the source's size and modification time
+def source_signature(source):
+    info = os.stat(source)
+    return {'version': CACHE_VERSION, 'source': os.path.abspath(source),
+            'size': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+
+# One normal per triangle, repeated for its three corners (for OBJs without normals)
+def face_normals(positions):
+    corners = positions.reshape(-1, 3, 3)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= np.where(lengths > 0, lengths, 1)
+    return np.repeat(normals, 3, axis=0)
+
+
+# Parse an OBJ with pywavefront and flatten every material into one (N, 6) N3F_V3F array
+def convert_obj(source):
+    if pywavefront is None:
+        raise RuntimeError(f"pywavefront is needed to convert {source}")
+    scene = pywavefront.Wavefront(source, collect_faces=True, create_materials=True)
+    parts = []
+    for material in scene.materials.values():
+        if not material.vertices:
+            continue
+        # vertex_format is e.g. 'T2F_N3F_V3F': pick the normal and position columns out of each row
+        columns = {}
+        offset = 0
+        for component in material.vertex_format.split('_'):
+            width = int(component[1])
+            columns[component[0]] = slice(offset, offset + width)
+            offset += width
+        rows = np.asarray(material.vertices, dtype=np.float32).reshape(-1, offset)
+        positions = rows[:, columns['V']]
+        normals = rows[:, columns['N']] if 'N' in columns else face_normals(positions)
+        parts.append(np.hstack([normals, positions]))
+    if not parts:
+        return np.zeros((0, 6), dtype=np.float32)
+    return np.ascontiguousarray(np.concatenate(parts), dtype=np.float32)
+
+
+# Write the converted array and its sidecar; the sidecar goes last so a crash
+# mid-write leaves an entry that is rebuilt rather than a stale one that is trusted
+def write_cache(source, vertices, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, meta_path = cache_paths(source, cache_dir)
+    for path, write in ((data_path, lambda f: np.save(f, vertices)),
+                        (meta_path, lambda f: f.write(json.dumps(source_signature(source)).encode()))):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            write(f)
+        os.replace(temp_path, path)
+
+
+def read_cache(source, cache_dir=CACHE_DIR):
+    data_path, meta_path = cache_paths(source, cache_dir)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta != source_signature(source):
+        return None
+    try:
+        return np.load(data_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+# A model's triangles in a VBO, uploaded straight from the memory-mapped cache on first draw
+class Model:
+    def __init__(self, name, vertices):
+        self.name = name
+        self.vertices = vertices
+        self.count = len(vertices)
+        self.layout = 'N3F_V3F'
+        self.mode = GL_TRIANGLES
+        self.vbo = None
+        self.ibo = None  # Never indexed
+        self.vao = None  # Set by the shader renderer
+
+    def upload(self):
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, np.ascontiguousarray(self.vertices), GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self):
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            self.vao = None
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+
+    def draw(self):
+        if self.vbo is None:
+            self.upload()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glNormalPointer(GL_FLOAT, NORMAL_VERTEX_STRIDE, ctypes.c_void_p(0))
+        glVertexPointer(3, GL_FLOAT, NORMAL_VERTEX_STRIDE, ctypes.c_void_p(12))
+        glDrawArrays(GL_TRIANGLES, 0, self.count)
+        count_draw(self.count)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+
+# Load an OBJ through the cache, converting it only when the cache is missing or
+# older than the source. Returns None if the source doesn't exist.
+def load_model(source, cache_dir=CACHE_DIR):
+    if not os.path.exists(source):
+        return None
+    vertices = read_cache(source, cache_dir)
+    if vertices is None:
+        print(f"Converting {source} to the asset cache")
+        write_cache(source, convert_obj(source), cache_dir)
+        vertices = read_cache(source, cache_dir)
+    return Model(os.path.basename(source), vertices)
+
+
+# Build (or refresh) the cache ahead of time:  python assets.py mech.obj [more.obj ...]
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        model = load_model(path)
+        if model is None:
+            print(f"{path}: not found")
+        else:
+            print(f"{path}: {model.count // 3} triangles cached in {cache_paths(path)[0]}")
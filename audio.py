@@ -0,0 +1,162 @@
+import logging
+import logging.handlers
+import math
+import queue
+import threading
+import time
+
+import pygame
+
+# Sound effects, played off the main loop. The game only posts events (an
+# effect's name and how many times it happened) to a queue; a worker thread
+# takes them and plays them on the mixer's channels within each effect's limits.
+#
+# Events that arrive together are pre-mixed: a volley of five kills in one tick
+# becomes one louder explosion instead of five voices fighting for channels.
+# An effect also gets no new voice sooner than its interval after the last one;
+# what arrives meanwhile waits and is merged into that next voice.
+
+log = logging.getLogger('starfox')
+
+MERGE_GAIN = 0.25  # Extra volume per doubling of the events merged into one voice
+
+
+# Route the 'starfox' logger through a queue: a call on the game loop only
+# appends the record (and costs nothing below level), and a listener thread
+# formats and writes it to stderr. Returns the listener; stop() it on exit so
+# the last records get written.
+def start_logging(level='WARNING'):
+    records = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(level)
+    log.propagate = False
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(relativeCreated)8.0f ms %(levelname)s %(message)s'))
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
+
+
+# How one effect may use the mixer: at most `voices` of it playing at once, a
+# new voice no sooner than `interval` seconds after the last, at `volume` for a
+# single event. When channels run out, a voice of higher priority can take the
+# channel of one with lower (or equal) priority.
+class Effect:
+    def __init__(self, name, sound, voices=4, interval=0.05, priority=1, volume=0.5):
+        self.name = name
+        self.sound = sound
+        self.voices = voices
+        self.interval = interval
+        self.priority = priority
+        self.volume = volume
+        self.last = -math.inf  # When its newest voice started
+
+
+# A sound playing on a mixer channel
+class Voice:
+    def __init__(self, channel, effect, started, volume):
+        self.channel = channel
+        self.effect = effect
+        self.started = started
+        self.volume = volume
+
+
+# Plays the game's sound effects from a worker thread (see the top of the file).
+#
+# Stealing: an effect at its voice cap restarts its own oldest voice. Otherwise
+# it takes a free channel, and if there is none, the channel of the voice with
+# the lowest priority, then the quietest, then the oldest, as long as that
+# priority isn't above its own; failing that the event is dropped.
+class VoiceManager:
+    def __init__(self):
+        self.effects = {}
+        self.events = queue.SimpleQueue()
+        self.voices = []  # Only touched by the worker
+        self.thread = None
+        self.stats = {'played': 0, 'merged': 0, 'stolen': 0, 'dropped': 0}
+
+    # Register an effect (from the main thread, e.g. once its sound has loaded)
+    def add(self, name, sound, **limits):
+        self.effects[name] = Effect(name, sound, **limits)
+
+    # Start the worker; until then (or without a mixer) events are ignored
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='audio', daemon=True)
+        self.thread.start()
+
+    # Queue count occurrences of an effect. Never blocks.
+    def post(self, name, count=1):
+        if count and self.thread is not None:
+            self.events.put((name, count))
+
+    def stop(self):
+        if self.thread is not None:
+            self.events.put(None)
+            self.thread.join(timeout=1)
+            self.thread = None
+            log.info("Audio: %(played)d voices played, %(merged)d events merged, "
+                     "%(stolen)d voices stolen, %(dropped)d dropped", self.stats)
+
+    # Seconds until the first pending effect's interval is over (None: nothing pending)
+    def wait(self, pending, now):
+        if not pending:
+            return None
+        effects = [self.effects.get(name) for name in pending]
+        return max(min(effect.last + effect.interval - now if effect else 0 for effect in effects), 0)
+
+    def run(self):
+        pending = {}  # Effect name -> events waiting for its interval
+        while True:
+            # Sleep until an event arrives or a pending effect may play, then
+            # take everything else already queued; None means stop
+            try:
+                event = self.events.get(timeout=self.wait(pending, time.perf_counter()))
+                while event is not None:
+                    name, count = event
+                    pending[name] = pending.get(name, 0) + count
+                    event = self.events.get_nowait()
+                return
+            except queue.Empty:
+                pass
+            now = time.perf_counter()
+            for name in list(pending):
+                effect = self.effects.get(name)
+                if effect is None:
+                    del pending[name]  # Its sound never loaded
+                elif now - effect.last >= effect.interval:
+                    self.play(effect, pending.pop(name), now)
+
+    # Play count merged events of effect as one voice
+    def play(self, effect, count, now):
+        volume = min(effect.volume * (1 + MERGE_GAIN * math.log2(count)), 1.0)
+        channel = self.channel_for(effect)
+        if channel is None:
+            self.stats['dropped'] += count
+            log.debug("No channel for %s sound (x%d), dropped", effect.name, count)
+            return
+        channel.play(effect.sound)
+        channel.set_volume(volume)
+        self.voices.append(Voice(channel, effect, now, volume))
+        effect.last = now
+        self.stats['played'] += 1
+        self.stats['merged'] += count - 1
+        log.debug("Playing %s sound (x%d, volume %.2f)", effect.name, count, volume)
+
+    def channel_for(self, effect):
+        self.voices = [voice for voice in self.voices if voice.channel.get_busy()]
+        own = [voice for voice in self.voices if voice.effect is effect]
+        if len(own) >= effect.voices:
+            victim = min(own, key=lambda voice: voice.started)
+        else:
+            channel = pygame.mixer.find_channel()
+            if channel is not None:
+                return channel
+            candidates = [voice for voice in self.voices if voice.effect.priority <= effect.priority]
+            if not candidates:
+                return None
+            victim = min(candidates, key=lambda voice: (voice.effect.priority, voice.volume, voice.started))
+        victim.channel.stop()
+        self.voices.remove(victim)
+        self.stats['stolen'] += 1
+        log.debug("%s sound took a channel from %s", effect.name, victim.effect.name)
+        return victim.channel
@@ -0,0 +1,106 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+from meshes import COLOR_VERTEX_STRIDE, get_mesh
+from profiler import count_draw
+import shader_renderer
+
+
+# A vertex buffer refilled every frame. glBufferData orphans the previous
+# contents, so the driver never has to wait for last frame's draw to finish.
+class StreamBuffer:
+    def __init__(self):
+        self.vbo = None
+
+    def upload(self, data):
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+
+    def release(self):
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+
+
+# One stream buffer per kind of batch, created on first use
+stream_buffers = {}
+
+
+def get_stream_buffer(kind):
+    buffer = stream_buffers.get(kind)
+    if buffer is None:
+        buffer = StreamBuffer()
+        stream_buffers[kind] = buffer
+    return buffer
+
+
+# Upload interleaved color/vertex data (or plain vertices) and draw it in one call
+def draw_stream(kind, mode, vertices, colors=None):
+    if colors is not None:
+        data = np.empty((len(vertices), 6), dtype=np.float32)
+        data[:, :3] = colors
+        data[:, 3:] = vertices
+    else:
+        data = np.ascontiguousarray(vertices, dtype=np.float32)
+    get_stream_buffer(kind).upload(data)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    if colors is not None:
+        glEnableClientState(GL_COLOR_ARRAY)
+        glColorPointer(3, GL_FLOAT, COLOR_VERTEX_STRIDE, ctypes.c_void_p(0))
+        glVertexPointer(3, GL_FLOAT, COLOR_VERTEX_STRIDE, ctypes.c_void_p(12))
+    else:
+        glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+    glDrawArrays(mode, 0, len(vertices))
+    count_draw(len(vertices))
+    if colors is not None:
+        glDisableClientState(GL_COLOR_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+
+# Draw N cubes in one call. positions is (N, 3); sizes is a scalar or (N,);
+# colors is one RGB tuple for the whole batch or an (N, 3) array.
+def draw_cubes(kind, positions, sizes, colors):
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    if len(positions) == 0:
+        return
+    if shader_renderer.active:
+        shader_renderer.active.draw_instances(get_mesh('cube'), positions, sizes, colors)
+        return
+    template = get_mesh('cube').vertices
+    sizes = np.asarray(sizes, dtype=np.float32)
+    if sizes.ndim:
+        sizes = sizes[:, None, None]
+    vertices = (positions[:, None, :] + template[None, :, :] * sizes).reshape(-1, 3)
+    colors = np.asarray(colors, dtype=np.float32)
+    if colors.ndim == 1:
+        glColor3f(*colors)
+        draw_stream(kind, GL_TRIANGLES, vertices)
+    else:
+        draw_stream(kind, GL_TRIANGLES, vertices, np.repeat(colors, len(template), axis=0))
+
+
+# Draw N line segments in one call; starts and ends are (N, 3)
+def draw_lines(kind, starts, ends, color):
+    starts = np.asarray(starts, dtype=np.float32).reshape(-1, 3)
+    if len(starts) == 0:
+        return
+    if shader_renderer.active:
+        shader_renderer.active.draw_lines(starts, ends, color)
+        return
+    vertices = np.empty((len(starts), 2, 3), dtype=np.float32)
+    vertices[:, 0] = starts
+    vertices[:, 1] = ends
+    glColor3f(*color)
+    draw_stream(kind, GL_LINES, vertices.reshape(-1, 3))
+
+
+# Free every stream buffer (call before the GL context goes away)
+def release_stream_buffers():
+    for buffer in stream_buffers.values():
+        buffer.release()
+    stream_buffers.clear()
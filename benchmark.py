@@ -0,0 +1,235 @@
+import argparse
+import ctypes
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Stress scenarios for the simulation and renderer.
+#
+# Each scenario seeds the game, builds a heavy situation and keeps it topped up
+# while it runs for a fixed number of ticks. update() and render() are timed
+# separately (render includes glFinish so the GPU work is counted). Results go
+# to JSON so runs from two commits can be compared with --compare.
+#
+#   python benchmark.py                         # all scenarios, offscreen llvmpipe via EGL
+#   python benchmark.py --gl hidden             # hidden pygame window, e.g. under xvfb-run
+#   python benchmark.py --gl none -s enemies_500
+#   python benchmark.py --output new.json --compare old.json
+
+
+# Spread count new entities over the spawn area (x in [-5, 5], y in [-2, 2]) and the given z range
+def spawn_positions(game, count, z_range):
+    return np.column_stack([
+        game.rng.uniform(-5, 5, count),
+        game.rng.uniform(-2, 2, count),
+        game.rng.uniform(z_range[0], z_range[1], count),
+    ])
+
+
+# Keep `count` enemies alive, spawning replacements at the far end
+def sustain_enemies(game, count, z_range=(-30, -2)):
+    missing = count - len(game.enemies)
+    if missing > 0:
+        game.spawn_enemies(spawn_positions(game, missing, z_range))
+
+
+# Keep `count` player bullets in flight
+def sustain_bullets(game, count, z_range=(-20, 0)):
+    missing = count - len(game.bullets)
+    if missing > 0:
+        positions = spawn_positions(game, missing, z_range)
+        game.bullets.extend(missing, pos=positions, prev_pos=positions)
+
+
+# Start a new round of `count` explosions whenever the last one has burned out
+def sustain_explosions(game, count):
+    if len(game.explosions) == 0:
+        game.explosions.spawn(spawn_positions(game, count, (-20, -2)), game.particles_per_explosion, game.rng)
+
+
+class Scenario:
+    def __init__(self, name, description, ticks, sustain=None, render_every=1):
+        self.name = name
+        self.description = description
+        self.ticks = ticks
+        self.sustain = sustain
+        self.render_every = render_every
+
+
+SCENARIOS = {scenario.name: scenario for scenario in [
+    Scenario('enemies_500', "500 enemies pursuing the player, each firing on its own schedule", 600,
+             sustain=lambda game: sustain_enemies(game, 500)),
+    Scenario('bullets_5000', "5,000 player bullets against a wave of 50 enemies", 600,
+             sustain=lambda game: (sustain_bullets(game, 5000), sustain_enemies(game, 50))),
+    Scenario('explosion_storm_200', "200 simultaneous explosions, re-triggered as they burn out", 600,
+             sustain=lambda game: sustain_explosions(game, 200)),
+    Scenario('terrain_scroll_1h', "An hour of terrain streaming at 60 ticks/s (rendered once a second)", 60 * 60 * 60,
+             render_every=60),
+]}
+
+
+# Make a current GL context without a window: EGL with Mesa's surfaceless
+# platform gives an offscreen llvmpipe context on machines with no display
+def create_egl_context(width, height):
+    from OpenGL import EGL
+    egl_display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    if not EGL.eglInitialize(egl_display, ctypes.pointer(major), ctypes.pointer(minor)):
+        raise RuntimeError("eglInitialize failed")
+    config = EGL.EGLConfig()
+    num_configs = EGL.EGLint()
+    attributes = (EGL.EGLint * 13)(
+        EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+        EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_NONE)
+    EGL.eglChooseConfig(egl_display, attributes, ctypes.pointer(config), 1, ctypes.pointer(num_configs))
+    if num_configs.value < 1:
+        raise RuntimeError("no EGL config with an OpenGL pbuffer")
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    surface = EGL.eglCreatePbufferSurface(egl_display, config, (EGL.EGLint * 5)(
+        EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE))
+    context = EGL.eglCreateContext(egl_display, config, EGL.EGL_NO_CONTEXT, None)
+    if not EGL.eglMakeCurrent(egl_display, surface, surface, context):
+        raise RuntimeError("eglMakeCurrent failed")
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ms = np.array(samples) * 1000
+    return {'p50': float(np.percentile(ms, 50)), 'p99': float(np.percentile(ms, 99)),
+            'mean': float(ms.mean()), 'max': float(ms.max()), 'samples': len(samples)}
+
+
+# Run one scenario (starfox is the STARFOX module). Each gets a fresh Game seeded
+# with 0, installed as the one the window renders, so nothing a scenario leaves
+# behind (spawn timers, the fire schedule, the ship, the terrain) carries into the next.
+def run_scenario(starfox, scenario, ticks, render):
+    from replay import TickInput
+    from OpenGL.GL import glFinish
+    from simulation import Game
+
+    game = starfox.game = Game(0)
+    starfox.culling.total_stats.clear()
+    starfox.gc_monitor.install()
+    starfox.gc_monitor.reset()
+    game.start(render=render)  # No chunk meshes to build when nothing is drawn
+    idle = TickInput()
+    dt = 1 / starfox.sim_rate
+    update_times = []
+    render_times = []
+    for tick in range(ticks):
+        game.player_health = 10 ** 9  # Nothing in a stress run should end the game
+        if scenario.sustain:
+            scenario.sustain(game)
+        start = time.perf_counter()
+        game.update(dt, idle)
+        update_times.append(time.perf_counter() - start)
+        if render and tick % scenario.render_every == 0:
+            start = time.perf_counter()
+            starfox.render(1.0)
+            glFinish()
+            render_times.append(time.perf_counter() - start)
+    game.shutdown()
+    return {
+        'description': scenario.description,
+        'ticks': ticks,
+        'update_ms': percentiles(update_times),
+        'render_ms': percentiles(render_times),
+        'culling': {kind: dict(entry) for kind, entry in starfox.culling.total_stats.items()},
+        'gc': starfox.gc_monitor.stats(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print p50/p99 for each scenario and phase next to a baseline run, with the change in percent
+def compare(results, baseline):
+    print(f"{'scenario':<22}{'phase':<8}{'stat':<6}{'baseline':>10}{'current':>10}{'change':>9}")
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for phase in ('update_ms', 'render_ms'):
+            if not current[phase] or not previous[phase]:
+                continue
+            for stat in ('p50', 'p99'):
+                old, new = previous[phase][stat], current[phase][stat]
+                change = (new - old) / old * 100 if old else float('inf')
+                print(f"{name:<22}{phase[:-3]:<8}{stat:<6}{old:>10.3f}{new:>10.3f}{change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulation ticks and frame rendering under load")
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument('--ticks', type=int, help="override every scenario's tick count")
+    parser.add_argument('--gl', choices=['egl', 'hidden', 'none'], default='egl',
+                        help="offscreen EGL context, hidden pygame window (e.g. under Xvfb) or no rendering")
+    parser.add_argument('--renderer', choices=['fixed', 'shader'], default='fixed', help="rendering backend to time")
+    parser.add_argument('--output', default='bench_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON results from an earlier run to compare against")
+    args = parser.parse_args()
+
+    if args.gl == 'egl':
+        # Must be set before OpenGL is first imported
+        os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+        os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+    import STARFOX as starfox
+    from OpenGL.GL import GL_RENDERER, glGetString
+    starfox.renderer_name = args.renderer
+
+    renderer = None
+    if args.gl == 'egl':
+        create_egl_context(*starfox.display)
+        starfox.init_projection()
+    elif args.gl == 'hidden':
+        import pygame
+        starfox.init_display(pygame.HIDDEN)
+    if args.gl != 'none':
+        renderer = glGetString(GL_RENDERER).decode()
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'gl_renderer': renderer,
+        'renderer': args.renderer,
+        'scenarios': {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        scenario = SCENARIOS[name]
+        ticks = args.ticks or scenario.ticks
+        print(f"{name}: {ticks} ticks...", flush=True)
+        result = run_scenario(starfox, scenario, ticks, render=args.gl != 'none')
+        results['scenarios'][name] = result
+        update, render = result['update_ms'], result['render_ms']
+        line = f"  update p50 {update['p50']:.3f} ms  p99 {update['p99']:.3f} ms"
+        if render:
+            line += f"  |  render p50 {render['p50']:.3f} ms  p99 {render['p99']:.3f} ms"
+        print(line)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
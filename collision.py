@@ -0,0 +1,100 @@
+import numpy as np
+
+# Widening applied to the broad-phase z window so float rounding at the edges
+# can never drop a pair the exact narrow-phase test would accept
+SWEEP_MARGIN = 1e-6
+
+EMPTY_PAIRS = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+
+
+# Swept box test of points moving from start to end (N, 3), relative to a box of
+# half_extent centred on the origin: True where the segment passes through the
+# open box at some point of the tick. A per-axis slab test, so a fast mover
+# can't step over the box between ticks. A segment that ends inside always
+# counts, exactly as the static test would have it.
+def segment_mask(start, end, half_extent):
+    half_extent = np.asarray(half_extent, dtype=np.float64)
+    # Broad phase: only segments whose bounding box meets the box can hit it
+    hits = ((np.minimum(start, end) < half_extent) & (np.maximum(start, end) > -half_extent)).all(axis=1)
+    if not hits.any():
+        return hits
+    candidates = np.flatnonzero(hits)
+    start, end = start[candidates], end[candidates]
+    inside_at_end = np.all(np.abs(end) < half_extent, axis=1)
+    delta = end - start
+    moving = delta != 0
+    step = np.where(moving, delta, 1.0)
+    near = (-half_extent - start) / step
+    far = (half_extent - start) / step
+    # An axis that doesn't move is inside for the whole tick or not at all
+    inside = np.abs(start) < half_extent
+    enter = np.where(moving, np.minimum(near, far), np.where(inside, -np.inf, np.inf)).max(axis=1)
+    leave = np.where(moving, np.maximum(near, far), np.where(inside, np.inf, -np.inf)).min(axis=1)
+    hits[candidates] = inside_at_end | ((enter < leave) & (enter < 1) & (leave > 0))
+    return hits
+
+
+# Which points moving prev_positions -> positions pass within half_extent
+# (a scalar or per-axis triple) on every axis of a box moving prev_point ->
+# point over the same tick.
+# Both move in straight lines, so the test runs on the motion of each point
+# relative to the box.
+def sweep_mask(prev_positions, positions, prev_point, point, half_extent):
+    if len(positions) == 0:
+        return np.zeros(0, dtype=bool)
+    return segment_mask(prev_positions - prev_point, positions - point, half_extent)
+
+
+# Every (i, j) where a moving a_prev[i] -> a_pos[i] and b moving b_prev[j] ->
+# b_pos[j] come within half_extent of each other on every axis during the tick,
+# sorted by i then j.
+#
+# Broad phase is a sorted-z sweep: b is sorted by its current z once and each a
+# finds its candidate window with a binary search, so the work is
+# O((N + M) log M + pairs) instead of N * M. Each a's window covers its whole
+# path plus the furthest any b moved in z. Candidate pairs then get the exact
+# swept test.
+def sweep_pairs(a_prev, a_pos, b_prev, b_pos, half_extent):
+    if len(a_pos) == 0 or len(b_pos) == 0:
+        return EMPTY_PAIRS
+    half_extent = np.broadcast_to(np.asarray(half_extent, dtype=np.float64), (3,))
+    reach = half_extent[2] + float(np.max(np.abs(b_pos[:, 2] - b_prev[:, 2])))
+    window = reach + SWEEP_MARGIN * max(1.0, reach)
+
+    order = np.argsort(b_pos[:, 2], kind='stable')
+    sorted_z = b_pos[order, 2]
+    lo = np.searchsorted(sorted_z, np.minimum(a_prev[:, 2], a_pos[:, 2]) - window, side='left')
+    hi = np.searchsorted(sorted_z, np.maximum(a_prev[:, 2], a_pos[:, 2]) + window, side='right')
+    counts = np.maximum(hi - lo, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return EMPTY_PAIRS
+
+    a_index = np.repeat(np.arange(len(a_pos)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    b_index = order[starts + np.arange(total)]
+
+    hit = segment_mask(a_prev[a_index] - b_prev[b_index], a_pos[a_index] - b_pos[b_index], half_extent)
+    a_index, b_index = a_index[hit], b_index[hit]
+    by_a_then_b = np.lexsort((b_index, a_index))
+    return a_index[by_a_then_b], b_index[by_a_then_b]
+
+
+# Resolve overlap pairs (sorted by a then b) the way the sequential game loop
+# did: each a in turn claims the lowest-numbered b it overlaps that no earlier
+# a has claimed. Returns the matched (a, b) index arrays.
+def first_hits(a_index, b_index):
+    if len(a_index) == 0:
+        return EMPTY_PAIRS
+    hits_a = []
+    hits_b = []
+    claimed = set()
+    last_a = -1
+    for a, b in zip(a_index.tolist(), b_index.tolist()):
+        if a == last_a or b in claimed:
+            continue
+        claimed.add(b)
+        hits_a.append(a)
+        hits_b.append(b)
+        last_a = a
+    return np.array(hits_a, dtype=np.intp), np.array(hits_b, dtype=np.intp)
@@ -0,0 +1,849 @@
+import argparse
+import heapq
+import multiprocessing
+import os
+import random
+import select
+import socket
+import struct
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+from audio import log, start_logging
+from particles import ParticlePool
+from replay import RECORD, TickInput
+from shared_world import StoreView
+from simulation import SHIP_CLEARANCE, SHIP_SPAWNS, Game, Ship, autopilot, fly, generate_terrain_features, land
+from terrain import TerrainStreamer
+
+# Two-player co-op over UDP (--coop-host / --connect in STARFOX.py).
+#
+# A server process owns the only Game and ticks it at sim_rate. Each of up to
+# MAX_PILOTS clients flies one of its ships. Every packet is one datagram that
+# starts with a one-byte kind:
+#
+#   client -> server  HELLO     ask to join (repeated until answered)
+#                     INPUT     the newest snapshot tick received, then the newest
+#                               TickInputs the server hasn't applied (up to
+#                               INPUT_REDUNDANCY of them, so a lost packet loses nothing)
+#                     BYE       leaving
+#   server -> client  WELCOME   the ship index, seed, tick rate and snapshot interval
+#                     FULL      every ship is taken
+#                     SNAPSHOT  the state after a tick, delta-encoded against the
+#                               newest snapshot that client acknowledged
+#
+# Snapshots carry the counters, ships and terrain exactly and entity positions
+# as int16 multiples of 1/QUANT. Each array is sent as its difference from the
+# baseline (enemies matched by id, the other kinds by row), one axis after
+# another, and the payload is zlib-compressed, so an entity that moved the
+# usual amount costs a byte or two. A CRC of the decoded state catches a client
+# decoding against the wrong baseline: it drops the snapshot and stops acking,
+# which makes the server fall back to a full one. Explosions travel as events
+# (where an enemy died) and each client spawns its own particles.
+#
+# Clients predict their own ship: every input is flown with simulation.fly()
+# (and land() over the ground) as soon as it is sent. Each snapshot says which
+# of the client's inputs the server has applied; the client snaps its ship to
+# the server's and flies the inputs the server hasn't applied yet again on top. Everything else is drawn
+# as the newest snapshot has it.
+#
+# NetworkConditions delays and drops the packets a side sends, so all of this
+# can be exercised on loopback:
+#
+#   python coop.py server --port 47800 --seed 1
+#   python coop.py test --seconds 10 --latency 50 --jitter 10 --loss 0.05
+
+COOP_PORT = 47800
+PROTOCOL_VERSION = 2
+MAX_PILOTS = len(SHIP_SPAWNS)
+QUANT = 100  # Entity positions travel in hundredths of a unit
+SHIP_FLOATS = 10  # Per ship in a snapshot: position, rotation, velocity and whether it is in play
+ENTITY_STORES = ('enemies', 'bullets', 'enemy_bullets', 'power_ups')
+SNAPSHOT_FIELDS = ('state', 'ships', 'terrain', 'enemy_ids') + ENTITY_STORES  # What the CRC covers
+HISTORY = 64  # Snapshots each side keeps as possible delta baselines
+INPUT_REDUNDANCY = 16  # Most inputs repeated in one INPUT packet
+INPUT_BUFFER = 4  # Inputs a server lets queue up before applying the backlog at once
+EVENT_TICKS = 60  # How long an explosion is resent to clients that haven't acknowledged it
+PILOT_TIMEOUT = 5.0  # Seconds of silence before the server drops a pilot
+FULL_SIZE_SAMPLE = 60  # Snapshots between measurements of what a full one would cost
+NO_BASELINE = 0xFFFFFFFF
+
+HELLO, WELCOME, FULL, INPUT, SNAPSHOT, BYE = b'H', b'W', b'F', b'I', b'S', b'B'
+HELLO_PACKET = struct.Struct('<cB')  # kind, protocol version
+WELCOME_PACKET = struct.Struct('<cBQHB')  # kind, ship index, seed, sim_rate, snapshot_every
+INPUT_PACKET = struct.Struct('<cIIB')  # kind, acked snapshot tick, newest input sequence, count; then RECORDs oldest first
+SNAPSHOT_PACKET = struct.Struct('<cIIII')  # kind, tick, baseline tick, last input sequence applied, CRC; then the payload
+
+
+# Simulated network trouble for the packets one side sends: each is dropped with
+# probability loss, otherwise held back latency_ms +- jitter_ms (so jitter also
+# reorders them)
+class NetworkConditions:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, loss=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.rng = random.Random(seed)
+
+    # Seconds to hold a packet back, or None to drop it
+    def delay(self):
+        if self.loss and self.rng.random() < self.loss:
+            return None
+        return max(self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms), 0.0) / 1000
+
+    def describe(self):
+        return f"{self.latency_ms:g} ms +- {self.jitter_ms:g} ms latency, {self.loss:.0%} loss"
+
+
+# Bytes and packets in one direction to or from one peer, in total and over the last second
+class Traffic:
+    def __init__(self):
+        self.bytes = 0
+        self.packets = 0
+        self.recent = deque()  # (time, size) of the last second's packets
+
+    def count(self, size, now):
+        self.bytes += size
+        self.packets += 1
+        self.recent.append((now, size))
+
+    # Bytes per second over the last second
+    def rate(self, now):
+        while self.recent and now - self.recent[0][0] > 1.0:
+            self.recent.popleft()
+        return sum(size for _, size in self.recent)
+
+
+NO_TRAFFIC = Traffic()
+
+
+# A non-blocking UDP socket with traffic counters per peer. With conditions,
+# sent packets go through a delay queue that flush() empties as they fall due.
+class Link:
+    def __init__(self, address, conditions=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(address)
+        self.socket.setblocking(False)
+        self.conditions = conditions
+        self.delayed = []  # Heap of (due, order, data, address)
+        self.order = 0
+        self.sent = {}  # address -> Traffic
+        self.received = {}
+        self.dropped = 0
+
+    def send(self, data, address):
+        now = time.perf_counter()
+        self.sent.setdefault(address, Traffic()).count(len(data), now)
+        if self.conditions is None:
+            self.transmit(data, address)
+            return
+        delay = self.conditions.delay()
+        if delay is None:
+            self.dropped += 1
+            return
+        heapq.heappush(self.delayed, (now + delay, self.order, data, address))
+        self.order += 1
+        self.flush()
+
+    # Send every delayed packet that is due
+    def flush(self):
+        now = time.perf_counter()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, data, address = heapq.heappop(self.delayed)
+            self.transmit(data, address)
+
+    def transmit(self, data, address):
+        try:
+            self.socket.sendto(data, address)
+        except OSError:
+            pass  # Nobody listening (yet); UDP would lose it anyway
+
+    # Every packet waiting on the socket, as (data, address)
+    def receive(self):
+        packets = []
+        now = time.perf_counter()
+        while True:
+            try:
+                data, address = self.socket.recvfrom(65536)
+            except BlockingIOError:
+                break
+            except ConnectionError:
+                continue  # An earlier send was refused
+            self.received.setdefault(address, Traffic()).count(len(data), now)
+            packets.append((data, address))
+        return packets
+
+    # Sleep until a packet arrives, a delayed one falls due or timeout seconds pass
+    def wait(self, timeout):
+        if self.delayed:
+            timeout = min(timeout, self.delayed[0][0] - time.perf_counter())
+        if timeout > 0:
+            select.select([self.socket], [], [], timeout)
+
+    def close(self):
+        self.socket.close()
+
+
+# "host", "host:port" or ":port" as an address tuple
+def parse_address(text, default_port=COOP_PORT):
+    host, _, port = text.rpartition(':') if ':' in text else (text, '', '')
+    return socket.gethostbyname(host or '127.0.0.1'), int(port) if port else default_port
+
+
+def quantize(positions):
+    return np.clip(np.rint(np.asarray(positions) * QUANT), -32768, 32767).astype(np.int16)
+
+
+# The state clients get after one tick
+def capture(game):
+    ids = game.enemies.ids
+    order = np.argsort(ids, kind='stable')
+    snapshot = {
+        'state': np.array([game.player_health, game.score, game.game_over, game.game_active,
+                           game.shots_fired, game.kills], dtype=np.int64),
+        'ships': np.array([ship.pos + ship.rotation + ship.velocity + [ship.active] for ship in game.ships],
+                          dtype=np.float64),
+        'terrain': np.array([(segment['base_z'], segment['current_z']) for segment in game.terrain.segments],
+                            dtype=np.float64),
+        'enemy_ids': ids[order].astype(np.int64),
+        'enemies': quantize(game.enemies['pos'][order]),
+    }
+    for name in ENTITY_STORES[1:]:
+        snapshot[name] = quantize(getattr(game, name)['pos'])
+    return snapshot
+
+
+def checksum(snapshot):
+    crc = 0
+    for name in SNAPSHOT_FIELDS:
+        crc = zlib.crc32(snapshot[name].tobytes(), crc)
+    return crc
+
+
+# What each entity of one kind is diffed against: the baseline's entity with the
+# same id for enemies, the same row for the rest, and zeros where there is none
+def reference_rows(snapshot, baseline, name):
+    reference = np.zeros_like(snapshot[name])
+    if baseline is None or len(baseline[name]) == 0:
+        return reference
+    rows = baseline[name]
+    if name == 'enemies':
+        base_ids = baseline['enemy_ids']
+        index = np.minimum(np.searchsorted(base_ids, snapshot['enemy_ids']), len(base_ids) - 1)
+        found = base_ids[index] == snapshot['enemy_ids']
+        reference[found] = rows[index[found]]
+    else:
+        n = min(len(reference), len(rows))
+        reference[:n] = rows[:n]
+    return reference
+
+
+# Bits of a float array XORed with the baseline's, where it has the same shape:
+# values that barely changed keep their sign, exponent and top of the mantissa,
+# which come out as zero bytes. Its own inverse.
+def xor_floats(array, baseline, name):
+    if baseline is None or baseline[name].shape != array.shape:
+        return array
+    return (array.view(np.uint64) ^ baseline[name].view(np.uint64)).view(np.float64)
+
+
+# Snapshot payload, relative to baseline (None for a full snapshot). events are
+# (ticks, origins) of the explosions to send along.
+def encode(snapshot, baseline, events):
+    event_ticks, event_origins = events
+    parts = [
+        np.array([len(snapshot['ships'])] + [len(snapshot[name]) for name in ENTITY_STORES] + [len(event_ticks)],
+                 dtype=np.int32),
+        snapshot['state'] - (0 if baseline is None else baseline['state']),
+        xor_floats(snapshot['ships'], baseline, 'ships'),
+        xor_floats(snapshot['terrain'], baseline, 'terrain'),
+        np.diff(snapshot['enemy_ids'], prepend=0),  # Sorted, so small steps
+    ]
+    for name in ENTITY_STORES:
+        # int16 differences wrap around, and wrap back the same way when decoded.
+        # Transposed so each axis's values sit together, which compresses better.
+        parts.append((snapshot[name] - reference_rows(snapshot, baseline, name)).T)
+    parts += [event_ticks, event_origins.T]
+    return zlib.compress(b''.join(np.ascontiguousarray(part).tobytes() for part in parts), 6)
+
+
+# Inverse of encode(): (snapshot, (event ticks, event origins))
+def decode(payload, baseline):
+    data = zlib.decompress(payload)
+    offset = 0
+
+    def take(dtype, *shape):
+        nonlocal offset
+        array = np.frombuffer(data, dtype, int(np.prod(shape)), offset).reshape(shape)
+        offset += array.nbytes
+        return array
+
+    ships, *counts, events = take(np.int32, 2 + len(ENTITY_STORES)).tolist()
+    snapshot = {
+        'state': take(np.int64, 6) + (0 if baseline is None else baseline['state']),
+        'ships': xor_floats(take(np.float64, ships, SHIP_FLOATS), baseline, 'ships').copy(),
+        'terrain': xor_floats(take(np.float64, 3, 2), baseline, 'terrain').copy(),
+        'enemy_ids': np.cumsum(take(np.int64, counts[0])),
+    }
+    for name, count in zip(ENTITY_STORES, counts):
+        snapshot[name] = take(np.int16, 3, count).T
+        snapshot[name] = snapshot[name] + reference_rows(snapshot, baseline, name)
+    event_ticks = take(np.int64, events)
+    event_origins = take(np.int16, 3, events).T
+    return snapshot, (event_ticks, event_origins)
+
+
+# One connected client and the ship it flies
+class Pilot:
+    def __init__(self, address, index, now):
+        self.address = address
+        self.index = index
+        self.inputs = {}  # sequence -> TickInput, received but not applied yet
+        self.applied = None  # Sequence of the newest input applied (None until the first arrives)
+        self.held = 0
+        self.acked = None  # Newest snapshot tick the client has confirmed
+        self.last_heard = now
+        self.snapshots = 0
+        self.snapshot_bytes = 0
+        self.full_snapshots = 0
+        self.starved = 0  # Ticks the next input hadn't arrived in time
+        self.skipped = 0  # Inputs lost for good or merged into a backlog
+
+    # Store inputs from an INPUT packet (records oldest first, ending at sequence newest)
+    def receive_inputs(self, newest, records):
+        first = newest - len(records) + 1
+        if self.applied is None:
+            self.applied = first - 1
+        for sequence, controls in enumerate(records, first):
+            if sequence > self.applied:
+                self.inputs.setdefault(sequence, controls)
+
+    # The input for this tick: the next in sequence if it has arrived. If not, the
+    # ship keeps the last held keys for a tick and the input is applied once it
+    # turns up. Inputs lost for good (older than any packet still carries) are
+    # skipped; a backlog beyond INPUT_BUFFER (a burst after a stall) is merged
+    # into this tick, shots and all, so the ship doesn't fall further behind.
+    def next_input(self):
+        if self.applied is None:
+            return TickInput()
+        if self.applied + 1 not in self.inputs and self.inputs and max(self.inputs) - self.applied > INPUT_REDUNDANCY:
+            self.skipped += min(self.inputs) - self.applied - 1
+            self.applied = min(self.inputs) - 1
+        controls = self.inputs.pop(self.applied + 1, None)
+        if controls is None:
+            self.starved += 1
+            return TickInput(self.held)
+        self.applied += 1
+        while len(self.inputs) > INPUT_BUFFER and self.applied + 1 in self.inputs:
+            late = self.inputs.pop(self.applied + 1)
+            self.applied += 1
+            self.skipped += 1
+            controls = TickInput(late.held, controls.shots + late.shots, controls.restart or late.restart)
+        self.held = controls.held
+        return controls
+
+
+# The authoritative side: one Game, ticked at sim_rate, with a snapshot sent to
+# every pilot every snapshot_every ticks
+class CoopServer:
+    def __init__(self, port=COOP_PORT, seed=0, sim_rate=60, snapshot_every=1, conditions=None, host=''):
+        self.link = Link((host, port), conditions)
+        self.seed = seed
+        self.sim_rate = sim_rate
+        self.dt = 1 / sim_rate
+        self.snapshot_every = snapshot_every
+        self.game = Game(seed)
+        self.pilots = {}  # address -> Pilot
+        self.tick = 0
+        self.history = {}  # tick -> snapshot, the last HISTORY sent
+        self.events = deque()  # (tick, quantized kill positions) of the last EVENT_TICKS ticks
+        self.full_size = 0  # Latest measurement of a full snapshot's size
+        self.joined = 0
+
+    def start(self):
+        self.game.start(render=False)
+
+    def close(self):
+        self.game.shutdown()
+        self.link.close()
+
+    def receive(self, now):
+        for data, address in self.link.receive():
+            kind = data[:1]
+            pilot = self.pilots.get(address)
+            if kind == HELLO:
+                self.welcome(address, data, now)
+            elif pilot is None:
+                continue
+            elif kind == INPUT and len(data) >= INPUT_PACKET.size:
+                _, acked, newest, count = INPUT_PACKET.unpack_from(data)
+                pilot.last_heard = now
+                if acked != NO_BASELINE:
+                    pilot.acked = acked if pilot.acked is None else max(pilot.acked, acked)
+                else:
+                    pilot.acked = None
+                pilot.receive_inputs(newest, [TickInput.unpack(data, INPUT_PACKET.size + i * RECORD.size)
+                                              for i in range(count)])
+            elif kind == BYE:
+                self.leave(pilot, "left")
+
+    def welcome(self, address, data, now):
+        _, version = HELLO_PACKET.unpack_from(data)
+        if version != PROTOCOL_VERSION:
+            return
+        pilot = self.pilots.get(address)
+        if pilot is None:
+            taken = {pilot.index for pilot in self.pilots.values()}
+            free = [index for index in range(MAX_PILOTS) if index not in taken]
+            if not free:
+                self.link.send(FULL, address)
+                return
+            pilot = Pilot(address, free[0], now)
+            self.game.seat_ship(pilot.index)
+            self.pilots[address] = pilot
+            self.joined += 1
+            log.info("Pilot %d joined from %s:%d", pilot.index + 1, address[0], address[1])
+        self.link.send(WELCOME_PACKET.pack(WELCOME, pilot.index, self.seed, self.sim_rate, self.snapshot_every), address)
+
+    def leave(self, pilot, reason):
+        del self.pilots[pilot.address]
+        self.game.remove_ship(pilot.index)
+        log.info("Pilot %d %s", pilot.index + 1, reason)
+
+    # Explosions after tick `since` (and within EVENT_TICKS), as (ticks, origins)
+    def events_since(self, since):
+        events = [(tick, origins) for tick, origins in self.events if tick > since]
+        if not events:
+            return np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.int16)
+        return (np.concatenate([np.full(len(origins), tick, dtype=np.int64) for tick, origins in events]),
+                np.concatenate([origins for _, origins in events]))
+
+    def step(self):
+        inputs = [TickInput() for _ in self.game.ships]
+        for pilot in self.pilots.values():
+            inputs[pilot.index] = pilot.next_input()
+        self.game.update(self.dt, inputs)
+        self.tick += 1
+        if len(self.game.kill_positions):
+            self.events.append((self.tick, quantize(self.game.kill_positions)))
+        while self.events and self.events[0][0] <= self.tick - EVENT_TICKS:
+            self.events.popleft()
+        if self.tick % self.snapshot_every == 0:
+            self.send_snapshots()
+
+    def send_snapshots(self):
+        snapshot = capture(self.game)
+        self.history[self.tick] = snapshot
+        self.history.pop(self.tick - HISTORY * self.snapshot_every, None)
+        crc = checksum(snapshot)
+        for pilot in self.pilots.values():
+            baseline = self.history.get(pilot.acked)
+            baseline_tick = NO_BASELINE if baseline is None else pilot.acked
+            events = self.events_since(self.tick - EVENT_TICKS if baseline is None else pilot.acked)
+            packet = SNAPSHOT_PACKET.pack(SNAPSHOT, self.tick, baseline_tick, pilot.applied or 0, crc) + \
+                encode(snapshot, baseline, events)
+            self.link.send(packet, pilot.address)
+            pilot.snapshots += 1
+            pilot.snapshot_bytes += len(packet)
+            pilot.full_snapshots += baseline is None
+        if self.tick // self.snapshot_every % FULL_SIZE_SAMPLE == 1:
+            self.full_size = SNAPSHOT_PACKET.size + len(encode(snapshot, None, self.events_since(self.tick)))
+
+    # Tick in real time until `ticks` ticks have run (or forever). until_empty ends
+    # the server once every pilot that joined has left.
+    def run(self, ticks=None, report_every=5.0, until_empty=False):
+        self.start()
+        next_tick = time.perf_counter()
+        next_report = next_tick + report_every
+        while ticks is None or self.tick < ticks:
+            now = time.perf_counter()
+            self.receive(now)
+            if until_empty and self.joined and not self.pilots:
+                break
+            if now >= next_tick:
+                self.step()
+                next_tick += self.dt
+                if now - next_tick > 5 * self.dt:
+                    # Too far behind to catch up: drop the backlog rather than spiral
+                    next_tick = now
+                for pilot in list(self.pilots.values()):
+                    if now - pilot.last_heard > PILOT_TIMEOUT:
+                        self.leave(pilot, "timed out")
+            self.link.flush()
+            if report_every and now >= next_report:
+                log.info("%s", self.report())
+                next_report += report_every
+            self.link.wait(next_tick - time.perf_counter())
+
+    def stats(self):
+        now = time.perf_counter()
+        pilots = []
+        for pilot in sorted(self.pilots.values(), key=lambda pilot: pilot.index):
+            pilots.append({
+                'pilot': pilot.index + 1,
+                'address': pilot.address,
+                'down_bytes_per_second': self.link.sent.get(pilot.address, NO_TRAFFIC).rate(now),
+                'up_bytes_per_second': self.link.received.get(pilot.address, NO_TRAFFIC).rate(now),
+                'snapshots': pilot.snapshots,
+                'full_snapshots': pilot.full_snapshots,
+                'mean_snapshot_bytes': pilot.snapshot_bytes / max(pilot.snapshots, 1),
+                'inputs_starved': pilot.starved,
+                'inputs_skipped': pilot.skipped,
+            })
+        return {'tick': self.tick, 'score': self.game.score, 'health': self.game.player_health,
+                'full_snapshot_bytes': self.full_size, 'dropped': self.link.dropped, 'pilots': pilots}
+
+    def report(self):
+        stats = self.stats()
+        lines = [f"Server tick {stats['tick']}: score {stats['score']}, health {stats['health']}, "
+                 f"full snapshot {stats['full_snapshot_bytes']} B"]
+        for pilot in stats['pilots']:
+            lines.append(f"  pilot {pilot['pilot']}: down {pilot['down_bytes_per_second'] / 1024:.1f} KiB/s, "
+                         f"up {pilot['up_bytes_per_second'] / 1024:.1f} KiB/s, "
+                         f"snapshots {pilot['mean_snapshot_bytes']:.0f} B avg ({pilot['full_snapshots']} full), "
+                         f"inputs late {pilot['inputs_starved']}, skipped {pilot['inputs_skipped']}")
+        return '\n'.join(lines)
+
+
+# Body of a server process (see start_server)
+def run_server(port, seed, sim_rate, snapshot_every=1, latency_ms=0.0, jitter_ms=0.0, loss=0.0,
+               report_every=5.0, until_empty=False):
+    log_listener = start_logging('INFO')
+    conditions = NetworkConditions(latency_ms, jitter_ms, loss) if latency_ms or jitter_ms or loss else None
+    server = CoopServer(port, seed, sim_rate, snapshot_every, conditions)
+    print(f"Co-op server on port {port}, seed {seed}" + (f", {conditions.describe()}" if conditions else ""))
+    try:
+        server.run(report_every=report_every, until_empty=until_empty)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(server.report())
+        server.close()
+        log_listener.stop()
+
+
+def start_server(port, seed, sim_rate, snapshot_every=1, latency_ms=0.0, jitter_ms=0.0, loss=0.0,
+                 report_every=5.0, until_empty=False):
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=run_server, daemon=True, args=(
+        port, seed, sim_rate, snapshot_every, latency_ms, jitter_ms, loss, report_every, until_empty))
+    process.start()
+    return process
+
+
+# Stands in for the Game on a co-op client, like shared_world.WorldView: the
+# newest snapshot's state, with this client's predicted ship as the player's
+# and the other pilots' ships after it in ships. Explosion particles and
+# terrain chunks are made here.
+class CoopView:
+    terrain_speed = Game.terrain_speed
+    particles_per_explosion = Game.particles_per_explosion
+    # How far each kind moves in one original frame, for the previous positions
+    # render() interpolates and draws trails from
+    STEPS = {'enemies': (0, 0, Game.terrain_speed), 'bullets': (0, 0, -Game.bullet_speed),
+             'enemy_bullets': (0, 0, Game.enemy_bullet_speed), 'power_ups': (0, 0, Game.terrain_speed)}
+
+    def __init__(self, seed, index, frames_per_snapshot):
+        self.index = index
+        self.ship = Ship(SHIP_SPAWNS[index])
+        self.ships = [self.ship]
+        self.frames_per_snapshot = frames_per_snapshot
+        self.terrain = TerrainStreamer(generate_terrain_features)
+        self.terrain.seed = seed
+        self.rng = np.random.default_rng(seed)  # Only for particles, which differ between clients anyway
+        self.stores = {name: StoreView() for name in ENTITY_STORES}
+        self.enemies = self.stores['enemies']
+        self.bullets = self.stores['bullets']
+        self.enemy_bullets = self.stores['enemy_bullets']
+        self.power_ups = self.stores['power_ups']
+        self.explosions = ParticlePool()
+        self.player_health = 0
+        self.score = 0
+        self.game_over = False
+        self.game_active = False
+        self.shots_fired = 0
+        self.kills = 0
+        self.new_shots = 0  # Shots and kills in the snapshots applied this frame, for sound cues
+        self.new_kills = 0
+        self.restarted = False
+
+    @property
+    def player_pos(self):
+        return self.ship.pos
+
+    @property
+    def player_rotation(self):
+        return self.ship.rotation
+
+    @property
+    def prev_player_pos(self):
+        return self.ship.prev_pos
+
+    @property
+    def prev_player_rotation(self):
+        return self.ship.prev_rotation
+
+    def start(self):
+        self.terrain.start()
+
+    def shutdown(self):
+        self.terrain.shutdown()
+
+    # Take everything but this client's own ship from a snapshot
+    def apply(self, snapshot):
+        health, score, game_over, game_active, shots_fired, kills = snapshot['state'].tolist()
+        self.restarted = self.restarted or (self.game_over and not game_over)
+        self.new_shots += max(shots_fired - self.shots_fired, 0)
+        self.new_kills += max(kills - self.kills, 0)
+        self.player_health, self.score, self.shots_fired, self.kills = health, score, shots_fired, kills
+        self.game_over, self.game_active = bool(game_over), bool(game_active)
+        others = [row for index, row in enumerate(snapshot['ships']) if index != self.index and row[9]]
+        while len(self.ships) <= len(others):
+            self.ships.append(Ship())
+        del self.ships[1 + len(others):]
+        for ship, row in zip(self.ships[1:], others):
+            ship.prev_pos[:] = ship.pos
+            ship.prev_rotation[:] = ship.rotation
+            ship.pos[:] = row[0:3].tolist()
+            ship.rotation[:] = row[3:6].tolist()
+            ship.velocity[:] = row[6:9].tolist()
+        for name in ENTITY_STORES:
+            store = self.stores[name]
+            pos = snapshot[name] / QUANT
+            store.arrays = {'pos': pos, 'prev_pos': pos - np.multiply(self.STEPS[name], self.frames_per_snapshot)}
+            store.count = len(pos)
+        self.terrain.follow(snapshot['terrain'])
+
+    def explode(self, origins):
+        self.explosions.spawn(origins / QUANT, self.particles_per_explosion, self.rng)
+
+
+# A pilot's end of a co-op game: joins the server at address, sends one input
+# per tick(), predicts its own ship and applies snapshots in poll(). view is the
+# CoopView to draw.
+class CoopClient:
+    def __init__(self, address, conditions=None, timeout=5.0):
+        self.server = address
+        self.link = Link(('', 0), conditions)
+        self.join(timeout)
+        self.frames = 60 / self.sim_rate  # Original frames per tick
+        self.view = CoopView(self.seed, self.index, self.frames * self.snapshot_every)
+        self.ship = self.view.ship
+        self.sequence = 0
+        self.inputs = {}  # sequence -> TickInput the server hasn't applied yet
+        self.predicted = {}  # sequence -> predicted position after it, to measure corrections
+        self.snapshots = {}  # tick -> decoded snapshot, the last HISTORY
+        self.acked = None  # Newest snapshot tick decoded
+        self.event_tick = 0  # Newest tick whose explosions have been spawned
+        self.received = 0
+        self.stale = 0  # Snapshots that arrived after a newer one
+        self.missing_baselines = 0
+        self.bad_checksums = 0
+        self.corrections = deque(maxlen=600)  # Distance between predicted and server ship, per snapshot
+
+    def join(self, timeout):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            self.link.send(HELLO_PACKET.pack(HELLO, PROTOCOL_VERSION), self.server)
+            retry = min(time.perf_counter() + 0.25, deadline)
+            while time.perf_counter() < retry:
+                self.link.wait(retry - time.perf_counter())
+                self.link.flush()
+                for data, address in self.link.receive():
+                    if address != self.server:
+                        continue
+                    if data[:1] == WELCOME:
+                        _, self.index, self.seed, self.sim_rate, self.snapshot_every = WELCOME_PACKET.unpack_from(data)
+                        return
+                    if data[:1] == FULL:
+                        raise ConnectionError(f"{self.server[0]}:{self.server[1]} already has {MAX_PILOTS} pilots")
+        raise ConnectionError(f"No co-op server answered at {self.server[0]}:{self.server[1]}")
+
+    def close(self):
+        self.link.send(BYE, self.server)
+        deadline = time.perf_counter() + 1.0
+        while self.link.delayed and time.perf_counter() < deadline:
+            self.link.wait(deadline - time.perf_counter())
+            self.link.flush()
+        self.link.close()
+
+    # One client tick: send the input, then fly our ship with it ahead of the server
+    def tick(self, controls):
+        self.sequence += 1
+        self.inputs[self.sequence] = controls
+        first = max(self.sequence - INPUT_REDUNDANCY + 1, min(self.inputs))
+        self.link.send(INPUT_PACKET.pack(INPUT, NO_BASELINE if self.acked is None else self.acked, self.sequence,
+                                         self.sequence - first + 1) +
+                       b''.join(self.inputs[sequence].pack() for sequence in range(first, self.sequence + 1)),
+                       self.server)
+        if self.view.game_active:
+            self.fly(self.ship, controls)
+        self.predicted[self.sequence] = list(self.ship.pos)
+        self.view.explosions.update(self.frames)
+
+    # Apply the snapshots that arrived since the last poll; call once per frame
+    def poll(self):
+        view = self.view
+        view.new_shots = view.new_kills = 0
+        view.restarted = False
+        for data, address in self.link.receive():
+            if address == self.server and data[:1] == SNAPSHOT:
+                self.receive_snapshot(data)
+        self.link.flush()
+
+    def receive_snapshot(self, data):
+        _, tick, baseline_tick, applied, crc = SNAPSHOT_PACKET.unpack_from(data)
+        if tick in self.snapshots:
+            return
+        baseline = None
+        if baseline_tick != NO_BASELINE:
+            baseline = self.snapshots.get(baseline_tick)
+            if baseline is None:
+                self.missing_baselines += 1
+                return
+        snapshot, (event_ticks, event_origins) = decode(data[SNAPSHOT_PACKET.size:], baseline)
+        if checksum(snapshot) != crc:
+            # Decoded against the wrong baseline: ask for a full snapshot
+            self.bad_checksums += 1
+            self.acked = None
+            return
+        self.received += 1
+        self.snapshots[tick] = snapshot
+        for old in [old for old in self.snapshots if old <= tick - HISTORY * self.snapshot_every]:
+            del self.snapshots[old]
+        new_events = event_ticks > self.event_tick
+        if new_events.any():
+            self.view.explode(event_origins[new_events])
+            self.event_tick = int(event_ticks.max())
+        if self.acked is not None and tick < self.acked:
+            self.stale += 1
+            return
+        self.acked = tick
+        self.view.apply(snapshot)
+        self.reconcile(snapshot['ships'][self.index], applied)
+
+    # Snap our ship to the server's state after input `applied`, then fly the
+    # inputs the server hasn't applied yet on top of it
+    def reconcile(self, state, applied):
+        predicted = self.predicted.get(applied)
+        if predicted is not None:
+            self.corrections.append(float(np.linalg.norm(state[0:3] - predicted)))
+        for sequence in [sequence for sequence in self.inputs if sequence <= applied]:
+            del self.inputs[sequence]
+            self.predicted.pop(sequence, None)
+        ship = self.ship
+        ship.pos[:] = state[0:3].tolist()
+        ship.rotation[:] = state[3:6].tolist()
+        ship.velocity[:] = state[6:9].tolist()
+        if self.view.game_active:
+            for sequence in range(applied + 1, self.sequence + 1):
+                self.fly(ship, self.inputs[sequence])
+                self.predicted[sequence] = list(ship.pos)
+
+    # Fly our ship one tick as the server will, over the ground as last received
+    def fly(self, ship, controls):
+        fly(ship, controls, self.frames)
+        land(ship, float(self.view.terrain.height_at(ship.pos[0], ship.pos[2])) + SHIP_CLEARANCE)
+
+    def stats(self):
+        now = time.perf_counter()
+        sent = self.link.sent.get(self.server, NO_TRAFFIC)
+        received = self.link.received.get(self.server, NO_TRAFFIC)
+        return {
+            'pilot': self.index + 1,
+            'snapshots': self.received,
+            'stale': self.stale,
+            'missing_baselines': self.missing_baselines,
+            'bad_checksums': self.bad_checksums,
+            'down_bytes': received.bytes,
+            'up_bytes': sent.bytes,
+            'down_bytes_per_second': received.rate(now),
+            'up_bytes_per_second': sent.rate(now),
+            'inputs_in_flight': len(self.inputs),
+            'correction_mean': float(np.mean(self.corrections)) if self.corrections else 0.0,
+            'correction_max': max(self.corrections, default=0.0),
+        }
+
+    # One line for the profiler overlay
+    def summary(self):
+        stats = self.stats()
+        return (f"co-op pilot {stats['pilot']}  down {stats['down_bytes_per_second'] / 1024:.1f} KiB/s  "
+                f"up {stats['up_bytes_per_second'] / 1024:.1f} KiB/s  {stats['inputs_in_flight']} inputs in flight")
+
+
+# Loopback soak: a server process and `pilots` autopiloted clients in this
+# process for `seconds`, all sending through the given conditions. Returns the
+# clients' stats.
+def run_loopback(seconds=10.0, pilots=2, port=COOP_PORT, seed=0, sim_rate=60, snapshot_every=1,
+                 latency_ms=0.0, jitter_ms=0.0, loss=0.0):
+    server = start_server(port, seed, sim_rate, snapshot_every, latency_ms, jitter_ms, loss,
+                          report_every=0, until_empty=True)
+    clients = []
+    try:
+        for index in range(pilots):
+            clients.append(CoopClient(('127.0.0.1', port), NetworkConditions(latency_ms, jitter_ms, loss, seed + index)))
+            clients[-1].view.start()
+        dt = 1 / sim_rate
+        start = next_tick = time.perf_counter()
+        tick = 0
+        while time.perf_counter() - start < seconds:
+            for client in clients:
+                client.poll()
+            if time.perf_counter() >= next_tick:
+                for index, client in enumerate(clients):
+                    client.tick(autopilot(client.view, tick + 5 * index))
+                tick += 1
+                next_tick += dt
+            time.sleep(max(min(next_tick - time.perf_counter(), 0.001), 0))
+        elapsed = time.perf_counter() - start
+        stats = [client.stats() for client in clients]
+        for client_stats in stats:
+            client_stats['mean_down_bytes_per_second'] = client_stats['down_bytes'] / elapsed
+            client_stats['mean_up_bytes_per_second'] = client_stats['up_bytes'] / elapsed
+        return stats
+    finally:
+        for client in clients:
+            client.close()
+            client.view.shutdown()
+        server.join(timeout=5)
+        if server.is_alive():
+            server.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Co-op server and loopback test")
+    commands = parser.add_subparsers(dest='command', required=True)
+    server = commands.add_parser('server', help="run a co-op server")
+    test = commands.add_parser('test', help="run a server and autopiloted clients over loopback")
+    for command in (server, test):
+        command.add_argument('--port', type=int, default=COOP_PORT)
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--rate', type=int, default=60, help="simulation ticks per second")
+        command.add_argument('--snapshot-every', type=int, default=1, help="ticks between snapshots")
+        command.add_argument('--latency', type=float, default=0.0, metavar='MS', help="simulated one-way latency")
+        command.add_argument('--jitter', type=float, default=0.0, metavar='MS', help="simulated latency jitter")
+        command.add_argument('--loss', type=float, default=0.0, help="simulated packet loss (0-1)")
+    test.add_argument('--seconds', type=float, default=10.0)
+    test.add_argument('--pilots', type=int, default=MAX_PILOTS)
+    args = parser.parse_args()
+
+    if args.command == 'server':
+        run_server(args.port, args.seed, args.rate, args.snapshot_every, args.latency, args.jitter, args.loss)
+        return
+    conditions = NetworkConditions(args.latency, args.jitter, args.loss)
+    print(f"Loopback co-op test: {args.pilots} pilot(s) for {args.seconds:g}s, {conditions.describe()} each way")
+    for stats in run_loopback(args.seconds, args.pilots, args.port, args.seed, args.rate, args.snapshot_every,
+                              args.latency, args.jitter, args.loss):
+        print(f"Pilot {stats['pilot']}: {stats['snapshots']} snapshots ({stats['stale']} stale, "
+              f"{stats['missing_baselines']} without baseline, {stats['bad_checksums']} bad checksums), "
+              f"down {stats['mean_down_bytes_per_second'] / 1024:.2f} KiB/s, "
+              f"up {stats['mean_up_bytes_per_second'] / 1024:.2f} KiB/s, "
+              f"prediction correction {stats['correction_mean']:.4f} avg / {stats['correction_max']:.4f} max")
+
+
+if __name__ == '__main__':
+    main()
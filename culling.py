@@ -0,0 +1,80 @@
+import numpy as np
+
+
+# The same matrices gluPerspective and glTranslatef build, so the frustum can be
+# worked out on the CPU without reading GL state back
+def perspective_matrix(fovy, aspect, near, far):
+    f = 1 / np.tan(np.radians(fovy) / 2)
+    return np.array([
+        [f / aspect, 0, 0, 0],
+        [0, f, 0, 0],
+        [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+        [0, 0, -1, 0],
+    ])
+
+
+def translation_matrix(x, y, z):
+    matrix = np.eye(4)
+    matrix[:3, 3] = (x, y, z)
+    return matrix
+
+
+# The six clipping planes of a projection * view matrix, in world space.
+#
+# Every test takes arrays of bounding volumes and returns a visibility mask,
+# so culling a whole entity store costs one matrix product. Volumes that
+# straddle a plane count as visible; only ones wholly outside are culled.
+class Frustum:
+    def __init__(self, matrix, eye):
+        m = np.asarray(matrix, dtype=np.float64)
+        planes = np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+        planes /= np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+        self.normals = planes[:, :3]
+        self.offsets = planes[:, 3]
+        self.eye = np.asarray(eye, dtype=np.float64)
+
+    # Spheres at centers (N, 3) with radius (scalar or (N,))
+    def spheres_visible(self, centers, radius):
+        distances = np.asarray(centers).reshape(-1, 3) @ self.normals.T + self.offsets
+        return np.all(distances >= -np.reshape(radius, (-1, 1)), axis=1)
+
+    # Axis-aligned boxes from lo (N, 3) to hi (N, 3): a box is outside a plane
+    # when even its corner furthest along the plane normal is behind it
+    def boxes_visible(self, lo, hi):
+        lo = np.asarray(lo).reshape(-1, 1, 3)
+        hi = np.asarray(hi).reshape(-1, 1, 3)
+        corners = np.where(self.normals > 0, hi, lo)  # (N, 6, 3)
+        distances = np.einsum('npk,pk->np', corners, self.normals) + self.offsets
+        return np.all(distances >= 0, axis=1)
+
+    # Squared distance from the eye, for picking a level of detail
+    def distance_squared(self, points):
+        offsets = np.asarray(points).reshape(-1, 3) - self.eye
+        return np.einsum('nk,nk->n', offsets, offsets)
+
+
+# Culling counts: frame_stats covers the last rendered frame and total_stats
+# everything since it was last cleared. Each entry maps a drawable kind to
+# {'total', 'culled', 'lod'}.
+frame_stats = {}
+total_stats = {}
+
+
+def record(kind, total, visible, lod=0):
+    culled = total - visible
+    for stats in (frame_stats, total_stats):
+        entry = stats.setdefault(kind, {'total': 0, 'culled': 0, 'lod': 0})
+        entry['total'] += total
+        entry['culled'] += culled
+        entry['lod'] += lod
+
+
+def begin_frame():
+    frame_stats.clear()
+
+
+# One line per kind, e.g. "enemies 12/40 culled, 8 lod"
+def summary(stats=None):
+    stats = frame_stats if stats is None else stats
+    return [f"{kind} {entry['culled']}/{entry['total']} culled, {entry['lod']} lod"
+            for kind, entry in stats.items()]
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+# Structure-of-arrays storage for one kind of game entity.
+#
+# Each field is a preallocated NumPy array (width 0 means one scalar per
+# entity) and the live entities are always packed into the first `count` rows,
+# so a field view like store['pos'] can be updated with whole-array operations.
+# Capacity doubles when it runs out. Removal marks rows dead in the `alive`
+# mask and compact() fills the holes by swapping in rows from the end, so
+# entity order is not preserved.
+#
+# Since rows move, a store created with track_ids=True also gives every entity
+# a stable id: store.ids holds the id in each live row and rows_of() maps ids
+# back to their current rows (-1 once the entity is gone).
+class EntityStore:
+    def __init__(self, fields, capacity=64, dtype=np.float64, track_ids=False):
+        self.fields = dict(fields)
+        self.dtype = dtype
+        self.capacity = capacity
+        self.count = 0
+        self.arrays = {name: self.allocate(width, capacity) for name, width in self.fields.items()}
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.track_ids = track_ids
+        self.id_array = np.zeros(capacity, dtype=np.int64)
+        self.row_of_id = {}  # id -> row, for live entities
+        self.next_id = 0
+
+    def allocate(self, width, capacity):
+        shape = (capacity, width) if width else (capacity,)
+        return np.zeros(shape, dtype=self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    # View of the live rows of one field; writes go straight into the store
+    def __getitem__(self, name):
+        return self.arrays[name][:self.count]
+
+    # Exchange the backing arrays of two fields of the same width. Double-buffers a
+    # field without copying: swap 'pos' and 'prev_pos', then write the new
+    # positions into 'pos' from 'prev_pos'.
+    def swap(self, a, b):
+        self.arrays[a], self.arrays[b] = self.arrays[b], self.arrays[a]
+
+    # Ids of the live rows, in row order
+    @property
+    def ids(self):
+        return self.id_array[:self.count]
+
+    # Current rows of the given ids, with -1 for entities that have been removed
+    def rows_of(self, ids):
+        return np.array([self.row_of_id.get(entity_id, -1) for entity_id in ids], dtype=np.int64)
+
+    # Hand out ids for the n rows starting at start
+    def assign_ids(self, start, n):
+        if not self.track_ids:
+            return
+        ids = np.arange(self.next_id, self.next_id + n)
+        self.id_array[start:start + n] = ids
+        self.row_of_id.update(zip(ids.tolist(), range(start, start + n)))
+        self.next_id += n
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for name, width in self.fields.items():
+            grown = self.allocate(width, capacity)
+            grown[:self.count] = self.arrays[name][:self.count]
+            self.arrays[name] = grown
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.count] = self.alive[:self.count]
+        self.alive = alive
+        id_array = np.zeros(capacity, dtype=np.int64)
+        id_array[:self.count] = self.id_array[:self.count]
+        self.id_array = id_array
+        self.capacity = capacity
+
+    # Append one entity; fields not given start at zero. Returns its row.
+    def add(self, **values):
+        index = self.count
+        self.reserve(index + 1)
+        for name in self.fields:
+            self.arrays[name][index] = values.get(name, 0)
+        self.alive[index] = True
+        self.assign_ids(index, 1)
+        self.count += 1
+        return index
+
+    # Append n entities at once; each value broadcasts against n rows. Returns the first new row.
+    def extend(self, n, **values):
+        start = self.count
+        self.reserve(start + n)
+        for name in self.fields:
+            self.arrays[name][start:start + n] = values.get(name, 0)
+        self.alive[start:start + n] = True
+        self.assign_ids(start, n)
+        self.count += n
+        return start
+
+    # Mark rows dead (a boolean mask over the live rows, or row indices)
+    def kill(self, which):
+        self.alive[:self.count][which] = False
+
+    # Swap-remove every dead row in one pass: live rows from the tail are
+    # moved into the holes left in the head
+    def compact(self):
+        alive = self.alive[:self.count]
+        remaining = int(np.count_nonzero(alive))
+        if remaining == self.count:
+            return
+        holes = np.flatnonzero(~alive[:remaining])
+        movers = remaining + np.flatnonzero(alive[remaining:])
+        if self.track_ids:
+            for entity_id in self.id_array[:self.count][~alive].tolist():
+                del self.row_of_id[entity_id]
+            self.id_array[holes] = self.id_array[movers]
+            self.row_of_id.update(zip(self.id_array[holes].tolist(), holes.tolist()))
+        for array in self.arrays.values():
+            array[holes] = array[movers]
+        self.alive[holes] = True
+        self.count = remaining
+
+    def remove(self, which):
+        self.kill(which)
+        self.compact()
+
+    def clear(self):
+        self.count = 0
+        self.row_of_id.clear()
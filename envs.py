@@ -0,0 +1,243 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pygame
+
+from replay import CONTROL_KEYS, KEY_BITS, TickInput
+from simulation import Game
+
+# Many independent games stepped together, for bots, soak tests and tuning runs.
+#
+# An action is an int: the low bits are the held control keys in replay.CONTROL_KEYS
+# order (the same bits an input log stores) and FIRE_BIT fires one shot. An
+# observation is a float32 vector: the player's position, velocity, rotation
+# and health, then the nearest enemies, enemy bullets and power-ups as
+# (dx, dy, dz, present) slots relative to the player, nearest first and
+# zero-padded. The reward for a tick is kills (score / 100) plus the change in
+# health. A game that ends is reset straight away and its final score reported.
+#
+#   python envs.py --envs 64 --ticks 5000               # soak run across every core
+#   python envs.py --envs 8 --workers 0 --policy random  # everything in this process
+
+FIRE_BIT = 1 << len(CONTROL_KEYS)
+ACTION_COUNT = FIRE_BIT << 1  # Every combination of held keys, with and without a shot
+NEAREST = (('enemies', 8), ('enemy_bullets', 8), ('power_ups', 2))
+PLAYER_FEATURES = 10  # Position, velocity, rotation, health
+OBSERVATION_SIZE = PLAYER_FEATURES + 4 * sum(count for _, count in NEAREST)
+
+
+def action_input(action):
+    action = int(action)
+    return TickInput(action & (FIRE_BIT - 1), shots=1 if action & FIRE_BIT else 0)
+
+
+# Write the observation of one game into out (a row of OBSERVATION_SIZE floats)
+def observe(game, out):
+    player = np.asarray(game.player_pos, dtype=np.float64)
+    out[0:3] = player
+    out[3:6] = game.player_velocity
+    out[6:9] = game.player_rotation
+    out[9] = game.player_health
+    start = PLAYER_FEATURES
+    for name, count in NEAREST:
+        slots = out[start:start + 4 * count].reshape(count, 4)
+        slots[:] = 0
+        offsets = getattr(game, name)['pos'] - player
+        if len(offsets):
+            nearest = np.argsort(np.einsum('nk,nk->n', offsets, offsets), kind='stable')[:count]
+            slots[:len(nearest), :3] = offsets[nearest]
+            slots[:len(nearest), 3] = 1
+        start += 4 * count
+
+
+# A list of games stepped one after another in this process. Each game is seeded
+# on its own, so its run depends only on its seed and actions, never on which
+# worker it landed on. max_ticks, if set, ends a game that runs that long.
+class GameBatch:
+    def __init__(self, seeds, dt=1 / 60, max_ticks=None):
+        self.games = [Game(seed) for seed in seeds]
+        for game in self.games:
+            game.start(render=False)
+        self.dt = dt
+        self.max_ticks = max_ticks
+        self.ticks = np.zeros(len(self.games), dtype=np.int64)
+
+    def observations(self):
+        observations = np.empty((len(self.games), OBSERVATION_SIZE), dtype=np.float32)
+        for game, out in zip(self.games, observations):
+            observe(game, out)
+        return observations
+
+    def reset(self):
+        for game in self.games:
+            game.reset()
+        self.ticks[:] = 0
+        return self.observations()
+
+    # Returns (observations, rewards, dones, infos); infos has a dict for every game
+    # that ended this tick ({'score', 'ticks', 'truncated'}) and None for the rest
+    def step(self, actions):
+        rewards = np.empty(len(self.games), dtype=np.float32)
+        dones = np.zeros(len(self.games), dtype=bool)
+        infos = [None] * len(self.games)
+        for i, (game, action) in enumerate(zip(self.games, actions)):
+            score, health = game.score, game.player_health
+            game.update(self.dt, action_input(action))
+            self.ticks[i] += 1
+            rewards[i] = (game.score - score) / 100 + (game.player_health - health)
+            truncated = self.max_ticks is not None and self.ticks[i] >= self.max_ticks
+            if game.game_over or truncated:
+                dones[i] = True
+                infos[i] = {'score': game.score, 'ticks': int(self.ticks[i]), 'truncated': not game.game_over}
+                game.reset()
+                self.ticks[i] = 0
+        return self.observations(), rewards, dones, infos
+
+    def close(self):
+        for game in self.games:
+            game.shutdown()
+
+
+# Worker process: hosts one GameBatch and answers (command, data) messages until told to close
+def run_worker(connection, seeds, dt, max_ticks):
+    batch = GameBatch(seeds, dt, max_ticks)
+    try:
+        while True:
+            command, data = connection.recv()
+            if command == 'step':
+                connection.send(batch.step(data))
+            elif command == 'reset':
+                connection.send(batch.reset())
+            elif command == 'close':
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        batch.close()
+        connection.close()
+
+
+# count games seeded seed, seed + 1, ... split across a pool of worker processes.
+#
+# Each step sends every worker its slice of the actions at once and then
+# collects the results, so the workers simulate in parallel. workers defaults to
+# one per core; workers=0 runs every game in this process. Workers are started
+# with 'spawn', so a script that creates a VectorEnv needs the usual
+# `if __name__ == '__main__':` guard.
+class VectorEnv:
+    def __init__(self, count, seed=0, workers=None, dt=1 / 60, max_ticks=None):
+        self.count = count
+        seeds = [seed + i for i in range(count)]
+        workers = min(os.cpu_count() or 1, count) if workers is None else min(workers, count)
+        self.local = None
+        self.connections = []
+        self.processes = []
+        if workers == 0:
+            self.local = GameBatch(seeds, dt, max_ticks)
+            self.bounds = [0, count]
+            return
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        context = multiprocessing.get_context('spawn')
+        chunks = np.array_split(np.array(seeds), workers)
+        self.bounds = np.cumsum([0] + [len(chunk) for chunk in chunks]).tolist()
+        for chunk in chunks:
+            parent, child = context.Pipe()
+            process = context.Process(target=run_worker, args=(child, chunk.tolist(), dt, max_ticks), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        if self.local is not None:
+            return self.local.reset()
+        for connection in self.connections:
+            connection.send(('reset', None))
+        return np.concatenate([connection.recv() for connection in self.connections])
+
+    # actions: one int per game. Returns (observations (count, OBSERVATION_SIZE),
+    # rewards (count,), dones (count,), infos (list of count))
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64)
+        if self.local is not None:
+            return self.local.step(actions)
+        for connection, start, end in zip(self.connections, self.bounds, self.bounds[1:]):
+            connection.send(('step', actions[start:end]))
+        results = [connection.recv() for connection in self.connections]
+        observations, rewards, dones, infos = zip(*results)
+        return (np.concatenate(observations), np.concatenate(rewards), np.concatenate(dones),
+                [info for chunk in infos for info in chunk])
+
+    def close(self):
+        if self.local is not None:
+            self.local.close()
+            self.local = None
+        for connection in self.connections:
+            try:
+                connection.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Scripted policy for soak runs, worked out for the whole batch at once: line up
+# with the nearest enemy and fire every tenth tick
+def chase_policy(observations, tick):
+    enemy = observations[:, PLAYER_FEATURES:PLAYER_FEATURES + 4]
+    present = enemy[:, 3] > 0
+    actions = np.zeros(len(observations), dtype=np.int64)
+    actions |= np.where(present & (enemy[:, 0] < -0.2), KEY_BITS[pygame.K_LEFT], 0)
+    actions |= np.where(present & (enemy[:, 0] > 0.2), KEY_BITS[pygame.K_RIGHT], 0)
+    actions |= np.where(present & (enemy[:, 1] < -0.2), KEY_BITS[pygame.K_DOWN], 0)
+    actions |= np.where(present & (enemy[:, 1] > 0.2), KEY_BITS[pygame.K_UP], 0)
+    if tick % 10 == 0:
+        actions |= FIRE_BIT
+    return actions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step many headless games in parallel")
+    parser.add_argument('--envs', type=int, default=os.cpu_count() or 1, help="number of games")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per core, 0 = none)")
+    parser.add_argument('--ticks', type=int, default=2000, help="ticks to step every game")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first game (the rest count up from it)")
+    parser.add_argument('--policy', choices=['chase', 'random'], default='chase')
+    parser.add_argument('--max-ticks', type=int, help="end a game after this many ticks")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with VectorEnv(args.envs, args.seed, args.workers, max_ticks=args.max_ticks) as env:
+        observations = env.reset()
+        scores = []
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            if args.policy == 'chase':
+                actions = chase_policy(observations, tick)
+            else:
+                actions = rng.integers(0, ACTION_COUNT, len(env))
+            observations, rewards, dones, infos = env.step(actions)
+            scores.extend(info['score'] for info in infos if info)
+        elapsed = time.perf_counter() - start
+    total = args.envs * args.ticks
+    print(f"{total} ticks across {args.envs} games in {elapsed:.2f}s ({total / elapsed:.0f} ticks/s)")
+    if scores:
+        print(f"{len(scores)} game(s) finished, mean score {np.mean(scores):.0f}, best {max(scores)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import logging
+import time
+from collections import deque
+
+import numpy as np
+
+log = logging.getLogger('starfox')  # Queued to a writer thread once audio.start_logging() has run
+
+# Quality levels, best first. Every level sets all three knobs:
+#   particles_drawn   explosion particles drawn out of each explosion's particles_per_explosion
+#   terrain_density   fraction of the hills and trees kept in newly generated terrain chunks
+#   draw_distance     distance from the camera beyond which nothing is drawn
+QUALITY_LEVELS = [
+    {'name': 'high', 'particles_drawn': 10, 'terrain_density': 1.0, 'draw_distance': 50},
+    {'name': 'medium', 'particles_drawn': 6, 'terrain_density': 0.7, 'draw_distance': 42},
+    {'name': 'low', 'particles_drawn': 3, 'terrain_density': 0.4, 'draw_distance': 35},
+    {'name': 'minimal', 'particles_drawn': 1, 'terrain_density': 0.2, 'draw_distance': 28},
+]
+
+
+# Holds the frame time inside a budget by stepping through QUALITY_LEVELS.
+#
+# observe() takes each frame's measured time. The governor averages the last
+# `window` frames and acts on that average with hysteresis:
+# - It drops a level once the average has been over target * over for
+#   downgrade_frames frames in a row.
+# - It climbs back only after upgrade_frames frames under target * under.
+# - Nothing changes for `cooldown` frames after a switch, so the average
+#   can settle at the new level.
+# If a level it climbed to has to be dropped again before the next climb would
+# have been allowed, the wait before climbing doubles (up to max_backoff
+# times), so a level that can't be held stops being retried every few seconds.
+#
+# apply(level) is called with the level's dict whenever the level changes
+# (and once at the start). A locked governor never changes level on its own.
+class QualityGovernor:
+    def __init__(self, apply, levels=QUALITY_LEVELS, target_ms=1000 / 60, window=30,
+                 over=1.1, under=0.75, downgrade_frames=20, upgrade_frames=180, cooldown=60, max_backoff=8):
+        self.apply = apply
+        self.levels = levels
+        self.target_ms = target_ms
+        self.frame_ms = deque(maxlen=window)
+        self.over = over
+        self.under = under
+        self.downgrade_frames = downgrade_frames
+        self.upgrade_frames = upgrade_frames
+        self.cooldown = cooldown
+        self.max_backoff = max_backoff
+        self.locked = False
+        self.index = 0
+        self.frame = 0
+        self.streak = 0  # Consecutive frames over (positive) or under (negative) the band
+        self.quiet_until = 0
+        self.upgrade_wait = upgrade_frames
+        self.last_upgrade = None
+        self.changes = deque(maxlen=50)
+        self.apply(self.level)
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    # Switch to the level at index, recording why
+    def set_level(self, index, reason):
+        index = max(0, min(index, len(self.levels) - 1))
+        if index == self.index:
+            return False
+        self.changes.append({'frame': self.frame, 'time': time.time(), 'from': self.level['name'],
+                             'to': self.levels[index]['name'], 'frame_ms': self.average(), 'reason': reason})
+        log.info("Quality %s -> %s: %s", self.level['name'], self.levels[index]['name'], reason)
+        self.index = index
+        self.streak = 0
+        self.quiet_until = self.frame + self.cooldown
+        self.frame_ms.clear()
+        self.apply(self.level)
+        return True
+
+    # Pin a level (by name) and stop adapting
+    def lock(self, name):
+        index = [level['name'] for level in self.levels].index(name)
+        self.set_level(index, "locked")
+        self.locked = True
+
+    def average(self):
+        return float(np.mean(self.frame_ms)) if self.frame_ms else 0.0
+
+    # Feed one frame's time in milliseconds; returns True if the level changed
+    def observe(self, frame_ms):
+        self.frame += 1
+        self.frame_ms.append(frame_ms)
+        if self.locked or self.frame < self.quiet_until or len(self.frame_ms) < self.frame_ms.maxlen:
+            return False
+        average = self.average()
+        if average > self.target_ms * self.over:
+            self.streak = max(self.streak, 0) + 1
+        elif average < self.target_ms * self.under:
+            self.streak = min(self.streak, 0) - 1
+        else:
+            self.streak = 0
+
+        if self.streak >= self.downgrade_frames and self.index < len(self.levels) - 1:
+            if self.last_upgrade is not None and self.frame - self.last_upgrade < self.upgrade_wait:
+                self.upgrade_wait = min(self.upgrade_wait * 2, self.upgrade_frames * self.max_backoff)
+            return self.set_level(self.index + 1, f"frame time {average:.1f} ms over the {self.target_ms:.1f} ms "
+                                                  f"budget for {self.downgrade_frames} frames")
+        if -self.streak >= self.upgrade_wait and self.index > 0:
+            self.last_upgrade = self.frame
+            return self.set_level(self.index - 1, f"frame time {average:.1f} ms, headroom under the "
+                                                  f"{self.target_ms:.1f} ms budget for {self.upgrade_wait} frames")
+        return False
+
+    def stats(self):
+        return {
+            'level': self.level['name'],
+            'index': self.index,
+            'knobs': {name: value for name, value in self.level.items() if name != 'name'},
+            'locked': self.locked,
+            'target_ms': self.target_ms,
+            'frame_ms': self.average(),
+            'upgrade_wait': self.upgrade_wait,
+            'changes': list(self.changes),
+        }
+
+    # One line for the profiler overlay
+    def summary(self):
+        return f"quality {self.level['name']}{' (locked)' if self.locked else ''}  {self.average():.1f}/{self.target_ms:.1f} ms"
@@ -0,0 +1,105 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from OpenGL.GL import *
+
+import shader_renderer
+
+log = logging.getLogger('starfox')
+
+
+# One entry in the asset manifest.
+#
+# load(path) runs on a worker thread and must not touch GL or game state; it
+# does the slow part (reading and decoding). apply(value) runs on the main
+# thread once the load finishes, and apply(None) if it failed in any way (a
+# missing file, a parse error, malformed data), so a bad asset falls back to its
+# placeholder instead of breaking the frame loop. Gameplay waits
+# for the required assets only; optional ones are swapped in whenever they
+# are ready.
+class Asset:
+    def __init__(self, name, path, load, apply, required=True):
+        self.name = name
+        self.path = path
+        self.load = load
+        self.apply = apply
+        self.required = required
+        self.future = None
+        self.applied = False
+        self.seconds = None  # Load time on the worker
+        self.error = None
+
+
+# Loads a manifest of assets in parallel on a thread pool
+class AssetLoader:
+    def __init__(self, manifest, workers=4):
+        self.assets = list(manifest)
+        self.workers = workers
+        self.executor = None
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='assets')
+        for asset in self.assets:
+            asset.future = self.executor.submit(self.timed_load, asset)
+
+    @staticmethod
+    def timed_load(asset):
+        start = time.perf_counter()
+        try:
+            return asset.load(asset.path)
+        finally:
+            asset.seconds = time.perf_counter() - start
+
+    # Apply every asset that finished since the last poll; call once per frame
+    def poll(self):
+        for asset in self.assets:
+            if asset.applied or not asset.future.done():
+                continue
+            try:
+                value = asset.future.result()
+            except Exception as e:
+                log.warning("Loading %s from %s failed: %s", asset.name, asset.path, e,
+                            exc_info=not isinstance(e, OSError))
+                asset.error = e
+                value = None
+            asset.apply(value)
+            asset.applied = True
+        if self.done() and self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def required_ready(self):
+        return all(asset.applied for asset in self.assets if asset.required)
+
+    def done(self):
+        return all(asset.applied for asset in self.assets)
+
+    def progress(self):
+        return sum(asset.applied for asset in self.assets), len(self.assets)
+
+    # Per-asset load times and failures, slowest first
+    def report(self):
+        lines = []
+        for asset in sorted(self.assets, key=lambda asset: -(asset.seconds or 0)):
+            status = 'pending' if asset.seconds is None else f"{asset.seconds * 1000:.1f} ms"
+            if asset.error is not None:
+                status += f" (failed: {asset.error})"
+            lines.append(f"  {asset.name:<12} {status}{'' if asset.required else ' [optional]'}")
+        return '\n'.join(lines)
+
+
+# Loading screen: a progress bar across the middle of the window with a caption above it
+def draw_loading_screen(text_renderer, viewport, fraction, caption):
+    glClearColor(0, 0, 0, 1)
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    width, height = viewport[0] * 0.6, 20
+    x0, y0 = (viewport[0] - width) / 2, viewport[1] / 2 - height / 2
+    for bar_width, color in ((width, (0.2, 0.2, 0.2)), (width * fraction, (0.2, 0.4, 0.8))):
+        shader_renderer.draw_2d(GL_TRIANGLES, [
+            (x0, y0), (x0 + bar_width, y0), (x0 + bar_width, y0 + height),
+            (x0, y0), (x0 + bar_width, y0 + height), (x0, y0 + height)
+        ], color, viewport)
+    text_renderer.draw(caption, int(x0), int(y0 + height + 10), (255, 255, 255), viewport)
@@ -0,0 +1,272 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+from profiler import count_draw
+
+# Bytes per interleaved vertex: RGB color followed by XYZ position, both float32
+COLOR_VERTEX_STRIDE = 6 * 4
+
+
+# Split a flat list of quad corners (a, b, c, d, ...) into triangles (a, b, c), (a, c, d)
+def quads_to_triangles(vertices):
+    quads = np.asarray(vertices, dtype=np.float32).reshape(-1, 4, 3)
+    return quads[:, [0, 1, 2, 0, 2, 3], :].reshape(-1, 3)
+
+
+# Corners of an axis-aligned box, in the same face order draw_cube has always used
+def box_quads(x0, x1, y0, y1, z0, z1):
+    return [
+        (x1, y0, z0), (x1, y1, z0), (x0, y1, z0), (x0, y0, z0),
+        (x1, y0, z1), (x1, y1, z1), (x0, y1, z1), (x0, y0, z1),
+        (x0, y0, z0), (x0, y1, z0), (x0, y1, z1), (x0, y0, z1),
+        (x1, y0, z0), (x1, y1, z0), (x1, y1, z1), (x1, y0, z1),
+        (x0, y1, z0), (x1, y1, z0), (x1, y1, z1), (x0, y1, z1),
+        (x0, y0, z0), (x1, y0, z0), (x1, y0, z1), (x0, y0, z1)
+    ]
+
+
+# Collects triangles and per-vertex colors while a model is being built
+class MeshBuilder:
+    def __init__(self):
+        self.vertices = []
+        self.colors = []
+
+    def triangles(self, vertices, color):
+        vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self.vertices.append(vertices)
+        self.colors.append(np.tile(np.asarray(color, dtype=np.float32), (len(vertices), 1)))
+
+    def quads(self, vertices, color):
+        self.triangles(quads_to_triangles(vertices), color)
+
+    def build(self, colored=True):
+        vertices = np.concatenate(self.vertices)
+        colors = np.concatenate(self.colors) if colored else None
+        return Mesh(vertices, colors)
+
+
+# A constant model held as NumPy arrays and drawn from a vertex buffer object.
+# Meshes without colors are drawn with the current glColor, so one mesh can be tinted per instance.
+# With indices the vertices are shared and drawn through an element buffer, in
+# the given primitive mode (e.g. GL_TRIANGLE_STRIP); count is then the index count.
+class Mesh:
+    def __init__(self, vertices, colors=None, indices=None, mode=GL_TRIANGLES):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.colors = None if colors is None else np.ascontiguousarray(colors, dtype=np.float32)
+        self.indices = None if indices is None else np.ascontiguousarray(indices, dtype=np.uint32)
+        self.mode = mode
+        self.count = len(self.vertices) if self.indices is None else len(self.indices)
+        self.layout = 'V3F' if self.colors is None else 'C3F_V3F'
+        self.vbo = None
+        self.ibo = None
+        self.vao = None  # Set by the shader renderer
+
+    # Upload to the GPU; needs a current GL context, so it happens on first draw
+    def upload(self):
+        if self.colors is not None:
+            data = np.ascontiguousarray(np.hstack([self.colors, self.vertices]))
+        else:
+            data = self.vertices
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        if self.indices is not None:
+            # Filled through GL_ARRAY_BUFFER: binding an element buffer needs a
+            # VAO in a core profile, and the buffer itself doesn't care
+            self.ibo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.ibo)
+            glBufferData(GL_ARRAY_BUFFER, self.indices.nbytes, self.indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self):
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            self.vao = None
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+        if self.ibo is not None:
+            glDeleteBuffers(1, [self.ibo])
+            self.ibo = None
+
+    def draw(self):
+        if self.vbo is None:
+            self.upload()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        if self.colors is not None:
+            glEnableClientState(GL_COLOR_ARRAY)
+            glColorPointer(3, GL_FLOAT, COLOR_VERTEX_STRIDE, ctypes.c_void_p(0))
+            glVertexPointer(3, GL_FLOAT, COLOR_VERTEX_STRIDE, ctypes.c_void_p(12))
+        else:
+            glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+        if self.ibo is not None:
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+            glDrawElements(self.mode, self.count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        else:
+            glDrawArrays(self.mode, 0, self.count)
+        count_draw(self.count)
+        if self.colors is not None:
+            glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+
+# Simplified Arwing (player ship), nose along +z
+def build_arwing():
+    mesh = MeshBuilder()
+    mesh.triangles([
+        (0, 0, 2), (-0.5, 0, 0), (0.5, 0, 0),
+        (0, 0.3, 0), (-0.5, 0, 0), (0.5, 0, 0),
+        (0, -0.3, 0), (-0.5, 0, 0), (0.5, 0, 0),
+        (0, 0.3, 0), (0, -0.3, 0), (-0.5, 0, -1),
+        (0, 0.3, 0), (0, -0.3, 0), (0.5, 0, -1),
+        (-0.5, 0, 0), (-3, -0.5, 0), (-0.5, 0, -1),
+        (0.5, 0, 0), (3, -0.5, 0), (0.5, 0, -1)
+    ], (1, 1, 1))
+    mesh.triangles([
+        (-3, -0.5, 0), (-2, -0.5, 0), (-2, -0.5, -0.5),
+        (3, -0.5, 0), (2, -0.5, 0), (2, -0.5, -0.5)
+    ], (0, 0, 1))
+    # Engines
+    mesh.quads(box_quads(-0.6, -0.4, 0, 0.1, -1, -1.2), (0, 0, 1))
+    mesh.quads(box_quads(0.4, 0.6, 0, 0.1, -1, -1.2), (0, 0, 1))
+    return mesh.build()
+
+
+# Unit cube (half-extent 1), tinted and scaled per instance by draw_cube
+def build_cube():
+    mesh = MeshBuilder()
+    mesh.quads(box_quads(-1, 1, -1, 1, -1, 1), (1, 1, 1))
+    return mesh.build(colored=False)
+
+
+# Simplified TIE Fighter: cockpit cube, window and two wing panels
+def build_tie_fighter():
+    mesh = MeshBuilder()
+    mesh.quads(box_quads(-0.5, 0.5, -0.5, 0.5, -0.5, 0.5), (0.3, 0.3, 0.3))
+    window_size = 0.2
+    mesh.quads([
+        (-window_size, -window_size, -0.5 - 0.01), (window_size, -window_size, -0.5 - 0.01),
+        (window_size, window_size, -0.5 - 0.01), (-window_size, window_size, -0.5 - 0.01)
+    ], (0, 1, 0))
+    wing_width = 0.2
+    wing_height = 1.5
+    wing_offset = 0.5 + wing_width / 2
+    for side in (-1, 1):
+        center = side * wing_offset
+        mesh.quads(box_quads(center - wing_width, center + wing_width, -wing_height, wing_height, 0, 0.1), (0.3, 0.3, 0.3))
+    return mesh.build()
+
+
+# Distant TIE fighter impostor: the cockpit and wings as flat panels facing the camera
+def build_tie_fighter_lod():
+    mesh = MeshBuilder()
+    wing_width = 0.2
+    wing_height = 1.5
+    wing_offset = 0.5 + wing_width / 2
+    mesh.quads([(-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (0.5, 0.5, 0.5), (-0.5, 0.5, 0.5)], (0.3, 0.3, 0.3))
+    for side in (-1, 1):
+        x0, x1 = side * wing_offset - wing_width, side * wing_offset + wing_width
+        mesh.quads([(x0, -wing_height, 0.1), (x1, -wing_height, 0.1), (x1, wing_height, 0.1), (x0, wing_height, 0.1)],
+                   (0.3, 0.3, 0.3))
+    return mesh.build()
+
+
+# Pyramid hill of size 1; draw_hill scales it uniformly
+def build_hill():
+    mesh = MeshBuilder()
+    mesh.triangles([
+        # Base
+        (-1, 0, -1), (1, 0, -1), (1, 0, 1),
+        (-1, 0, -1), (1, 0, 1), (-1, 0, 1),
+        # Sides
+        (-1, 0, -1), (1, 0, -1), (0, 1, 0),
+        (1, 0, -1), (1, 0, 1), (0, 1, 0),
+        (1, 0, 1), (-1, 0, 1), (0, 1, 0),
+        (-1, 0, 1), (-1, 0, -1), (0, 1, 0)
+    ], (0, 0.4, 0))
+    return mesh.build()
+
+
+# Tree: brown trunk with a green pyramid of foliage on top
+def build_tree():
+    mesh = MeshBuilder()
+    trunk_size = 0.2
+    trunk_height = 0.5
+    mesh.quads([
+        (-trunk_size, 0, -trunk_size), (-trunk_size, trunk_height, -trunk_size), (trunk_size, trunk_height, -trunk_size), (trunk_size, 0, -trunk_size),
+        (-trunk_size, 0, trunk_size), (-trunk_size, trunk_height, trunk_size), (trunk_size, trunk_height, trunk_size), (trunk_size, 0, trunk_size),
+        (-trunk_size, 0, -trunk_size), (-trunk_size, trunk_height, -trunk_size), (-trunk_size, trunk_height, trunk_size), (-trunk_size, 0, trunk_size),
+        (trunk_size, 0, -trunk_size), (trunk_size, trunk_height, -trunk_size), (trunk_size, trunk_height, trunk_size), (trunk_size, 0, trunk_size),
+        (-trunk_size, trunk_height, -trunk_size), (-trunk_size, trunk_height, trunk_size), (trunk_size, trunk_height, trunk_size), (trunk_size, trunk_height, -trunk_size),
+        (-trunk_size, 0, -trunk_size), (-trunk_size, 0, trunk_size), (trunk_size, 0, trunk_size), (trunk_size, 0, -trunk_size)
+    ], (0.5, 0.3, 0))
+    foliage_base = 0.5
+    foliage_height = 1.0
+    peak = (0, trunk_height + foliage_height, 0)
+    mesh.triangles([
+        (-foliage_base, trunk_height, -foliage_base), (foliage_base, trunk_height, -foliage_base), peak,
+        (foliage_base, trunk_height, -foliage_base), (foliage_base, trunk_height, foliage_base), peak,
+        (foliage_base, trunk_height, foliage_base), (-foliage_base, trunk_height, foliage_base), peak,
+        (-foliage_base, trunk_height, foliage_base), (-foliage_base, trunk_height, -foliage_base), peak
+    ], (0, 0.6, 0))
+    return mesh.build()
+
+
+# Distant tree impostor: two crossed foliage triangles over a flat trunk
+def build_tree_lod():
+    mesh = MeshBuilder()
+    trunk_size = 0.2
+    trunk_height = 0.5
+    foliage_base = 0.5
+    peak = (0, trunk_height + 1.0, 0)
+    mesh.quads([(-trunk_size, 0, 0), (trunk_size, 0, 0), (trunk_size, trunk_height, 0), (-trunk_size, trunk_height, 0)],
+               (0.5, 0.3, 0))
+    mesh.triangles([
+        (-foliage_base, trunk_height, 0), (foliage_base, trunk_height, 0), peak,
+        (0, trunk_height, -foliage_base), (0, trunk_height, foliage_base), peak
+    ], (0, 0.6, 0))
+    return mesh.build()
+
+
+MESH_BUILDERS = {
+    'arwing': build_arwing,
+    'cube': build_cube,
+    'tie_fighter': build_tie_fighter,
+    'tie_fighter_lod': build_tie_fighter_lod,
+    'hill': build_hill,
+    'tree': build_tree,
+    'tree_lod': build_tree_lod,
+}
+
+# Built meshes, keyed by name; each model is built and uploaded once
+meshes = {}
+
+
+# Register a builder for a new model (e.g. one loaded from disk)
+def register_mesh(name, builder):
+    MESH_BUILDERS[name] = builder
+    meshes.pop(name, None)
+
+
+def get_mesh(name):
+    mesh = meshes.get(name)
+    if mesh is None:
+        mesh = MESH_BUILDERS[name]()
+        meshes[name] = mesh
+    return mesh
+
+
+def draw_mesh(name):
+    get_mesh(name).draw()
+
+
+# Free every uploaded buffer (call before the GL context goes away)
+def release_meshes():
+    for mesh in meshes.values():
+        mesh.release()
+    meshes.clear()
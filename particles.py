@@ -0,0 +1,53 @@
+import numpy as np
+
+from entities import EntityStore
+
+
+# Fixed-capacity pool of explosion particles.
+#
+# All particles live in preallocated float32 arrays and are spawned,
+# integrated, shrunk and expired in bulk, so a tick costs a handful of NumPy
+# operations however many explosions are running. When a burst doesn't fit,
+# the particles closest to expiring are recycled for it instead of growing
+# the pool. Each particle keeps its index within its explosion, so a subset
+# of every explosion can be picked out however the rows have moved.
+class ParticlePool(EntityStore):
+    def __init__(self, capacity=20000):
+        super().__init__({'pos': 3, 'vel': 3, 'size': 0, 'lifetime': 0, 'index': 0}, capacity, dtype=np.float32)
+
+    def reserve(self, capacity):
+        if capacity > self.capacity:
+            raise ValueError(f"particle pool is full ({self.capacity} particles)")
+
+    # Free room for n more particles by retiring the ones with the least lifetime left
+    def recycle(self, n):
+        overflow = self.count + n - self.capacity
+        if overflow <= 0:
+            return
+        if overflow >= self.count:
+            self.clear()
+            return
+        oldest = np.argpartition(self['lifetime'], overflow - 1)[:overflow]
+        self.remove(oldest)
+
+    # Burst `per_explosion` particles out of every origin in `origins` (shape (N, 3))
+    def spawn(self, origins, per_explosion, rng, speed=0.1, size=0.2, lifetime=30):
+        origins = np.asarray(origins, dtype=np.float32).reshape(-1, 3)
+        n = min(len(origins) * per_explosion, self.capacity)
+        if n <= 0:
+            return
+        self.recycle(n)
+        self.extend(n, pos=np.repeat(origins, per_explosion, axis=0)[-n:],
+                    vel=rng.uniform(-speed, speed, (n, 3)), size=size, lifetime=lifetime,
+                    index=np.tile(np.arange(per_explosion, dtype=np.float32), len(origins))[-n:])
+
+    # Advance every particle by `frames` 60 FPS frames: move, age, shrink by 5% a frame,
+    # then drop the expired ones
+    def update(self, frames=1.0):
+        pos = self['pos']
+        pos += self['vel'] * frames
+        lifetime = self['lifetime']
+        lifetime -= frames
+        size = self['size']
+        size *= 0.95 ** frames
+        self.remove(lifetime <= 0)
@@ -0,0 +1,246 @@
+import gc
+import json
+import time
+
+import numpy as np
+from OpenGL.GL import *
+
+import shader_renderer
+
+# How many recent frames are kept, and how many timed phases fit in one frame
+PROFILE_FRAMES = 600
+MAX_PHASES_PER_FRAME = 256
+FRAME_BUDGET_MS = 1000 / 60
+
+
+# Counts garbage collections and the time they stop the game for, through
+# gc.callbacks. The callback only runs when a collection happens, so it can
+# stay installed; in a steady state with no per-tick garbage the counts
+# should barely move.
+class GCMonitor:
+    def __init__(self):
+        self.installed = False
+        self.started = None
+        self.reset()
+
+    def reset(self):
+        self.collections = [0, 0, 0]  # Per generation
+        self.collected = 0
+        self.pause = 0.0
+        self.max_pause = 0.0
+
+    def install(self):
+        if not self.installed:
+            gc.callbacks.append(self.callback)
+            self.installed = True
+
+    def uninstall(self):
+        if self.installed:
+            gc.callbacks.remove(self.callback)
+            self.installed = False
+
+    def callback(self, phase, info):
+        if phase == 'start':
+            self.started = time.perf_counter()
+        elif self.started is not None:
+            pause = time.perf_counter() - self.started
+            self.started = None
+            self.collections[info['generation']] += 1
+            self.collected += info['collected']
+            self.pause += pause
+            self.max_pause = max(self.max_pause, pause)
+
+    def stats(self):
+        return {'collections': list(self.collections), 'collected': self.collected,
+                'pause_ms': self.pause * 1000, 'max_pause_ms': self.max_pause * 1000}
+
+
+gc_monitor = GCMonitor()
+
+
+# Per-phase frame timing kept in a ring buffer of the last PROFILE_FRAMES frames.
+#
+# The game calls begin_frame() at the top of each frame and lap(name) after
+# each phase; a lap records the time since the previous lap under that phase
+# name, so consecutive phases need one clock read each. Draw helpers report
+# their calls through count_draw(). While disabled every call returns at
+# once, so the instrumentation can stay in the hot loop.
+class FrameProfiler:
+    def __init__(self, frames=PROFILE_FRAMES, max_phases=MAX_PHASES_PER_FRAME):
+        self.enabled = False
+        self.frames = frames
+        self.max_phases = max_phases
+        self.phase_names = []
+        self.phase_ids = {}
+        self.frame_start = np.zeros(frames)
+        self.frame_time = np.zeros(frames)
+        self.draw_calls = np.zeros(frames, dtype=np.int64)
+        self.vertices = np.zeros(frames, dtype=np.int64)
+        self.gc_pause = np.zeros(frames)
+        self.event_count = np.zeros(frames, dtype=np.int64)
+        self.event_phase = np.zeros((frames, max_phases), dtype=np.int32)
+        self.event_start = np.zeros((frames, max_phases))
+        self.event_duration = np.zeros((frames, max_phases))
+        self.frame = 0  # Frames recorded so far; the current slot is frame % frames
+        self.last = 0.0
+        self.frame_draw_calls = 0
+        self.frame_vertices = 0
+        self.frame_gc_start = 0.0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.frame = 0
+
+    def phase_id(self, name):
+        phase = self.phase_ids.get(name)
+        if phase is None:
+            phase = len(self.phase_names)
+            self.phase_ids[name] = phase
+            self.phase_names.append(name)
+        return phase
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        slot = self.frame % self.frames
+        self.last = time.perf_counter()
+        self.frame_start[slot] = self.last
+        self.event_count[slot] = 0
+        self.frame_draw_calls = 0
+        self.frame_vertices = 0
+        self.frame_gc_start = gc_monitor.pause
+
+    # Close the phase that started at the previous lap and file it under `name`
+    def lap(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        slot = self.frame % self.frames
+        index = self.event_count[slot]
+        if index < self.max_phases:
+            self.event_phase[slot, index] = self.phase_id(name)
+            self.event_start[slot, index] = self.last
+            self.event_duration[slot, index] = now - self.last
+            self.event_count[slot] = index + 1
+        self.last = now
+
+    def count_draw(self, vertices):
+        if not self.enabled:
+            return
+        self.frame_draw_calls += 1
+        self.frame_vertices += vertices
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        slot = self.frame % self.frames
+        self.frame_time[slot] = time.perf_counter() - self.frame_start[slot]
+        self.draw_calls[slot] = self.frame_draw_calls
+        self.vertices[slot] = self.frame_vertices
+        self.gc_pause[slot] = gc_monitor.pause - self.frame_gc_start
+        self.frame += 1
+
+    # Ring-buffer slots of the last n completed frames, oldest first
+    def recent_slots(self, n=None):
+        count = min(self.frame, self.frames) if n is None else min(n, self.frame, self.frames)
+        return (np.arange(self.frame - count, self.frame)) % self.frames
+
+    # Mean milliseconds per frame spent in each phase over the last n frames
+    def phase_means(self, n=60):
+        slots = self.recent_slots(n)
+        if len(slots) == 0:
+            return {}
+        totals = np.zeros(len(self.phase_names))
+        for slot in slots:
+            count = self.event_count[slot]
+            np.add.at(totals, self.event_phase[slot, :count], self.event_duration[slot, :count])
+        return {name: totals[i] * 1000 / len(slots) for i, name in enumerate(self.phase_names)}
+
+    def stats(self, n=60):
+        slots = self.recent_slots(n)
+        if len(slots) == 0:
+            return {'frames': 0}
+        frame_ms = self.frame_time[slots] * 1000
+        return {
+            'frames': len(slots),
+            'frame_ms_mean': float(frame_ms.mean()),
+            'frame_ms_max': float(frame_ms.max()),
+            'draw_calls': float(self.draw_calls[slots].mean()),
+            'vertices': float(self.vertices[slots].mean()),
+            'gc_frames': int(np.count_nonzero(self.gc_pause[slots])),
+            'gc_ms_max': float(self.gc_pause[slots].max() * 1000),
+            'phases_ms': self.phase_means(n),
+        }
+
+    # Write the last n frames (default: all kept) as Chrome trace-event JSON,
+    # viewable in chrome://tracing or Perfetto
+    def write_chrome_trace(self, path, n=None):
+        slots = self.recent_slots(n)
+        events = []
+        if len(slots):
+            origin = self.frame_start[slots[0]]
+            for slot in slots:
+                start = (self.frame_start[slot] - origin) * 1e6
+                events.append({'name': 'frame', 'ph': 'X', 'pid': 1, 'tid': 1, 'ts': start,
+                               'dur': self.frame_time[slot] * 1e6})
+                for i in range(self.event_count[slot]):
+                    events.append({'name': self.phase_names[self.event_phase[slot, i]], 'ph': 'X', 'pid': 1, 'tid': 1,
+                                   'ts': (self.event_start[slot, i] - origin) * 1e6,
+                                   'dur': self.event_duration[slot, i] * 1e6})
+                events.append({'name': 'gl', 'ph': 'C', 'pid': 1, 'ts': start,
+                               'args': {'draw_calls': int(self.draw_calls[slot]), 'vertices': int(self.vertices[slot])}})
+                events.append({'name': 'gc', 'ph': 'C', 'pid': 1, 'ts': start,
+                               'args': {'pause_ms': self.gc_pause[slot] * 1000}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(slots)
+
+
+# The game's profiler; draw helpers report to it through count_draw()
+profiler = FrameProfiler()
+
+
+def count_draw(vertices):
+    if profiler.enabled:
+        profiler.count_draw(vertices)
+
+
+# Overlay text, refreshed every few frames
+overlay_lines = []
+
+
+# Draw the frame-time graph and a per-phase breakdown in the bottom-left corner.
+# The graph shows the last PROFILE_FRAMES frames against the 60 FPS budget line;
+# extra_lines are listed under the phase timings.
+def draw_overlay(text_renderer, viewport, graph_size=(300, 100), lines_every=15, extra_lines=()):
+    global overlay_lines
+    slots = profiler.recent_slots()
+    x0, y0 = 10, 10
+    width, height = graph_size
+    scale = height / (FRAME_BUDGET_MS * 2)
+    shader_renderer.draw_2d(GL_TRIANGLES, [
+        (x0, y0), (x0 + width, y0), (x0 + width, y0 + height),
+        (x0, y0), (x0 + width, y0 + height), (x0, y0 + height)
+    ], (0, 0, 0, 0.6), viewport)
+    budget_y = y0 + FRAME_BUDGET_MS * scale
+    shader_renderer.draw_2d(GL_LINES, [(x0, budget_y), (x0 + width, budget_y)], (1, 1, 0), viewport)
+    if len(slots) > 1:
+        frame_ms = np.minimum(profiler.frame_time[slots] * 1000, FRAME_BUDGET_MS * 2)
+        graph = np.column_stack([x0 + np.arange(len(slots)) * width / (profiler.frames - 1), y0 + frame_ms * scale])
+        shader_renderer.draw_2d(GL_LINE_STRIP, graph, (0, 1, 0), viewport)
+
+    # Text only changes every few frames so the string cache isn't churned
+    stats = profiler.stats()
+    if stats['frames'] == 0:
+        return
+    if profiler.frame % lines_every == 0 or not overlay_lines:
+        overlay_lines = [f"frame {stats['frame_ms_mean']:.2f} ms (max {stats['frame_ms_max']:.2f})",
+                         f"draws {stats['draw_calls']:.0f}  verts {stats['vertices']:.0f}",
+                         f"gc in {stats['gc_frames']} frames (max {stats['gc_ms_max']:.2f} ms)"]
+        for name, ms in sorted(stats['phases_ms'].items(), key=lambda item: -item[1])[:8]:
+            overlay_lines.append(f"{name} {ms:.2f} ms")
+        overlay_lines.extend(extra_lines)
+    line_height = 18
+    for i, line in enumerate(overlay_lines):
+        text_renderer.draw(line, x0, y0 + height + 8 + (len(overlay_lines) - 1 - i) * line_height,
+                           (255, 255, 255), viewport)
@@ -0,0 +1,91 @@
+import struct
+
+import pygame
+
+# Input log layout: a fixed header followed by one 2-byte record per simulation tick.
+# The header's tick count and final state digest are filled in when the log is closed.
+LOG_MAGIC = b'SFXR'
+LOG_VERSION = 3  # Also bumped when the simulation's rules change, since old logs would play out differently
+HEADER = struct.Struct('<4sBQHI32s')  # magic, version, seed, sim_rate, ticks, digest
+RECORD = struct.Struct('<BB')  # held-key bits (plus the restart bit), fire presses
+
+# Keys the simulation reads, in bit order
+CONTROL_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_q, pygame.K_e)
+KEY_BITS = {key: 1 << bit for bit, key in enumerate(CONTROL_KEYS)}
+RESTART_BIT = 0x80
+MAX_SHOTS_PER_TICK = 255
+
+
+# Everything the simulation reads from the player in one tick: which control
+# keys are held, how many fire presses arrived and whether a restart was asked
+# for. Indexing by pygame key constant works like pygame.key.get_pressed().
+class TickInput:
+    __slots__ = ('held', 'shots', 'restart')
+
+    def __init__(self, held=0, shots=0, restart=False):
+        self.held = held
+        self.shots = min(shots, MAX_SHOTS_PER_TICK)
+        self.restart = restart
+
+    @classmethod
+    def from_pressed(cls, pressed, shots=0, restart=False):
+        held = 0
+        for key, bit in KEY_BITS.items():
+            if pressed[key]:
+                held |= bit
+        return cls(held, shots, restart)
+
+    def __getitem__(self, key):
+        return bool(self.held & KEY_BITS.get(key, 0))
+
+    def pack(self):
+        return RECORD.pack(self.held | (RESTART_BIT if self.restart else 0), self.shots)
+
+    @classmethod
+    def unpack(cls, data, offset=0):
+        bits, shots = RECORD.unpack_from(data, offset)
+        return cls(bits & ~RESTART_BIT, shots, bool(bits & RESTART_BIT))
+
+
+# Writes the per-tick input of a session to a compact binary log
+class InputRecorder:
+    def __init__(self, path, seed, sim_rate):
+        self.file = open(path, 'wb')
+        self.seed = seed
+        self.sim_rate = sim_rate
+        self.ticks = 0
+        self.file.write(HEADER.pack(LOG_MAGIC, LOG_VERSION, seed, sim_rate, 0, bytes(32)))
+
+    def record(self, tick_input):
+        self.file.write(tick_input.pack())
+        self.ticks += 1
+
+    # Finish the log, storing the tick count and the digest of the final game state
+    def close(self, digest=bytes(32)):
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.file.write(HEADER.pack(LOG_MAGIC, LOG_VERSION, self.seed, self.sim_rate, self.ticks, digest))
+        self.file.close()
+
+
+# A recorded session: the seed and tick rate to start from and the input for every tick
+class InputReplay:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.seed, self.sim_rate, ticks, self.digest = HEADER.unpack_from(data)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"{path} is not a version {LOG_VERSION} input log")
+        self.data = memoryview(data)[HEADER.size:]
+        # A log that was never closed has no tick count; fall back to its length
+        self.ticks = ticks or len(self.data) // RECORD.size
+        if not ticks:
+            self.digest = None
+
+    def __len__(self):
+        return self.ticks
+
+    def __iter__(self):
+        for tick in range(self.ticks):
+            yield TickInput.unpack(self.data, tick * RECORD.size)
@@ -0,0 +1,32 @@
+import heapq
+
+
+# Priority queue of entity ids keyed by the simulation time they are next due.
+#
+# Time is counted in 60 FPS frames, like every other simulation timer.
+# advance() pops only the entries that have come due, so a tick costs
+# O(due * log n) however many entities are waiting. Entities that die keep
+# their entry until it comes up; the caller drops ids that no longer
+# resolve to a row, so nothing has to be searched out of the heap on removal.
+class EventScheduler:
+    def __init__(self):
+        self.queue = []  # (due time, entity id); ties pop in id order, so runs are reproducible
+        self.now = 0.0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def schedule(self, entity_id, delay):
+        heapq.heappush(self.queue, (self.now + delay, entity_id))
+
+    # Move the clock on by `frames` and return the ids that came due, earliest first
+    def advance(self, frames):
+        self.now += frames
+        due = []
+        while self.queue and self.queue[0][0] <= self.now:
+            due.append(heapq.heappop(self.queue)[1])
+        return due
+
+    def clear(self):
+        self.queue.clear()
+        self.now = 0.0
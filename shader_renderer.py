@@ -0,0 +1,446 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+import profiler
+
+# GLSL programs for the shader backend. Everything is written against GLSL
+# 3.30 core so the same renderer runs on core-profile contexts.
+BASIC_VERTEX_SHADER = """
+#version 330 core
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec3 color;
+layout(location = 2) in vec3 normal;
+layout(location = 3) in vec4 instance_offset;  // xyz translation, w uniform scale
+layout(location = 4) in vec3 instance_color;
+uniform mat4 view_projection;
+uniform mat4 model;
+uniform int color_source;  // 0: vertex colors, 1: the tint uniform, 2: per-instance colors
+uniform vec3 tint;
+uniform bool lit;
+out vec3 frag_color;
+
+void main() {
+    gl_Position = view_projection * model * vec4(position * instance_offset.w + instance_offset.xyz, 1.0);
+    vec3 base = color_source == 0 ? color : (color_source == 1 ? tint : instance_color);
+    if (lit) {
+        // The fixed-function defaults draw_model relies on: GL_LIGHT0 shining down -z plus 0.2 ambient
+        vec3 n = normalize(mat3(model) * normal);
+        base = min(base * (0.2 + max(n.z, 0.0)), 1.0);
+    }
+    frag_color = base;
+}
+"""
+
+BASIC_FRAGMENT_SHADER = """
+#version 330 core
+in vec3 frag_color;
+out vec4 out_color;
+
+void main() {
+    out_color = vec4(frag_color, 1.0);
+}
+"""
+
+# A single triangle covering the screen; each pixel is shaded by the elevation of
+# its view ray, i.e. the skybox gradient drawn at infinity
+SKY_VERTEX_SHADER = """
+#version 330 core
+out vec2 ndc;
+
+void main() {
+    ndc = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2) * 2.0 - 1.0;
+    gl_Position = vec4(ndc, 0.0, 1.0);
+}
+"""
+
+SKY_FRAGMENT_SHADER = """
+#version 330 core
+in vec2 ndc;
+uniform mat4 inverse_view_projection;
+uniform vec3 sky_top;
+uniform vec3 sky_bottom;
+out vec4 out_color;
+
+void main() {
+    vec4 near = inverse_view_projection * vec4(ndc, -1.0, 1.0);
+    vec4 far = inverse_view_projection * vec4(ndc, 1.0, 1.0);
+    vec3 direction = normalize(far.xyz / far.w - near.xyz / near.w);
+    out_color = vec4(mix(sky_bottom, sky_top, direction.y * 0.5 + 0.5), 1.0);
+}
+"""
+
+TEXT_VERTEX_SHADER = """
+#version 330 core
+layout(location = 0) in vec2 uv;
+layout(location = 1) in vec2 position;
+uniform vec2 viewport;
+uniform vec2 origin;
+out vec2 frag_uv;
+
+void main() {
+    frag_uv = uv;
+    gl_Position = vec4((origin + position) / viewport * 2.0 - 1.0, 0.0, 1.0);
+}
+"""
+
+TEXT_FRAGMENT_SHADER = """
+#version 330 core
+in vec2 frag_uv;
+uniform sampler2D atlas;
+uniform vec3 text_color;
+out vec4 out_color;
+
+void main() {
+    vec4 texel = texture(atlas, frag_uv);
+    out_color = vec4(text_color * texel.rgb, texel.a);
+}
+"""
+
+# Flat-colored screen-space geometry in pixels (overlays, progress bars)
+SCREEN_VERTEX_SHADER = """
+#version 330 core
+layout(location = 0) in vec2 position;
+uniform vec2 viewport;
+
+void main() {
+    gl_Position = vec4(position / viewport * 2.0 - 1.0, 0.0, 1.0);
+}
+"""
+
+SCREEN_FRAGMENT_SHADER = """
+#version 330 core
+uniform vec4 color;
+out vec4 out_color;
+
+void main() {
+    out_color = color;
+}
+"""
+
+INSTANCE_STRIDE = 7 * 4  # Bytes per instance: x, y, z, scale, r, g, b
+VERTEX_STRIDE = 6 * 4  # Bytes per vertex in C3F_V3F and N3F_V3F meshes
+TEXT_VERTEX_STRIDE = 4 * 4  # u, v, x, y
+
+
+def compile_shader(source, kind):
+    shader = glCreateShader(kind)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+        log = glGetShaderInfoLog(shader)
+        glDeleteShader(shader)
+        raise RuntimeError(f"shader compile failed: {log.decode() if isinstance(log, bytes) else log}")
+    return shader
+
+
+# A linked program and its uniform locations, looked up once by name
+class ShaderProgram:
+    def __init__(self, vertex_source, fragment_source):
+        shaders = [compile_shader(vertex_source, GL_VERTEX_SHADER), compile_shader(fragment_source, GL_FRAGMENT_SHADER)]
+        self.program = glCreateProgram()
+        for shader in shaders:
+            glAttachShader(self.program, shader)
+        glLinkProgram(self.program)
+        for shader in shaders:
+            glDetachShader(self.program, shader)
+            glDeleteShader(shader)
+        if not glGetProgramiv(self.program, GL_LINK_STATUS):
+            log = glGetProgramInfoLog(self.program)
+            raise RuntimeError(f"shader link failed: {log.decode() if isinstance(log, bytes) else log}")
+        self.locations = {}
+
+    def location(self, name):
+        location = self.locations.get(name)
+        if location is None:
+            location = glGetUniformLocation(self.program, name)
+            self.locations[name] = location
+        return location
+
+    def use(self):
+        glUseProgram(self.program)
+
+    def set_matrix(self, name, matrix):
+        glUniformMatrix4fv(self.location(name), 1, GL_TRUE, np.asarray(matrix, dtype=np.float32))
+
+    def release(self):
+        glDeleteProgram(self.program)
+
+
+# Model matrices matching the fixed-function glTranslatef / glRotatef / glScalef sequence
+def rotation_matrix(degrees, axis):
+    c, s = np.cos(np.radians(degrees)), np.sin(np.radians(degrees))
+    matrix = np.eye(4)
+    i, j = [(1, 2), (2, 0), (0, 1)][axis]
+    matrix[i, i], matrix[i, j], matrix[j, i], matrix[j, j] = c, -s, s, c
+    return matrix
+
+
+def model_matrix(pos, rotation=(0, 0, 0), scale=1.0):
+    matrix = np.eye(4)
+    matrix[:3, 3] = pos
+    for axis in range(3):
+        if rotation[axis]:
+            matrix = matrix @ rotation_matrix(rotation[axis], axis)
+    matrix[:3, :3] *= scale
+    return matrix
+
+
+IDENTITY = np.eye(4)
+
+
+# Renders with shaders, uniform-driven transforms and vertex array objects.
+#
+# Meshes keep their own VBOs; the renderer gives each one a VAO the first
+# time it is drawn (stored on the mesh, which frees it on release). Batches
+# of identical objects are drawn with one instanced call whose per-instance
+# offsets, scales and colors are streamed into a buffer each frame.
+class ShaderRenderer:
+    def __init__(self, view_projection, sky_top, sky_bottom):
+        self.basic = ShaderProgram(BASIC_VERTEX_SHADER, BASIC_FRAGMENT_SHADER)
+        self.sky = ShaderProgram(SKY_VERTEX_SHADER, SKY_FRAGMENT_SHADER)
+        self.text = ShaderProgram(TEXT_VERTEX_SHADER, TEXT_FRAGMENT_SHADER)
+        self.screen = ShaderProgram(SCREEN_VERTEX_SHADER, SCREEN_FRAGMENT_SHADER)
+        self.empty_vao = glGenVertexArrays(1)  # Core profiles need a VAO bound even for attribute-less draws
+        self.instance_buffer = glGenBuffers(1)
+        self.stream_vao = glGenVertexArrays(1)
+        self.stream_buffer = glGenBuffers(1)
+        self.set_camera(view_projection)
+        self.sky.use()
+        glUniform3f(self.sky.location('sky_top'), *sky_top)
+        glUniform3f(self.sky.location('sky_bottom'), *sky_bottom)
+        self.text.use()
+        glUniform1i(self.text.location('atlas'), 0)
+        glUseProgram(0)
+
+    def set_camera(self, view_projection):
+        self.view_projection = np.asarray(view_projection, dtype=np.float64)
+        self.basic.use()
+        self.basic.set_matrix('view_projection', self.view_projection)
+        self.sky.use()
+        self.sky.set_matrix('inverse_view_projection', np.linalg.inv(self.view_projection))
+        glUseProgram(0)
+
+    # The VAO for a Mesh (C3F_V3F or V3F) or an assets.Model (N3F_V3F)
+    def mesh_vao(self, mesh):
+        if getattr(mesh, 'vao', None) is not None:
+            return mesh.vao
+        if mesh.vbo is None:
+            mesh.upload()
+        mesh.vao = glGenVertexArrays(1)
+        glBindVertexArray(mesh.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, mesh.vbo)
+        if mesh.layout == 'V3F':
+            glEnableVertexAttribArray(0)
+            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
+        else:
+            first = 1 if mesh.layout == 'C3F_V3F' else 2  # Colors or normals come before each position
+            glEnableVertexAttribArray(first)
+            glVertexAttribPointer(first, 3, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(0))
+            glEnableVertexAttribArray(0)
+            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, ctypes.c_void_p(12))
+        if mesh.ibo is not None:
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, mesh.ibo)  # Part of the VAO's state, so unbound only after it
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        return mesh.vao
+
+    def set_colors(self, mesh, color, lit, instanced=False):
+        if color is None and mesh.layout == 'C3F_V3F':
+            glUniform1i(self.basic.location('color_source'), 0)
+        elif instanced:
+            glUniform1i(self.basic.location('color_source'), 2)
+        else:
+            glUniform1i(self.basic.location('color_source'), 1)
+            glUniform3f(self.basic.location('tint'), *color)
+        glUniform1i(self.basic.location('lit'), lit)
+
+    # Draw the gradient sky behind everything
+    def draw_sky(self):
+        glDisable(GL_DEPTH_TEST)
+        self.sky.use()
+        glBindVertexArray(self.empty_vao)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        profiler.count_draw(3)
+        glBindVertexArray(0)
+        glUseProgram(0)
+        glEnable(GL_DEPTH_TEST)
+
+    # Draw one mesh with a model matrix; color tints meshes without vertex colors
+    def draw_mesh(self, mesh, model=IDENTITY, color=(1, 1, 1), lit=False):
+        self.basic.use()
+        self.basic.set_matrix('model', model)
+        self.set_colors(mesh, None if mesh.layout == 'C3F_V3F' else color, lit)
+        glVertexAttrib4f(3, 0, 0, 0, 1)  # No instancing: zero offset, unit scale
+        glBindVertexArray(self.mesh_vao(mesh))
+        if mesh.ibo is not None:
+            glDrawElements(mesh.mode, mesh.count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+        else:
+            glDrawArrays(mesh.mode, 0, mesh.count)
+        profiler.count_draw(mesh.count)
+        glBindVertexArray(0)
+        glUseProgram(0)
+
+    # Draw len(positions) copies of a mesh in one call. scales is a scalar or (N,);
+    # colors is None (keep the mesh's vertex colors), one RGB tuple or an (N, 3) array.
+    def draw_instances(self, mesh, positions, scales=1.0, colors=None, lit=False):
+        n = len(positions)
+        if n == 0:
+            return
+        instances = np.empty((n, 7), dtype=np.float32)
+        instances[:, :3] = positions
+        instances[:, 3] = scales
+        instances[:, 4:] = 1 if colors is None else colors
+        vao = self.mesh_vao(mesh)
+        self.basic.use()
+        self.basic.set_matrix('model', IDENTITY)
+        self.set_colors(mesh, colors, lit, instanced=True)
+        glBindVertexArray(vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
+        glBufferData(GL_ARRAY_BUFFER, instances.nbytes, instances, GL_STREAM_DRAW)
+        glEnableVertexAttribArray(3)
+        glVertexAttribPointer(3, 4, GL_FLOAT, GL_FALSE, INSTANCE_STRIDE, ctypes.c_void_p(0))
+        glVertexAttribDivisor(3, 1)
+        glEnableVertexAttribArray(4)
+        glVertexAttribPointer(4, 3, GL_FLOAT, GL_FALSE, INSTANCE_STRIDE, ctypes.c_void_p(16))
+        glVertexAttribDivisor(4, 1)
+        glDrawArraysInstanced(GL_TRIANGLES, 0, mesh.count, n)
+        profiler.count_draw(mesh.count * n)
+        glDisableVertexAttribArray(3)
+        glDisableVertexAttribArray(4)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    # Refill the shared stream buffer and point attribute 0 at it (width floats per vertex)
+    def stream(self, vertices, width):
+        data = np.ascontiguousarray(vertices, dtype=np.float32)
+        glBindVertexArray(self.stream_vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.stream_buffer)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, width, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(0))
+        return len(data)
+
+    # Line segments from starts (N, 3) to ends (N, 3) in one color
+    def draw_lines(self, starts, ends, color):
+        if len(starts) == 0:
+            return
+        vertices = np.empty((len(starts), 2, 3), dtype=np.float32)
+        vertices[:, 0] = starts
+        vertices[:, 1] = ends
+        self.basic.use()
+        self.basic.set_matrix('model', IDENTITY)
+        glUniform1i(self.basic.location('color_source'), 1)
+        glUniform3f(self.basic.location('tint'), *color)
+        glUniform1i(self.basic.location('lit'), False)
+        glVertexAttrib4f(3, 0, 0, 0, 1)
+        count = self.stream(vertices.reshape(-1, 3), 3)
+        glDrawArrays(GL_LINES, 0, count)
+        profiler.count_draw(count)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    # Screen-space geometry in pixels, e.g. draw_2d(GL_TRIANGLES, quad, (0, 0, 0, 0.6), display)
+    def draw_2d(self, mode, vertices, color, viewport):
+        vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 2)
+        if len(vertices) == 0:
+            return
+        self.screen.use()
+        glUniform2f(self.screen.location('viewport'), *viewport)
+        glUniform4f(self.screen.location('color'), *color, *(() if len(color) == 4 else (1,)))
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        count = self.stream(vertices, 2)
+        glDrawArrays(mode, 0, count)
+        profiler.count_draw(count)
+        glDisable(GL_BLEND)
+        glEnable(GL_DEPTH_TEST)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    # A cached string from text.TextRenderer (T2F_V2F in its own VBO) at pixel (x, y)
+    def draw_text(self, texture, cached, x, y, color, viewport):
+        if cached.vao is None:
+            cached.vao = glGenVertexArrays(1)
+            glBindVertexArray(cached.vao)
+            glBindBuffer(GL_ARRAY_BUFFER, cached.vbo)
+            glEnableVertexAttribArray(0)
+            glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, TEXT_VERTEX_STRIDE, ctypes.c_void_p(0))
+            glEnableVertexAttribArray(1)
+            glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, TEXT_VERTEX_STRIDE, ctypes.c_void_p(8))
+        self.text.use()
+        glUniform2f(self.text.location('viewport'), *viewport)
+        glUniform2f(self.text.location('origin'), x, y)
+        glUniform3f(self.text.location('text_color'), *(c / 255 for c in color))
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glBindVertexArray(cached.vao)
+        glDrawArrays(GL_TRIANGLES, 0, cached.count)
+        profiler.count_draw(cached.count)
+        glBindVertexArray(0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glDisable(GL_BLEND)
+        glEnable(GL_DEPTH_TEST)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    def release(self):
+        for program in (self.basic, self.sky, self.text, self.screen):
+            program.release()
+        glDeleteVertexArrays(2, [self.empty_vao, self.stream_vao])
+        glDeleteBuffers(2, [self.instance_buffer, self.stream_buffer])
+
+
+# The shader renderer in use, or None when drawing with the fixed-function pipeline.
+# Draw helpers across the game check this to pick their code path.
+active = None
+
+
+def enable(view_projection, sky_top, sky_bottom):
+    global active
+    active = ShaderRenderer(view_projection, sky_top, sky_bottom)
+    return active
+
+
+def disable():
+    global active
+    if active is not None:
+        active.release()
+        active = None
+
+
+# Screen-space geometry in pixels with whichever pipeline is in use; the
+# fixed-function path draws it in immediate mode under an orthographic projection
+def draw_2d(mode, vertices, color, viewport):
+    if active:
+        active.draw_2d(mode, vertices, color, viewport)
+        return
+    glMatrixMode(GL_PROJECTION)
+    glPushMatrix()
+    glLoadIdentity()
+    glOrtho(0, viewport[0], 0, viewport[1], -1, 1)
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    glLoadIdentity()
+    glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT)
+    glDisable(GL_DEPTH_TEST)
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    glColor4f(*color, *(() if len(color) == 4 else (1,)))
+    glBegin(mode)
+    for x, y in np.asarray(vertices).reshape(-1, 2):
+        glVertex2f(x, y)
+    glEnd()
+    glPopAttrib()
+    glPopMatrix()
+    glMatrixMode(GL_PROJECTION)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
@@ -0,0 +1,305 @@
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from replay import InputRecorder, InputReplay, TickInput
+from simulation import Game, generate_terrain_features
+from terrain import TerrainStreamer
+
+# Running the simulation in its own process (--sim-process). The simulation
+# publishes every tick into shared memory and the render process draws the
+# newest snapshot, so Python update logic no longer competes with GL
+# submission for one GIL. Input goes the other way over a multiprocessing queue.
+
+# Most entities of each kind a snapshot carries; beyond that the extra ones are
+# simulated but not drawn
+CAPACITY = {'enemies': 2048, 'bullets': 4096, 'enemy_bullets': 4096, 'power_ups': 1024, 'explosions': 20000}
+STORES = ('enemies', 'bullets', 'enemy_bullets', 'power_ups', 'explosions')
+STORE_FIELDS = {'enemies': ('pos', 'prev_pos'), 'bullets': ('pos', 'prev_pos'), 'enemy_bullets': ('pos', 'prev_pos'),
+                'power_ups': ('pos', 'prev_pos'), 'explosions': ('pos', 'vel', 'size', 'index')}  # The fields render() reads
+TERRAIN_SEGMENTS = 3  # TerrainStreamer's ring
+SLOTS = 3
+
+# One published tick. counters holds health, score, game_over, game_active, shots_fired and kills.
+SNAPSHOT = np.dtype([
+    ('tick', np.int64),
+    ('published', np.float64),  # time.perf_counter() when the tick was published
+    ('player', np.float64, (4, 3)),  # Position, previous position, rotation, previous rotation
+    ('counters', np.int64, (6,)),
+    ('terrain', np.float64, (TERRAIN_SEGMENTS, 2)),  # base_z, current_z of each segment
+    ('counts', np.int64, (len(STORES),)),
+] + [(f'{name}_{field}', np.float64, (CAPACITY[name], 3))
+     for name in STORES[:-1] for field in STORE_FIELDS[name]] + [
+    ('explosions_pos', np.float32, (CAPACITY['explosions'], 3)),
+    ('explosions_vel', np.float32, (CAPACITY['explosions'], 3)),
+    ('explosions_size', np.float32, (CAPACITY['explosions'],)),
+    ('explosions_index', np.float32, (CAPACITY['explosions'],)),
+], align=True)
+
+# latest: newest complete slot (-1 before the first publish); reading: slot the
+# renderer is drawing from; finished: set when a replay has run out
+CONTROL = np.dtype([('latest', np.int64), ('reading', np.int64), ('finished', np.int64)])
+
+
+# Triple-buffered world snapshots in one shared memory block.
+#
+# One process writes and one reads, and neither ever waits for the other. The
+# writer fills a slot that is neither `latest` nor `reading` (with three slots
+# there is always one) and then publishes it by storing its index in latest.
+# The reader takes latest, marks it as reading and checks that latest hasn't
+# moved on meanwhile; if it has, it retries with the newer slot. Once marked, a
+# slot stays untouched until the reader takes another, so the renderer draws
+# straight from NumPy views into shared memory without locking or copying.
+class SharedWorld:
+    def __init__(self, name=None):
+        self.owner = name is None
+        size = CONTROL.itemsize + SLOTS * SNAPSHOT.itemsize
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.control = np.ndarray((), CONTROL, buffer=self.memory.buf)
+        slots = np.ndarray((SLOTS,), SNAPSHOT, buffer=self.memory.buf, offset=CONTROL.itemsize)
+        # Each slot as a dict of plain array views, one per field
+        self.slots = [{name: slots[name][i, ...] for name in SNAPSHOT.names} for i in range(SLOTS)]
+        if self.owner:
+            self.control['latest'] = -1
+            self.control['reading'] = -1
+            self.control['finished'] = 0
+
+    # Writer: copy the game's state into a free slot, then make it the latest
+    def publish(self, game, tick):
+        control = self.control
+        index = next(i for i in range(SLOTS) if i != control['latest'] and i != control['reading'])
+        slot = self.slots[index]
+        slot['tick'][...] = tick
+        slot['player'][:] = (game.player_pos, game.prev_player_pos, game.player_rotation, game.prev_player_rotation)
+        slot['counters'][:] = (game.player_health, game.score, game.game_over, game.game_active,
+                            game.shots_fired, game.kills)
+        slot['terrain'][:] = [(segment['base_z'], segment['current_z']) for segment in game.terrain.segments]
+        for i, name in enumerate(STORES):
+            store = getattr(game, name)
+            count = min(len(store), CAPACITY[name])
+            slot['counts'][i] = count
+            for field in STORE_FIELDS[name]:
+                slot[f'{name}_{field}'][:count] = store[field][:count]
+        slot['published'][...] = time.perf_counter()
+        control['latest'] = index
+
+    # Reader: the newest complete snapshot, or None before the first publish
+    def acquire(self):
+        control = self.control
+        while True:
+            index = int(control['latest'])
+            if index < 0:
+                return None
+            control['reading'] = index
+            if control['latest'] == index:
+                return self.slots[index]
+
+    # Every view into the block must be dropped before this
+    def close(self):
+        self.control = None
+        self.slots = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+# One entity kind in a snapshot, indexed like an EntityStore
+class StoreView:
+    def __init__(self):
+        self.arrays = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.count]
+
+
+# Stands in for the Game on the render side: the attributes render() reads, taken
+# from the newest snapshot by acquire(). Terrain meshes can't be shared, so a
+# local TerrainStreamer with the same seed follows the published segments and
+# builds the chunks here.
+class WorldView:
+    terrain_speed = Game.terrain_speed
+    particles_per_explosion = Game.particles_per_explosion
+
+    def __init__(self, world, seed):
+        self.world = world
+        self.terrain = TerrainStreamer(generate_terrain_features)
+        self.terrain.seed = seed
+        self.stores = {name: StoreView() for name in STORES}
+        self.enemies = self.stores['enemies']
+        self.bullets = self.stores['bullets']
+        self.enemy_bullets = self.stores['enemy_bullets']
+        self.power_ups = self.stores['power_ups']
+        self.explosions = self.stores['explosions']
+        self.player_pos = self.prev_player_pos = np.zeros(3)
+        self.player_rotation = self.prev_player_rotation = np.zeros(3)
+        self.ships = []  # Only the player's ship, drawn from player_pos
+        self.player_health = 0
+        self.score = 0
+        self.game_over = False
+        self.game_active = False
+        self.shots_fired = 0
+        self.kills = 0
+        self.new_shots = 0  # Shots and kills since the previous snapshot taken, for sound cues
+        self.new_kills = 0
+        self.restarted = False  # Whether a game over ended since the previous snapshot taken
+        self.tick = -1
+        self.published = None
+
+    def start(self):
+        self.terrain.start()
+
+    def shutdown(self):
+        self.terrain.shutdown()
+
+    # Switch to the newest snapshot; False if nothing has been published yet
+    def acquire(self):
+        slot = self.world.acquire()
+        if slot is None:
+            return False
+        self.player_pos, self.prev_player_pos, self.player_rotation, self.prev_player_rotation = slot['player']
+        health, score, game_over, game_active, shots_fired, kills = slot['counters'].tolist()
+        self.restarted = self.game_over and not game_over
+        self.new_shots = max(shots_fired - self.shots_fired, 0)
+        self.new_kills = max(kills - self.kills, 0)
+        self.player_health, self.score, self.shots_fired, self.kills = health, score, shots_fired, kills
+        self.game_over, self.game_active = bool(game_over), bool(game_active)
+        for name, count in zip(STORES, slot['counts'].tolist()):
+            store = self.stores[name]
+            store.count = count
+            store.arrays = {field: slot[f'{name}_{field}'] for field in STORE_FIELDS[name]}
+        self.terrain.follow(slot['terrain'])
+        self.tick = int(slot['tick'])
+        self.published = float(slot['published'])
+        return True
+
+    # How far the renderer is from the snapshot's tick toward the next, for interpolation
+    def alpha(self, sim_rate):
+        if self.published is None:
+            return 1.0
+        return min(max((time.perf_counter() - self.published) * sim_rate, 0.0), 1.0)
+
+    # Drop every view into shared memory so the block can be closed
+    def release(self):
+        self.player_pos = self.prev_player_pos = np.zeros(3)
+        self.player_rotation = self.prev_player_rotation = np.zeros(3)
+        for store in self.stores.values():
+            store.arrays = {}
+            store.count = 0
+
+
+# Body of the simulation process. Ticks a Game at sim_rate and publishes every
+# tick. Messages on `inputs`: ('start',) starts the clock (the initial state is
+# published straight away so the renderer has something to draw), ('input',
+# held, shots, restart) updates the controls and ('stop',) ends the process.
+# Shots and restarts are kept until the next tick takes them; held keys last
+# until the next input message. With a replay the logged input is used instead,
+# and `finished` is set when it runs out.
+def run_simulation(memory_name, inputs, seed, sim_rate, record_path=None, replay_path=None, max_catch_up_ticks=5):
+    world = SharedWorld(memory_name)
+    game = Game(seed)
+    game.start(render=False)  # The renderer's WorldView streams its own chunks
+    recorder = InputRecorder(record_path, seed, sim_rate) if record_path else None
+    replay = InputReplay(replay_path) if replay_path else None
+    replay_inputs = iter(replay) if replay else None
+    dt = 1 / sim_rate
+    held, shots, restart = 0, 0, False
+    next_tick = None  # When the next tick is due (None until started, or after a replay ends)
+    tick = 0
+    world.publish(game, tick)
+    try:
+        while True:
+            # Sleep on the queue until the next tick is due, then take whatever else arrived
+            wait = None if next_tick is None else next_tick - time.perf_counter()
+            try:
+                message = inputs.get(timeout=wait) if wait is None or wait > 0 else inputs.get_nowait()
+            except queue.Empty:
+                message = None
+            if message is not None:
+                if message[0] == 'stop':
+                    break
+                if message[0] == 'start':
+                    next_tick = time.perf_counter()
+                elif message[0] == 'input':
+                    held = message[1]
+                    shots += message[2]
+                    restart = restart or message[3]
+                continue
+            if next_tick is None or time.perf_counter() < next_tick:
+                continue
+
+            if replay_inputs is not None:
+                controls = next(replay_inputs, None)
+                if controls is None:
+                    if replay.digest is None:
+                        print("Replay finished (the log has no final digest to compare)")
+                    else:
+                        print("Replay finished: final state " +
+                              ("matches the recording" if game.digest() == replay.digest else "DIFFERS from the recording"))
+                    world.control['finished'] = 1
+                    next_tick = None
+                    continue
+            else:
+                controls = TickInput(held, shots, restart)
+                shots, restart = 0, False
+                if recorder:
+                    recorder.record(controls)
+            game.update(dt, controls)
+            tick += 1
+            world.publish(game, tick)
+            next_tick += dt
+            if time.perf_counter() - next_tick > max_catch_up_ticks * dt:
+                # Too far behind to catch up: drop the backlog rather than spiral
+                next_tick = time.perf_counter()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if recorder:
+            recorder.close(game.digest())
+        game.shutdown()
+        world.close()
+
+
+# The render side's handle on the simulation process: the shared world, a
+# WorldView of it and the input queue
+class SimulationProcess:
+    def __init__(self, seed, sim_rate, record_path=None, replay_path=None):
+        self.world = SharedWorld()
+        self.view = WorldView(self.world, seed)
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        context = multiprocessing.get_context('spawn')
+        self.inputs = context.Queue()
+        self.process = context.Process(target=run_simulation, daemon=True, args=(
+            self.world.memory.name, self.inputs, seed, sim_rate, record_path, replay_path))
+        self.process.start()
+        self.sent = None
+
+    # Start ticking (once the loading screen is done)
+    def start(self):
+        self.inputs.put(('start',))
+
+    # Forward a frame's TickInput; held keys only go out when they change
+    def send_input(self, controls):
+        message = (controls.held, controls.shots, controls.restart)
+        if message != self.sent or controls.shots or controls.restart:
+            self.inputs.put(('input',) + message)
+            self.sent = message
+
+    def finished(self):
+        return bool(self.world.control['finished']) or not self.process.is_alive()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.inputs.put(('stop',))
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.view.release()
+        self.world.close()
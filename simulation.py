@@ -0,0 +1,434 @@
+import hashlib
+from collections import defaultdict
+
+import numpy as np
+import pygame
+
+from collision import first_hits, sweep_mask, sweep_pairs
+from entities import EntityStore
+from particles import ParticlePool
+from profiler import profiler
+from replay import TickInput
+from scheduler import EventScheduler
+from terrain import GROUND_TOP, TerrainStreamer
+
+
+# Generate random terrain features. density (0-1) keeps that share of the hills and
+# of the trees; every feature is still drawn from rng, so a sparser chunk has a
+# subset of the features the full one would have, in the same places.
+def generate_terrain_features(z_offset, rng, density=1.0):
+    features = []
+    hills = rng.integers(3, 6)
+    for i in range(hills):
+        x = rng.uniform(-8, 8)
+        z = rng.uniform(-8, 8)
+        size = rng.uniform(0.5, 1.5)
+        if i < np.ceil(hills * density):
+            features.append({'type': 'hill', 'x': x, 'z': z, 'size': size})
+
+    trees = rng.integers(5, 11)
+    for i in range(trees):
+        x = rng.uniform(-8, 8)
+        z = rng.uniform(-8, 8)
+        if i < np.ceil(trees * density):
+            features.append({'type': 'tree', 'x': x, 'z': z})
+
+    return features
+
+
+# Where each pilot's ship starts; the first is the single-player ship
+SHIP_SPAWNS = [(0, 0, 0), (2, 0, 0)]
+SHIP_CLEARANCE = 0.3  # Lowest a ship flies above the ground
+ENEMY_CLEARANCE = 0.2  # Enemies lower than this above the ground crash into it
+NO_KILLS = np.empty((0, 3))
+
+
+# One pilot's ship. A ship whose pilot has left stays inactive until another
+# pilot takes it; the simulation leaves it out of every contact and chase.
+class Ship:
+    def __init__(self, spawn=(0, 0, 0), active=True):
+        self.spawn = spawn
+        self.active = active
+        self.pos = list(spawn)  # x, y, z (ships stay at z=0)
+        self.rotation = [0, 0, 0]  # pitch, yaw, roll
+        self.velocity = [0, 0, 0]  # For smooth movement
+        self.prev_pos = list(spawn)  # State at the previous tick, for interpolation
+        self.prev_rotation = [0, 0, 0]
+
+
+# Move a ship by one tick of `frames` original frames under its pilot's
+# TickInput. The co-op client runs the same code to predict its own ship.
+def fly(ship, controls, frames):
+    pos = ship.pos
+    rotation = ship.rotation
+    velocity = ship.velocity
+
+    # Keep this tick's starting state for interpolation
+    ship.prev_pos[:] = pos
+    ship.prev_rotation[:] = rotation
+
+    target_velocity = [0, 0, 0]
+    rotation_speed = 2.0 * frames
+    settle = 0.9 ** frames
+
+    if controls[pygame.K_LEFT]:
+        target_velocity[0] = -0.1
+        rotation[2] = min(rotation[2] + rotation_speed, 30)
+    elif controls[pygame.K_RIGHT]:
+        target_velocity[0] = 0.1
+        rotation[2] = max(rotation[2] - rotation_speed, -30)
+    else:
+        rotation[2] *= settle
+
+    if controls[pygame.K_UP]:
+        target_velocity[1] = 0.1
+        rotation[0] = max(rotation[0] - rotation_speed, -30)
+    elif controls[pygame.K_DOWN]:
+        target_velocity[1] = -0.1
+        rotation[0] = min(rotation[0] + rotation_speed, 30)
+    else:
+        rotation[0] *= settle
+
+    if controls[pygame.K_q]:
+        rotation[1] += rotation_speed
+    if controls[pygame.K_e]:
+        rotation[1] -= rotation_speed
+
+    for i in range(3):
+        velocity[i] = velocity[i] * settle + target_velocity[i] * (1 - settle)
+        pos[i] += velocity[i] * frames
+
+
+# Hold a ship at floor (the ground height under it plus SHIP_CLEARANCE) if it
+# has flown lower: it slides along the ground instead of sinking into it
+def land(ship, floor):
+    if ship.pos[1] < floor:
+        ship.pos[1] = floor
+        ship.velocity[1] = max(ship.velocity[1], 0)
+
+
+# The whole state of one game and the rules that advance it.
+#
+# Nothing here touches the window, GL or audio, so any number of games can run
+# side by side in one process (see envs.py). audio stays None unless the
+# windowed game installs its VoiceManager, which the game only posts sound
+# events to; they play on its own thread. Speeds and timers are in units of the original
+# 60 FPS frame and scaled by tick length.
+#
+# Co-op games fly more than one ship (add_ship()). The pilots share the health,
+# score and enemies, and each enemy chases the nearest ship. The player_*
+# attributes are the first ship's.
+class Game:
+    enemy_speed = 0.01
+    enemy_fire_period = 120  # Average frames between one enemy's shots (each gets its own rate within +-20%)
+    particles_per_explosion = 10
+    terrain_speed = 0.1
+    bullet_speed = 0.2
+    enemy_bullet_speed = 0.2
+
+    def __init__(self, seed=0):
+        # Player and enemy positions
+        self.ships = [Ship(SHIP_SPAWNS[0])]
+        self.player_health = 3  # Player starts with 3 health points
+        self.enemies = EntityStore({'pos': 3, 'prev_pos': 3, 'fire_period': 0}, track_ids=True)  # Enemy positions [x, y, z]
+        self.enemy_fire = EventScheduler()  # When each enemy (by id) fires next
+        self.bullets = EntityStore({'pos': 3, 'prev_pos': 3})  # Player bullets
+        self.enemy_bullets = EntityStore({'pos': 3, 'prev_pos': 3})  # Enemy bullets
+        self.explosions = ParticlePool(capacity=20000)  # Explosion particles
+        self.power_ups = EntityStore({'pos': 3, 'prev_pos': 3})  # Power-ups
+        self.score = 0  # Player score
+        self.kill_positions = NO_KILLS  # Where enemies were destroyed this tick
+        self.shots_fired = 0  # Shots and kills over the whole session (not reset with the game), for sound cues
+        self.kills = 0
+
+        # Game state
+        self.game_over = False
+        self.game_active = True
+        self.enemy_spawn_timer = 0
+        self.power_up_spawn_timer = 0
+
+        # Terrain segments, streamed from a worker thread that generates chunks ahead of the player
+        self.terrain = TerrainStreamer(generate_terrain_features)
+
+        self.audio = None
+        self.seed(seed)
+
+    @property
+    def player_pos(self):
+        return self.ships[0].pos
+
+    @property
+    def player_rotation(self):
+        return self.ships[0].rotation
+
+    @property
+    def player_velocity(self):
+        return self.ships[0].velocity
+
+    @property
+    def prev_player_pos(self):
+        return self.ships[0].prev_pos
+
+    @property
+    def prev_player_rotation(self):
+        return self.ships[0].prev_rotation
+
+    # Add another pilot's ship; returns its index
+    def add_ship(self):
+        self.ships.append(Ship(SHIP_SPAWNS[len(self.ships) % len(SHIP_SPAWNS)]))
+        return len(self.ships) - 1
+
+    # Give the ship at index a pilot, adding ships up to it; a ship left behind
+    # by an earlier pilot starts over at its spawn
+    def seat_ship(self, index):
+        while len(self.ships) <= index:
+            self.add_ship()
+        if not self.ships[index].active:
+            self.ships[index] = Ship(self.ships[index].spawn)
+
+    # Take a departed pilot's ship out of play. Ships keep their indices, so only
+    # inactive ships at the end of the list are dropped.
+    def remove_ship(self, index):
+        self.ships[index].active = False
+        while len(self.ships) > 1 and not self.ships[-1].active:
+            self.ships.pop()
+
+    # The ships in play; with no pilot left the first one stays, as before anyone joined
+    def active_ships(self):
+        return [ship for ship in self.ships if ship.active] or self.ships[:1]
+
+    # Seed the game's random number generators. Every random choice in the
+    # simulation comes from rng; terrain chunks derive their own generator from
+    # the seed and their position, so worker timing can't change them.
+    def seed(self, seed):
+        self.game_seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.terrain.seed = seed
+
+    # Start streaming terrain; call before the first update. A game nothing will
+    # draw passes render=False and gets no terrain chunks or worker thread.
+    def start(self, render=True):
+        self.terrain.start(chunks=render)
+
+    def shutdown(self):
+        self.terrain.shutdown()
+
+    # Digest of the whole simulation state, used to check a replay against its recording
+    def digest(self):
+        digest = hashlib.sha256()
+        digest.update(np.array(list(self.player_pos) + list(self.player_rotation) + list(self.player_velocity) + [
+            self.player_health, self.score, self.enemy_spawn_timer, self.power_up_spawn_timer, self.enemy_fire.now
+        ], dtype=np.float64).tobytes())
+        for store in (self.enemies, self.bullets, self.enemy_bullets, self.power_ups, self.explosions):
+            for name in store.fields:
+                digest.update(store[name].tobytes())
+        digest.update(self.enemies.ids.tobytes())
+        digest.update(np.array(self.enemy_fire.queue, dtype=np.float64).tobytes())
+        for ship in self.ships[1:]:
+            digest.update(np.array(ship.pos + ship.rotation + ship.velocity, dtype=np.float64).tobytes())
+        digest.update(np.array([segment['current_z'] for segment in self.terrain.segments], dtype=np.float64).tobytes())
+        return digest.digest()
+
+    # Add enemies at positions (N, 3). Each gets its own fire rate and a random first
+    # shot within one period, so volleys are spread over time instead of all at once.
+    def spawn_enemies(self, positions):
+        n = len(positions)
+        periods = self.enemy_fire_period * self.rng.uniform(0.8, 1.2, n)
+        first_shots = periods * self.rng.uniform(0, 1, n)
+        start = self.enemies.extend(n, pos=positions, prev_pos=positions, fire_period=periods)
+        for enemy_id, delay in zip(self.enemies.ids[start:start + n].tolist(), first_shots.tolist()):
+            self.enemy_fire.schedule(enemy_id, delay)
+
+    # Start a new game; the seed, spawn timers and terrain carry on from the last one
+    def reset(self):
+        self.ships = [Ship(ship.spawn, ship.active) for ship in self.ships]
+        self.player_health = 3  # Reset health
+        self.enemies.clear()
+        self.enemy_fire.clear()
+        self.bullets.clear()
+        self.enemy_bullets.clear()
+        self.explosions.clear()
+        self.power_ups.clear()
+        self.score = 0  # Reset score
+        self.game_over = False
+        self.game_active = True
+
+    # Which entities that moved from prev_positions to positions (N, 3) this tick
+    # touched any ship on the way, within half_extent on every axis. Swept along
+    # both paths, so nothing passes through a ship however long the tick.
+    def ship_contacts(self, prev_positions, positions, half_extent):
+        first, *others = self.active_ships()
+        hits = sweep_mask(prev_positions, positions, first.prev_pos, first.pos, half_extent)
+        for ship in others:
+            hits |= sweep_mask(prev_positions, positions, ship.prev_pos, ship.pos, half_extent)
+        return hits
+
+    # The x, y each enemy at positions (N, 3) steers toward: the nearest ship's
+    def chase_targets(self, positions):
+        ships = self.active_ships()
+        if len(ships) == 1:
+            return np.asarray(ships[0].pos[:2])
+        ships = np.array([ship.pos[:2] for ship in ships])
+        offsets = positions[:, None, :2] - ships[None]
+        return ships[np.argmin(np.einsum('nsk,nsk->ns', offsets, offsets), axis=1)]
+
+    # Advance the simulation by one fixed tick of dt seconds. controls is the
+    # tick's TickInput, or in co-op a list of them, one per ship.
+    def update(self, dt, controls):
+        pilots = controls if isinstance(controls, (list, tuple)) else (controls,)
+        if self.game_over and any(pilot.restart for pilot in pilots):
+            self.reset()
+        self.kill_positions = NO_KILLS
+        if not self.game_active:
+            return
+
+        frames = dt * 60  # Length of this tick in original 60 FPS frames
+
+        # Update terrain first, so the ground collisions below see this tick's ground
+        self.terrain.update(self.terrain_speed * frames)
+        profiler.lap('terrain')
+
+        # Ship movement (entity stores double-buffer pos/prev_pos instead: each moves
+        # by swapping the two and writing pos from prev_pos)
+        for ship, pilot in zip(self.ships, pilots):
+            fly(ship, pilot, frames)
+        profiler.lap('player')
+
+        # Fire the shots pressed since the last tick
+        for ship, pilot in zip(self.ships, pilots):
+            self.shots_fired += pilot.shots
+            for _ in range(pilot.shots):
+                self.bullets.add(pos=ship.pos, prev_pos=ship.pos)
+            if self.audio:
+                self.audio.post('shoot', pilot.shots)
+        profiler.lap('shots')
+
+        # Spawn enemies from the front (negative z-direction)
+        self.enemy_spawn_timer += frames
+        if self.enemy_spawn_timer > 60:  # Spawn every 60 frames (1 second)
+            x = self.rng.uniform(-5, 5)
+            y = self.rng.uniform(-2, 2)
+            self.spawn_enemies(np.array([(x, y, -30)]))  # Spawn at z=-30 (in front of player)
+            self.enemy_spawn_timer = 0
+
+        # Spawn power-ups occasionally
+        self.power_up_spawn_timer += frames
+        if self.power_up_spawn_timer > 300:  # Spawn every 300 frames (5 seconds)
+            x = self.rng.uniform(-5, 5)
+            y = self.rng.uniform(-2, 2)
+            self.power_ups.add(pos=(x, y, -30), prev_pos=(x, y, -30))  # Spawn at z=-30
+            self.power_up_spawn_timer = 0
+        profiler.lap('spawn')
+
+        # Update enemies (move toward player)
+        enemies = self.enemies
+        enemies.swap('pos', 'prev_pos')
+        enemy_pos, enemy_prev_pos = enemies['pos'], enemies['prev_pos']
+        np.add(enemy_prev_pos[:, 2], self.terrain_speed * frames, out=enemy_pos[:, 2])  # Move toward player (increase z toward z=0)
+        # Also apply some AI movement toward the player in x and y
+        enemy_pos[:, :2] = enemy_prev_pos[:, :2] + (self.chase_targets(enemy_prev_pos) - enemy_prev_pos[:, :2]) * (1 - (1 - self.enemy_speed) ** frames)
+        # Ground collisions: ships are held above the ground, enemies that fly
+        # into it crash (and score nothing). Only what is lower than the ground
+        # ever reaches needs the height under it, which usually is nothing.
+        for ship in self.ships:
+            if ship.pos[1] < GROUND_TOP + SHIP_CLEARANCE:
+                land(ship, float(self.terrain.height_at(ship.pos[0], ship.pos[2])) + SHIP_CLEARANCE)
+        crashed = enemy_pos[:, 1] < GROUND_TOP + ENEMY_CLEARANCE
+        if crashed.any():
+            low = np.flatnonzero(crashed)
+            crashed[low] = enemy_pos[low, 1] < self.terrain.height_at(enemy_pos[low, 0], enemy_pos[low, 2]) + ENEMY_CLEARANCE
+        if crashed.any():
+            self.kill_positions = enemy_pos[crashed]
+            self.explosions.spawn(self.kill_positions, self.particles_per_explosion, self.rng)
+        # Check collision with player
+        hits = self.ship_contacts(enemy_prev_pos, enemy_pos, 1.0) & ~crashed
+        self.player_health -= int(np.count_nonzero(hits))
+        enemies.remove(hits | crashed | (enemy_pos[:, 2] > 10))  # Also remove if too far behind
+        if self.player_health <= 0:
+            self.game_over = True
+            self.game_active = False
+        profiler.lap('enemies')
+
+        # Enemies shoot at the player, each on its own schedule; ids of destroyed enemies are dropped
+        due = self.enemy_fire.advance(frames)
+        if due:
+            rows = enemies.rows_of(due)
+            live = rows >= 0
+            rows = rows[live]
+            shooters = enemies['pos'][rows]
+            self.enemy_bullets.extend(len(rows), pos=shooters, prev_pos=shooters)
+            for enemy_id, period in zip(np.asarray(due)[live].tolist(), enemies['fire_period'][rows].tolist()):
+                self.enemy_fire.schedule(enemy_id, period)
+        profiler.lap('enemy_fire')
+
+        # Update enemy bullets
+        enemy_bullets = self.enemy_bullets
+        enemy_bullets.swap('pos', 'prev_pos')  # Previous position is kept for drawing
+        bullet_pos = enemy_bullets['pos']
+        np.add(enemy_bullets['prev_pos'], (0, 0, self.enemy_bullet_speed * frames), out=bullet_pos)  # Move toward player (increase z toward z=0)
+        # Check collision with player
+        hits = self.ship_contacts(enemy_bullets['prev_pos'], bullet_pos, 0.5)
+        self.player_health -= int(np.count_nonzero(hits))
+        enemy_bullets.remove(hits | (bullet_pos[:, 2] > 20))
+        if self.player_health <= 0:
+            self.game_over = True
+            self.game_active = False
+        profiler.lap('enemy_bullets')
+
+        # Update power-ups
+        power_ups = self.power_ups
+        power_ups.swap('pos', 'prev_pos')  # Previous position is kept for drawing
+        power_up_pos = power_ups['pos']
+        np.add(power_ups['prev_pos'], (0, 0, self.terrain_speed * frames), out=power_up_pos)  # Move toward player (increase z toward z=0)
+        # Check collision with player
+        hits = self.ship_contacts(power_ups['prev_pos'], power_up_pos, 0.5)
+        self.player_health = min(self.player_health + int(np.count_nonzero(hits)), 5)  # Increase health, max 5
+        power_ups.remove(hits | (power_up_pos[:, 2] > 10))  # Also remove if too far behind
+        profiler.lap('power_ups')
+
+        # Update bullets
+        bullets = self.bullets
+        bullets.swap('pos', 'prev_pos')
+        bullet_pos = bullets['pos']
+        np.add(bullets['prev_pos'], (0, 0, -self.bullet_speed * frames), out=bullet_pos)  # Move forward (decrease z)
+        spent = bullet_pos[:, 2] < -20  # Out of range bullets skip the collision checks
+        # Check collision with enemies along both paths; each bullet destroys the
+        # lowest-numbered enemy it met this tick
+        enemy_pos = enemies['pos']
+        live = np.flatnonzero(~spent)
+        hit_bullets, hit_enemies = first_hits(*sweep_pairs(bullets['prev_pos'][live], bullet_pos[live],
+                                                            enemies['prev_pos'], enemy_pos, 1.0))
+        kills = len(hit_enemies)
+        if kills:
+            self.kill_positions = np.concatenate([self.kill_positions, enemy_pos[hit_enemies]])
+            # Create explosions
+            self.explosions.spawn(enemy_pos[hit_enemies], self.particles_per_explosion, self.rng)
+            if self.audio:
+                self.audio.post('explosion', kills)
+            spent[live[hit_bullets]] = True
+            self.score += 100 * kills  # Increase score by 100 points for each destroyed enemy
+            self.kills += kills
+        enemies.remove(hit_enemies)
+        bullets.remove(spent)
+        profiler.lap('bullets')
+
+        # Update explosions
+        self.explosions.update(frames)
+        profiler.lap('explosions')
+
+
+# Headless stand-in for a pilot: line up with the nearest enemy ahead, keep firing
+# and restart straight away after a game over
+def autopilot(game, tick):
+    held = {}
+    if len(game.enemies):
+        ahead = game.enemies['pos'][np.argmax(game.enemies['pos'][:, 2])]
+        if ahead[0] < game.player_pos[0] - 0.2:
+            held[pygame.K_LEFT] = True
+        elif ahead[0] > game.player_pos[0] + 0.2:
+            held[pygame.K_RIGHT] = True
+        if ahead[1] < game.player_pos[1] - 0.2:
+            held[pygame.K_DOWN] = True
+        elif ahead[1] > game.player_pos[1] + 0.2:
+            held[pygame.K_UP] = True
+    return TickInput.from_pressed(defaultdict(bool, held), shots=1 if tick % 10 == 0 else 0, restart=game.game_over)
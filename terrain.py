@@ -0,0 +1,305 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from OpenGL.GL import GL_TRIANGLE_STRIP
+
+from meshes import Mesh, get_mesh
+
+SEGMENT_LENGTH = 20
+GROUND_HALF_WIDTH = 10
+GROUND_Y = -3  # Mean ground height
+GROUND_STEP = 0.5  # Spacing of the heightmap grid, across and along the track
+GROUND_COLUMNS = int(2 * GROUND_HALF_WIDTH / GROUND_STEP) + 1
+GROUND_XS = np.linspace(-GROUND_HALF_WIDTH, GROUND_HALF_WIDTH, GROUND_COLUMNS)
+GROUND_OCTAVES = ((8.0, 0.6), (4.0, 0.3), (2.0, 0.15))  # Wavelength and amplitude of each noise octave
+GROUND_RELIEF = sum(amplitude for _, amplitude in GROUND_OCTAVES)  # Heights stay within GROUND_Y +- this
+GROUND_TOP = GROUND_Y + GROUND_RELIEF  # Nothing above this can touch the ground
+GROUND_COLORS = ((0, 0.3, 0), (0.3, 0.55, 0.1))  # Lowest and highest ground
+FOOTPRINTS = {'hill': 1.0, 'tree': 0.2}  # Half-width of each feature's base (hills scale by size)
+
+
+# Hash integer lattice points (ix, iz) to values in [-1, 1), differently for each
+# seed. The multiplications wrap around on purpose.
+def lattice_noise(seed, ix, iz):
+    with np.errstate(over='ignore'):
+        h = (ix.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) ^ (iz.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F))
+        h ^= np.uint64(seed & 0xFFFFFFFFFFFFFFFF)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(31)
+    return (h >> np.uint64(11)).astype(np.float64) * (2.0 / (1 << 53)) - 1.0
+
+
+# Ground height at x across the track and t along it: fractal value noise, summed
+# over GROUND_OCTAVES. A pure function of the seed and position, so chunks built
+# separately meet exactly and the simulation can ask without any mesh existing.
+# t is the terrain's own coordinate: a chunk for base_z covers t = base_z +- SEGMENT_LENGTH / 2.
+def ground_height(seed, x, t):
+    x, t = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(t, dtype=np.float64))
+    height = np.full(x.shape, float(GROUND_Y))
+    for octave, (wavelength, amplitude) in enumerate(GROUND_OCTAVES):
+        fx, ft = x / wavelength, t / wavelength
+        ix, it = np.floor(fx), np.floor(ft)
+        u, v = fx - ix, ft - it
+        u, v = u * u * (3 - 2 * u), v * v * (3 - 2 * v)  # Smoothstep, so octaves have no creases
+        ix, it = ix.astype(np.int64), it.astype(np.int64)
+        key = seed + octave
+        n00 = lattice_noise(key, ix, it)
+        n10 = lattice_noise(key, ix + 1, it)
+        n01 = lattice_noise(key, ix, it + 1)
+        n11 = lattice_noise(key, ix + 1, it + 1)
+        height += amplitude * (n00 + (n10 - n00) * u + (n01 - n00 + (n00 - n10 - n01 + n11) * u) * v)
+    return height
+
+
+# Height on the triangulated surface the ground meshes draw, from the heights at
+# the corners of the grid cell and the position (u across, v along, 0-1) in it.
+# Each cell is split along its (u=1, v=0)-(u=0, v=1) diagonal, as the strips are;
+# past the diagonal the far triangle's plane differs from the near one's by
+# (h00 - h10 - h01 + h11) * (u + v - 1), which saves choosing between the two.
+def interpolate_cell(h00, h10, h01, h11, u, v):
+    return h00 + (h10 - h00) * u + (h01 - h00) * v + (h00 - h10 - h01 + h11) * np.maximum(u + v - 1, 0)
+
+
+# Grid column, row and position within the cell for points x, t (clamped to the ground's width)
+def locate_cell(x, t):
+    gx = np.minimum(np.maximum(x, -GROUND_HALF_WIDTH), GROUND_HALF_WIDTH) * (1 / GROUND_STEP) + GROUND_HALF_WIDTH / GROUND_STEP
+    gt = np.asarray(t, dtype=np.float64) * (1 / GROUND_STEP)
+    column = np.minimum(np.floor(gx), GROUND_COLUMNS - 2).astype(np.int64)
+    row = np.floor(gt).astype(np.int64)
+    return column, row, gx - column, gt - row
+
+
+# Surface height straight from the noise (building a heightmap just for a few points isn't worth it)
+def surface_height(seed, x, t):
+    column, row, u, v = locate_cell(x, t)
+    x0, t0 = GROUND_XS[column], row * GROUND_STEP
+    x1, t1 = GROUND_XS[column + 1], (row + 1) * GROUND_STEP
+    return interpolate_cell(ground_height(seed, x0, t0), ground_height(seed, x1, t0),
+                            ground_height(seed, x0, t1), ground_height(seed, x1, t1), u, v)
+
+
+# Indices that draw a grid of rows x columns vertices (row-major) as one triangle
+# strip: a strip per pair of rows, joined by repeating the last vertex of one and
+# the first of the next. Every pair adds an even count, so winding stays the same.
+def grid_strip_indices(rows, columns):
+    top = np.arange(rows - 1)[:, None] * columns + np.arange(columns)
+    indices = np.empty((rows - 1, 2 * columns + 2), dtype=np.uint32)
+    indices[:, 0:2 * columns:2] = top
+    indices[:, 1:2 * columns:2] = top + columns
+    indices[:, -2] = top[:, -1] + columns
+    indices[:, -1] = top[:, 0] + columns  # The next pair's first vertex
+    return indices.ravel()[:-2]
+
+
+GROUND_ROWS = int(round(SEGMENT_LENGTH / GROUND_STEP)) + 1  # Per chunk
+GROUND_STRIP = grid_strip_indices(GROUND_ROWS, GROUND_COLUMNS)  # The same for every chunk
+
+
+# Build one chunk's ground: the heightmap over the chunk as an indexed triangle
+# strip, shaded by height. Runs on the worker thread, so it must not touch GL;
+# the buffers are uploaded by the render loop the first time the chunk is drawn.
+def build_ground_mesh(seed, base_z):
+    t = base_z - SEGMENT_LENGTH / 2 + np.arange(GROUND_ROWS) * GROUND_STEP
+    heights = ground_height(seed, GROUND_XS[None, :], t[:, None])
+    vertices = np.empty((GROUND_ROWS, GROUND_COLUMNS, 3), dtype=np.float32)
+    vertices[..., 0] = GROUND_XS
+    vertices[..., 1] = heights
+    vertices[..., 2] = (t - base_z)[:, None]
+    low, high = np.asarray(GROUND_COLORS, dtype=np.float32)
+    shade = np.clip((heights - GROUND_Y + GROUND_RELIEF) / (2 * GROUND_RELIEF), 0, 1)[..., None]
+    colors = low + (high - low) * shade
+    return Mesh(vertices.reshape(-1, 3), colors.reshape(-1, 3), GROUND_STRIP, GL_TRIANGLE_STRIP)
+
+
+# Ground height each feature stands at: the lowest point of the surface under
+# its base, so slopes bury a little of it rather than leave it floating
+def feature_heights(seed, base_z, features):
+    if not features:
+        return []
+    x = np.array([feature['x'] for feature in features])
+    z = np.array([feature['z'] for feature in features])
+    reach = np.array([FOOTPRINTS[feature['type']] * feature.get('size', 1.0) for feature in features])
+    corners = np.array([(0, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)])
+    heights = surface_height(seed, x[:, None] + reach[:, None] * corners[:, 0],
+                             base_z + z[:, None] + reach[:, None] * corners[:, 1])
+    return heights.min(axis=1).tolist()
+
+
+# Build one chunk's features (every hill and tree baked in place at its ground
+# height) as a single mesh, or None if the chunk has none. Also worker-side.
+def build_feature_mesh(features, heights, templates):
+    if not features:
+        return None
+    vertices = []
+    colors = []
+    for feature, height in zip(features, heights):
+        template = templates[feature['type']]
+        scale = feature.get('size', 1.0) if feature['type'] == 'hill' else 1.0
+        vertices.append(template.vertices * scale + np.array([feature['x'], height, feature['z']], dtype=np.float32))
+        colors.append(template.colors)
+    return Mesh(np.concatenate(vertices), np.concatenate(colors))
+
+
+# The surface heights over a window of heightmap rows, for height queries. The
+# window is rebuilt around the rows asked for once they leave it, which with
+# the terrain scrolling steadily is every few hundred ticks.
+class Heightmap:
+    def __init__(self, seed=0, rows=160):
+        self.seed = seed
+        self.rows = rows
+        self.first_row = None
+        self.heights = None  # (rows, GROUND_COLUMNS), flattened
+
+    # Make sure rows first..last are in the window. Play moves toward lower t,
+    # so a new window keeps only a few rows above the ones needed.
+    def cover(self, first, last):
+        if self.first_row is not None and first >= self.first_row and last < self.first_row + self.rows:
+            return
+        self.rows = max(self.rows, last - first + 1)
+        self.first_row = min(first, last + 4 - self.rows)
+        t = (self.first_row + np.arange(self.rows)) * GROUND_STEP
+        self.heights = ground_height(self.seed, GROUND_XS[None, :], t[:, None]).ravel()
+
+    # Surface heights at x, t (arrays of the same shape, or numbers), as the meshes draw it
+    def height_at(self, x, t):
+        column, row, u, v = locate_cell(x, t)
+        if row.size == 0:
+            return np.zeros(row.shape)
+        self.cover(int(row.min()), int(row.max()) + 1)
+        cell = (row - self.first_row) * GROUND_COLUMNS + column
+        heights = self.heights
+        return interpolate_cell(heights[cell], heights[cell + 1],
+                                heights[cell + GROUND_COLUMNS], heights[cell + GROUND_COLUMNS + 1], u, v)
+
+
+# One generated stretch of ground, keyed by the base_z it was generated for.
+# ground is the heightmap strip; mesh holds the features (None if there are
+# none) and lod_mesh the same features built from the cheaper far-away
+# templates. bounds is the (lo, hi) box around it all in chunk-local coordinates.
+class TerrainChunk:
+    def __init__(self, base_z, features, ground, mesh=None, lod_mesh=None):
+        self.base_z = base_z
+        self.features = features
+        self.ground = ground
+        self.mesh = mesh
+        self.lod_mesh = lod_mesh or mesh
+        vertices = np.concatenate([m.vertices for m in (ground, mesh) if m is not None])
+        self.bounds = (vertices.min(axis=0), vertices.max(axis=0))
+
+    def release(self):
+        for mesh in (self.ground, self.mesh, self.lod_mesh):
+            if mesh is not None:
+                mesh.release()
+
+
+# Streams terrain through a fixed ring of segments.
+#
+# Each segment scrolls toward the player and wraps back by the ring length
+# once it passes behind. Chunks are generated ahead of time on a worker
+# thread: as soon as a segment takes a chunk, the chunk it will need after its
+# next wrap is queued. A chunk is evicted (and its VBO freed) when its segment
+# wraps, so memory stays bounded at two chunks per segment however long the
+# session runs. A streamer started with chunks=False builds no chunks at all
+# and only scrolls the segments, for games nothing draws: height_at() doesn't
+# need them.
+class TerrainStreamer:
+    def __init__(self, generate_features, segments=3, segment_length=SEGMENT_LENGTH):
+        self.generate_features = generate_features
+        self.segment_length = segment_length
+        self.ring_length = segments * segment_length
+        self.segments = [{'base_z': -i * segment_length, 'current_z': -i * segment_length} for i in range(segments)]
+        self.seed = 0
+        self.feature_density = 1.0  # Passed to generate_features for chunks built from now on
+        self.templates = None
+        self.lod_templates = None
+        self.executor = None
+        self.chunks = {}  # base_z -> Future of a TerrainChunk
+        self.heightmap = Heightmap()
+        self.stats = {'generated': 0, 'evicted': 0, 'waits': 0}
+
+    def start(self, chunks=True):
+        if not chunks:
+            return
+        self.templates = {'hill': get_mesh('hill'), 'tree': get_mesh('tree')}
+        self.lod_templates = {'hill': get_mesh('hill'), 'tree': get_mesh('tree_lod')}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='terrain')
+        for segment in self.segments:
+            self.request(segment['base_z'])
+            self.request(segment['base_z'] - self.ring_length)
+
+    # Each chunk gets its own generator derived from the seed and its position,
+    # so a chunk's contents don't depend on when the worker gets to it
+    def build(self, base_z):
+        features = self.generate_features(base_z, np.random.default_rng([self.seed, -base_z]), self.feature_density)
+        heights = feature_heights(self.seed, base_z, features)
+        self.stats['generated'] += 1
+        return TerrainChunk(base_z, features, build_ground_mesh(self.seed, base_z),
+                            build_feature_mesh(features, heights, self.templates),
+                            build_feature_mesh(features, heights, self.lod_templates))
+
+    # Ground height under points x, z (arrays or numbers) in world space, where the
+    # terrain is now. Depends only on the seed and the scroll, never on chunks
+    # or feature density, so the simulation can collide with it deterministically.
+    def height_at(self, x, z):
+        if self.heightmap.seed != self.seed:
+            self.heightmap = Heightmap(self.seed)
+        segment = self.segments[0]
+        return self.heightmap.height_at(x, z - (segment['current_z'] - segment['base_z']))
+
+    # Whether the chunks every segment is showing now have been generated
+    def ready(self):
+        return all(self.chunks[segment['base_z']].done() for segment in self.segments)
+
+    def request(self, base_z):
+        if self.executor is not None and base_z not in self.chunks:
+            self.chunks[base_z] = self.executor.submit(self.build, base_z)
+
+    # The chunk for base_z, waiting for the worker only if it fell behind
+    def chunk(self, base_z):
+        future = self.chunks[base_z]
+        if not future.done():
+            self.stats['waits'] += 1
+        return future.result()
+
+    def evict(self, base_z):
+        future = self.chunks.pop(base_z, None)
+        if future is not None:
+            future.result().release()
+            self.stats['evicted'] += 1
+
+    def update(self, speed):
+        for segment in self.segments:
+            segment['current_z'] += speed
+            if segment['current_z'] > self.segment_length:
+                self.evict(segment['base_z'])
+                segment['current_z'] -= self.ring_length
+                segment['base_z'] -= self.ring_length
+                self.request(segment['base_z'])
+                self.request(segment['base_z'] - self.ring_length)
+
+    # Mirror the segments of a streamer running somewhere else (another process),
+    # given as (base_z, current_z) pairs: chunks are requested and evicted just as
+    # update() would when it wraps a segment
+    def follow(self, segments):
+        for segment, (base_z, current_z) in zip(self.segments, segments):
+            base_z = int(base_z)
+            if base_z != segment['base_z']:
+                self.evict(segment['base_z'])
+                segment['base_z'] = base_z
+                self.request(base_z)
+                self.request(base_z - self.ring_length)
+            segment['current_z'] = current_z
+
+    # Draw every segment; offset shifts them along z (e.g. to interpolate between ticks)
+    def draw(self, draw_chunk, offset=0.0):
+        for segment in self.segments:
+            draw_chunk(self.chunk(segment['base_z']), segment['current_z'] + offset)
+
+    # Drop every chunk and stop the worker (call before the GL context goes away)
+    def shutdown(self):
+        for base_z in list(self.chunks):
+            self.evict(base_z)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -0,0 +1,180 @@
+import ctypes
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+from OpenGL.GL import *
+
+from profiler import count_draw
+import shader_renderer
+
+# Characters baked into the atlas; anything else is drawn as '?'
+ATLAS_CHARACTERS = ''.join(chr(code) for code in range(32, 127))
+ATLAS_WIDTH = 1024
+GLYPH_PADDING = 1
+# Bytes per vertex in a cached string: texture u, v then screen x, y
+TEXT_VERTEX_STRIDE = 4 * 4
+
+
+# Every printable ASCII glyph of one font, rasterized once into a single texture.
+# Glyphs are rendered in white and tinted with glColor when drawn.
+class GlyphAtlas:
+    def __init__(self, font_name=None, size=74):
+        pygame.font.init()
+        font = pygame.font.Font(font_name, size)
+        glyphs = {char: font.render(char, True, (255, 255, 255)) for char in ATLAS_CHARACTERS}
+        self.line_height = font.get_linesize()
+
+        # Pack glyphs left to right in rows
+        placements = {}
+        x = y = row_height = 0
+        for char, surface in glyphs.items():
+            width, height = surface.get_size()
+            if x + width + GLYPH_PADDING > ATLAS_WIDTH:
+                x = 0
+                y += row_height + GLYPH_PADDING
+                row_height = 0
+            placements[char] = (x, y, width, height)
+            x += width + GLYPH_PADDING
+            row_height = max(row_height, height)
+        atlas_height = 1
+        while atlas_height < y + row_height:
+            atlas_height *= 2
+
+        surface = pygame.Surface((ATLAS_WIDTH, atlas_height), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 0))
+        for char, (x, y, width, height) in placements.items():
+            surface.blit(glyphs[char], (x, y))
+        self.pixels = pygame.image.tostring(surface, "RGBA", False)
+        self.size = (ATLAS_WIDTH, atlas_height)
+
+        # Per glyph: advance/width, height and texture coordinates (u0, v_top, u1, v_bottom)
+        self.glyphs = {}
+        for char, (x, y, width, height) in placements.items():
+            self.glyphs[char] = (width, height, x / ATLAS_WIDTH, y / atlas_height,
+                                 (x + width) / ATLAS_WIDTH, (y + height) / atlas_height)
+        self.texture = None
+
+    def upload(self):
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.size[0], self.size[1], 0, GL_RGBA, GL_UNSIGNED_BYTE, self.pixels)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def release(self):
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+            self.texture = None
+
+    # Textured quads for a string, with its bottom-left corner at the origin
+    def layout(self, text):
+        quads = []
+        pen_x = 0
+        for char in text:
+            width, height, u0, v_top, u1, v_bottom = self.glyphs.get(char, self.glyphs['?'])
+            x0, x1 = pen_x, pen_x + width
+            quads.append([
+                (u0, v_bottom, x0, 0), (u1, v_bottom, x1, 0), (u1, v_top, x1, height),
+                (u0, v_bottom, x0, 0), (u1, v_top, x1, height), (u0, v_top, x0, height)
+            ])
+            pen_x += width
+        return np.array(quads, dtype=np.float32).reshape(-1, 4)
+
+
+# A laid-out string kept in its own VBO until it is evicted from the cache
+class CachedString:
+    def __init__(self, vertices):
+        self.count = len(vertices)
+        self.vao = None  # Set by the shader renderer
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self):
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(1, [self.vbo])
+
+
+# Draws strings in screen space as textured quads. The font is loaded once and
+# each distinct string is laid out once, so text that doesn't change (like the
+# HUD between hits and kills) costs a single draw call per frame.
+class TextRenderer:
+    def __init__(self, font_name=None, size=74, max_cached_strings=64):
+        self.font_name = font_name
+        self.font_size = size
+        self.max_cached_strings = max_cached_strings
+        self.atlas = None
+        self.strings = OrderedDict()
+
+    def get_string(self, text):
+        cached = self.strings.get(text)
+        if cached is not None:
+            self.strings.move_to_end(text)
+            return cached
+        if self.atlas is None:
+            self.atlas = GlyphAtlas(self.font_name, self.font_size)
+            self.atlas.upload()
+        cached = CachedString(self.atlas.layout(text))
+        self.strings[text] = cached
+        if len(self.strings) > self.max_cached_strings:
+            _, evicted = self.strings.popitem(last=False)
+            evicted.release()
+        return cached
+
+    def draw(self, text, x, y, color, viewport):
+        if not text:
+            return
+        cached = self.get_string(text)
+        if shader_renderer.active:
+            shader_renderer.active.draw_text(self.atlas.texture, cached, x, y, color, viewport)
+            return
+
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, viewport[0], 0, viewport[1], -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glTranslatef(x, y, 0)
+
+        glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT | GL_TEXTURE_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_TEXTURE_2D)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        glBindTexture(GL_TEXTURE_2D, self.atlas.texture)
+        glColor3ub(*color)
+
+        glBindBuffer(GL_ARRAY_BUFFER, cached.vbo)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glTexCoordPointer(2, GL_FLOAT, TEXT_VERTEX_STRIDE, ctypes.c_void_p(0))
+        glVertexPointer(2, GL_FLOAT, TEXT_VERTEX_STRIDE, ctypes.c_void_p(8))
+        glDrawArrays(GL_TRIANGLES, 0, cached.count)
+        count_draw(cached.count)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glPopAttrib()
+
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+
+    # Free the atlas texture and every cached string (call before the GL context goes away)
+    def release(self):
+        for cached in self.strings.values():
+            cached.release()
+        self.strings.clear()
+        if self.atlas is not None:
+            self.atlas.release()
+            self.atlas = None